@@ -0,0 +1,279 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+AsyncCvp.py provides non-blocking counterparts of the CvpService and Cvp
+classes. Requests are dispatched to a pool of worker threads sharing one
+pooled CvpService session, and every call returns immediately with a result
+handle ( multiprocessing.pool.AsyncResult ) whose get() method waits for the
+response and re-raises any CvpError.
+
+It contains 2 classes
+   AsyncCvpService -- Issues CvpService requests concurrently
+   AsyncCvp -- Concurrent fan-out versions of the Cvp read methods
+'''
+import threading
+from multiprocessing.pool import ThreadPool
+import cvp
+import cvpServices
+import errorCodes
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_CONCURRENCY = 8
+
+# CvpService endpoint methods exposed by AsyncCvpService
+ENDPOINTS = [ 'authenticate', 'getConfigletsInfo', 'deviceComplianceCheck',
+      'imageBundleAppliedContainers', 'changeContainerName', 'searchContainer',
+      'imageBundleAppliedDevices', 'addImage', 'downloadImage',
+      'firstLoginDefaultPasswordReset', 'getInventory',
+      'configAppliedContainers', 'configAppliedDevices', 'retrieveInventory',
+      'getImagesInfo', 'addConfiglet', 'getConfigletByName',
+      'updateConfiglet', 'deleteConfiglet', 'saveImageBundle',
+      'getImageBundleByName', 'updateImageBundle', 'addToInventory',
+      'saveInventory', 'retryAddToInventory', '_saveTopology', 'executeTask',
+      'getTasks', 'getTaskById', 'getImageBundles', 'deleteImageBundle',
+      'deleteDuplicateDevice', 'deleteContainer', 'deleteDevice',
+      'applyConfigToDevice', 'applyConfigToContainer',
+      'removeConfigFromContainer', 'addContainer', 'applyImageBundleToDevice',
+      'applyImageBundleToContainer' ]
+
+def _asyncEndpoint( name ):
+   '''Builds the AsyncCvpService method which schedules the CvpService method
+   name on the worker pool'''
+   def endpoint( self, *args, **kwargs ):
+      return self.submit( getattr( self.cvpService, name ), *args, **kwargs )
+   endpoint.__name__ = name
+   endpoint.__doc__ = getattr( cvpServices.CvpService, name ).__doc__
+   return endpoint
+
+class AsyncCvpService( object ):
+   '''AsyncCvpService class issues the CvpService requests from a pool of
+   worker threads. It has the same endpoint methods as CvpService, taking the
+   same arguments, but each of them returns a result handle instead of the
+   response.
+
+   Public methods:
+      submit( func, *args, **kwargs )
+      close()
+      All the endpoint methods of CvpService
+
+   Instance variables:
+      cvpService -- CvpService instance shared by the workers
+      pool -- pool of worker threads issuing the requests
+   '''
+
+   def __init__( self, hostname, ssl=False, port=80,
+         maxWorkers=DEFAULT_MAX_WORKERS ):
+      '''Constructer for the AsyncCvpService class
+
+      Arguments:
+         hostname -- name of the host ( type : String )
+         ssl -- secured socket layer ( type : boolean )
+         port -- port number ( type : int )
+         maxWorkers -- number of requests in flight at once ( type : int )
+      '''
+      self.cvpService = cvpServices.CvpService( hostname, ssl, port,
+            poolSize=maxWorkers )
+      self.pool = ThreadPool( maxWorkers )
+
+   def submit( self, func, *args, **kwargs ):
+      '''Schedules func on the worker pool
+
+      Arguments:
+         func -- callable to be executed
+         *args, **kwargs -- arguments passed to func
+
+      Returns:
+         result -- handle on the result of func ( type : AsyncResult )
+      '''
+      return self.pool.apply_async( func, args, kwargs )
+
+   def close( self ):
+      '''Waits for the scheduled requests and releases the workers and the
+      pooled connections'''
+      self.pool.close()
+      self.pool.join()
+      self.cvpService.close()
+
+for _name in ENDPOINTS:
+   setattr( AsyncCvpService, _name, _asyncEndpoint( _name ) )
+
+class AsyncCvp( object ):
+   '''AsyncCvp class is the concurrent counterpart of the Cvp read methods.
+   The per-configlet and per-bundle sub-requests behind them are issued in
+   parallel, at most concurrency of them being in flight at once.
+
+   Public methods:
+      authenticate( username, password )
+      getDevices()
+      getConfiglets()
+      getImageBundles()
+      close()
+
+   State variables:
+      service -- AsyncCvpService instance
+      semaphore -- bounds the number of sub-requests in flight
+      coordinator -- pool running the fan-out methods themselves
+   '''
+
+   def __init__( self, host, ssl=False, port=80,
+         maxWorkers=DEFAULT_MAX_WORKERS, concurrency=DEFAULT_CONCURRENCY ):
+      '''Constructer for AsyncCvp class.'''
+      self.service = AsyncCvpService( host, ssl, port, maxWorkers )
+      self.semaphore = threading.BoundedSemaphore( concurrency )
+      self.coordinator = ThreadPool( 2 )
+
+   def authenticate( self, username, password ):
+      '''Authenticate the user login credentials
+
+      Arguments:
+         username -- username for login ( type : string )
+         password -- login pasword (type : String )
+
+      Returns:
+         result -- handle on the authentication ( type : AsyncResult )
+      '''
+      return self.service.authenticate( username, password )
+
+   def close( self ):
+      '''Releases the worker threads and the pooled connections'''
+      self.coordinator.close()
+      self.coordinator.join()
+      self.service.close()
+
+   def _bounded( self, func, *args ):
+      '''Schedules func on the service workers once a semaphore slot is free.
+      The slot is given back when func completes.'''
+      def run():
+         try:
+            return func( *args )
+         finally:
+            self.semaphore.release()
+      self.semaphore.acquire()
+      try:
+         return self.service.submit( run )
+      except:
+         self.semaphore.release()
+         raise
+
+   def _fanOut( self, func, argList ):
+      '''Calls func once per element of argList under the semaphore and
+      returns the results in the order of argList'''
+      results = [ self._bounded( func, arg ) for arg in argList ]
+      return [ result.get() for result in results ]
+
+   def getDevices( self ):
+      '''Collect information of all the devices, see Cvp.getDevices
+
+      Arguments None
+
+      Returns:
+         result -- handle on the list of devices
+            ( type : AsyncResult of List of Device ( class ) )
+      '''
+      return self.coordinator.apply_async( self._getDevices )
+
+   def _getDevices( self ):
+      '''Body of getDevices, executed by the coordinator'''
+      cvpService = self.service.cvpService
+      bundles = self.service.getImageBundles()
+      configlets = self.service.getConfigletsInfo()
+      inventory = self.service.getInventory()
+      hierarchy = self.service.retrieveInventory()
+      imageBundleNameList = [ bundle[ 'name' ] for bundle in bundles.get() ]
+      configNameList = [ config[ 'name' ] for config in configlets.get() ]
+      bundleDevices = self._fanOut( cvpService.imageBundleAppliedDevices,
+            imageBundleNameList )
+      configDevices = self._fanOut( cvpService.configAppliedDevices,
+            configNameList )
+      devices, containers = inventory.get()
+
+      imageMap = {}
+      for imageBundleName, deviceList in zip( imageBundleNameList,
+            bundleDevices ):
+         for device in deviceList:
+            imageMap[ device[ 'ipAddress' ] ] = imageBundleName
+      configMap = {}
+      for configName, deviceList in zip( configNameList, configDevices ):
+         for device in deviceList:
+            configMap.setdefault( device[ 'ipAddress' ], [] ).append(
+                  configName )
+
+      containerIndex = cvp.ContainerIndex( hierarchy.get()[ 0 ] )
+
+      deviceInfoList = []
+      for dut in devices:
+         parentContainerName = containers.get( dut[ 'key' ] )
+         if not parentContainerName:
+            raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
+         deviceInfoList.append( cvp.Device( dut[ 'ipAddress' ], dut[ 'fqdn' ],
+            dut[ 'key' ], parentContainerName,
+            containerIndex.key( parentContainerName ),
+            imageMap.get( dut[ 'ipAddress' ], '' ),
+            configMap.get( dut[ 'ipAddress' ], '' ) ) )
+      return deviceInfoList
+
+   def getConfiglets( self ):
+      '''Retrieve the full set of Configlets, see Cvp.getConfiglets
+
+      Argument None
+
+      Returns:
+         result -- handle on the configlets
+            ( type : AsyncResult of List of Configlet ( class ) )
+      '''
+      return self.coordinator.apply_async( self._getConfiglets )
+
+   def _getConfiglets( self ):
+      '''Body of getConfiglets, executed by the coordinator'''
+      cvpService = self.service.cvpService
+      configlets = self.service.getConfigletsInfo().get()
+      configNameList = [ config[ 'name' ] for config in configlets ]
+      containerResults = [ self._bounded( cvpService.configAppliedContainers,
+            configName ) for configName in configNameList ]
+      deviceResults = [ self._bounded( cvpService.configAppliedDevices,
+            configName ) for configName in configNameList ]
+      configletList = []
+      for config, containers, devices in zip( configlets, containerResults,
+            deviceResults ):
+         containerList = [ container[ 'containerName' ]
+               for container in containers.get() ]
+         deviceList = [ device[ 'ipAddress' ] for device in devices.get() ]
+         configletList.append( cvp.Configlet( config[ 'name' ],
+            config[ 'config' ], config[ 'key' ], containerList, deviceList ) )
+      return configletList
+
+   def getImageBundles( self ):
+      '''Retrieves information on all the image bundles, see
+      Cvp.getImageBundles
+
+      Arguments: None
+
+      Returns:
+         result -- handle on the image bundles
+            ( type : AsyncResult of List of ImageBundle ( class ) )
+      '''
+      return self.coordinator.apply_async( self._getImageBundles )
+
+   def _getImageBundles( self ):
+      '''Body of getImageBundles, executed by the coordinator'''
+      cvpService = self.service.cvpService
+      imageBundles = self.service.getImageBundles().get()
+      bundleNameList = [ bundle[ 'name' ] for bundle in imageBundles ]
+      containerResults = [ self._bounded(
+            cvpService.imageBundleAppliedContainers, bundleName )
+            for bundleName in bundleNameList ]
+      deviceResults = [ self._bounded( cvpService.imageBundleAppliedDevices,
+            bundleName ) for bundleName in bundleNameList ]
+      imageBundleList = []
+      for bundle, containers, devices in zip( imageBundles, containerResults,
+            deviceResults ):
+         containerList = [ container[ 'containerName' ]
+               for container in containers.get() ]
+         deviceList = [ device[ 'ipAddress' ] for device in devices.get() ]
+         imageBundleList.append( cvp.ImageBundle( bundle[ 'name' ],
+            bundle[ 'key' ], bundle[ 'imageIds' ],
+            bundle[ 'isCertifiedImageBundle' ], containerList, deviceList ) )
+      return imageBundleList
@@ -0,0 +1,112 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+BenchmarkModels.py compares the memory held by the Device and Configlet
+models against the former __dict__ based models, without interned names.
+The models are built from JSON decoded the way the Cvp responses are, so
+every occurrence of a name starts as its own string.
+
+Usage:
+   python benchmarkModels.py [ deviceCount ] [ configletCount ]
+'''
+import json
+import sys
+import time
+import cvp
+
+class LegacyDevice( object ):
+   '''Device model as it was, state in a per instance dictionary'''
+   def __init__( self, ipAddress, fqdn, key, containerName, containerId,
+         imageBundle, configlets ):
+      self.ipAddress = ipAddress
+      self.fqdn = fqdn
+      self.key = key
+      self.containerName = containerName
+      self.containerId = containerId
+      self.imageBundle = imageBundle
+      self.configlets = configlets
+
+class LegacyConfiglet( object ):
+   '''Configlet model as it was, state in a per instance dictionary'''
+   def __init__( self, name, config, key, containerList, deviceList ):
+      self.name = name
+      self.config = config
+      self.key = key
+      self.containerList = containerList
+      self.deviceList = deviceList
+
+def inventory( deviceCount, configletCount ):
+   '''Returns the decoded JSON of a fleet: devices spread over 50 containers
+   with 4 configlets each, and configlets applied to a few containers'''
+   devices = [ { 'ipAddress' : '10.%d.%d.%d' % ( i >> 16, ( i >> 8 ) & 255,
+      i & 255 ), 'fqdn' : 'sw%d.lab.local' % i,
+      'key' : '00:1c:73:%02x:%02x:%02x' % ( i >> 16, ( i >> 8 ) & 255, i & 255 ),
+      'containerName' : 'rack%d' % ( i % 50 ), 'containerId' : 'c%d' % ( i % 50 ),
+      'imageBundle' : 'eos-4.%d' % ( i % 3 ),
+      'configlets' : [ 'cfg%d' % ( ( i + j ) % configletCount )
+         for j in range( 4 ) ] } for i in range( deviceCount ) ]
+   configlets = [ { 'name' : 'cfg%d' % i, 'config' : 'hostname x\n' * 20,
+      'key' : 'configlet_%d' % i, 'containerList' : [ 'rack%d' % ( i % 50 ),
+      'rack%d' % ( ( i + 1 ) % 50 ) ], 'deviceList' : [] }
+      for i in range( configletCount ) ]
+   return json.loads( json.dumps( { 'devices' : devices,
+      'configlets' : configlets } ) )
+
+def deepSize( objects ):
+   '''Returns the bytes held by objects, counting every shared object once'''
+   seen = set()
+   total = 0
+   stack = list( objects )
+   while stack:
+      obj = stack.pop()
+      if id( obj ) in seen:
+         continue
+      seen.add( id( obj ) )
+      total += sys.getsizeof( obj )
+      if isinstance( obj, dict ):
+         stack.extend( obj.keys() )
+         stack.extend( obj.values() )
+      elif isinstance( obj, ( list, tuple ) ):
+         stack.extend( obj )
+      elif hasattr( obj, '__dict__' ):
+         stack.append( obj.__dict__ )
+      elif hasattr( obj, '__slots__' ):
+         stack.extend( getattr( obj, name ) for name in obj.__slots__ )
+   return total
+
+def measure( deviceClass, configletClass, deviceCount, configletCount ):
+   '''Builds the models from a fresh decode, returns the bytes per device,
+   the bytes per configlet and the build time'''
+   data = inventory( deviceCount, configletCount )
+   start = time.time()
+   devices = [ deviceClass( d[ 'ipAddress' ], d[ 'fqdn' ], d[ 'key' ],
+      d[ 'containerName' ], d[ 'containerId' ], d[ 'imageBundle' ],
+      d[ 'configlets' ] ) for d in data[ 'devices' ] ]
+   configlets = [ configletClass( c[ 'name' ], c[ 'config' ], c[ 'key' ],
+      c[ 'containerList' ], c[ 'deviceList' ] ) for c in data[ 'configlets' ] ]
+   elapsed = time.time() - start
+   del data
+   return ( float( deepSize( devices ) ) / deviceCount,
+         float( deepSize( configlets ) ) / configletCount, elapsed )
+
+def main():
+   deviceCount = int( sys.argv[ 1 ] ) if len( sys.argv ) > 1 else 20000
+   configletCount = int( sys.argv[ 2 ] ) if len( sys.argv ) > 2 else 500
+   print '%d devices, %d configlets' % ( deviceCount, configletCount )
+   print '%-8s %14s %17s %10s' % ( 'models', 'bytes/device', 'bytes/configlet',
+         'build (s)' )
+   results = {}
+   for label, deviceClass, configletClass in (
+         ( 'legacy', LegacyDevice, LegacyConfiglet ),
+         ( 'slots', cvp.Device, cvp.Configlet ) ):
+      results[ label ] = measure( deviceClass, configletClass, deviceCount,
+            configletCount )
+      print '%-8s %14.0f %17.0f %10.3f' % ( ( label, ) + results[ label ] )
+   print 'device memory saved: %.0f%%' % ( 100 * ( 1 - results[ 'slots' ][ 0 ] /
+         results[ 'legacy' ][ 0 ] ) )
+
+if __name__ == '__main__':
+   main()
@@ -8,10 +8,28 @@ Cvp.py is a library which can be used to perform various
 actions over the cvp instance. There are numerous methods each
 corresponding to each action. Methods are listed below in the Cvp class.
 '''
+import collections
+import hashlib
 import os
-import Queue
+import time
+from multiprocessing.pool import ThreadPool
+import cvpPollers
 import cvpServices
 import errorCodes
+import imageCache
+import taskScheduler
+
+DEFAULT_MAX_WORKERS = 8
+# seconds after which the image index is fetched again, images deleted by
+# someone else are noticed at the latest after that
+IMAGE_INDEX_TTL = 300
+
+def configletHash( config ):
+   '''Returns the md5 digest of the configuration of a configlet, used to
+   detect configlets which did not change ( type : String )'''
+   if isinstance( config, unicode ):
+      config = config.encode( 'utf-8' )
+   return hashlib.md5( config or '' ).hexdigest()
 
 def encoder( obj ):
    '''This method states the encoding specifications for the data which
@@ -21,7 +39,47 @@ def encoder( obj ):
    else:
       raise TypeError
 
-class Image( object ):
+# shared copies of the names held by the models, by type and value
+_names = {}
+# the table is emptied once it holds that many names, so that the names of
+# long gone models are not kept forever
+MAX_INTERNED_NAMES = 65536
+
+def internName( name ):
+   '''Returns the shared copy of name, so that all the models naming the same
+   container, configlet or image bundle hold a single string. Unlike the
+   intern builtin it accepts unicode, which is what Cvp returns. The copy
+   returned has the type of name, a str is never replaced by an equal
+   unicode or the other way round.'''
+   if not isinstance( name, basestring ):
+      return name
+   entry = ( type( name ), name )
+   shared = _names.get( entry )
+   if shared is None:
+      if len( _names ) >= MAX_INTERNED_NAMES:
+         _names.clear()
+      shared = _names.setdefault( entry, name )
+   return shared
+
+def _internList( nameList ):
+   '''Returns nameList with its names interned, empty values kept as is'''
+   if not nameList:
+      return nameList
+   return [ internName( name ) for name in nameList ]
+
+class _Model( object ):
+   '''Base class of the models, which keep their state in __slots__ instead
+   of a per instance dictionary'''
+   __slots__ = ()
+
+   def __ne__( self, that ):
+      return not self == that
+
+   def jsonable( self ):
+      ''' Returns dictionary object which implements class namespace'''
+      return dict( ( name, getattr( self, name ) ) for name in self.__slots__ )
+
+class Image( _Model ):
    '''Image class, stores all required information about
    an image.
 
@@ -31,6 +89,8 @@ class Image( object ):
       imageId -- Cvp internally generated field. Endpoint for
       downloading the image from the Cvp
    '''
+   __slots__ = ( 'name', 'key', 'imageId' )
+
    def __init__( self, name, key, imageId ):
       self.name = name
       self.key = key
@@ -41,11 +101,10 @@ class Image( object ):
             self.key == that.key and
             self.imageId == that.imageId )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.name )
 
-class Container( object ):
+class Container( _Model ):
    '''Container class, stores all required information about
    a container
 
@@ -57,15 +116,17 @@ class Container( object ):
       imageBundle -- name of the image bundle assigned to container
       parentName -- Name of the parent container
    '''
+   __slots__ = ( 'name', 'key', 'parentId', 'configlets', 'imageBundle',
+         'parentName' )
 
    def __init__( self, name, key, parentId, configlets, imageBundle,
          parentName ):
-      self.name = name
+      self.name = internName( name )
       self.key = key
       self.parentId = parentId
-      self.configlets = configlets
-      self.imageBundle = imageBundle
-      self.parentName = parentName
+      self.configlets = _internList( configlets )
+      self.imageBundle = internName( imageBundle )
+      self.parentName = internName( parentName )
 
    def __eq__( self, that ):
       return ( self.name == that.name and
@@ -75,31 +136,30 @@ class Container( object ):
             self.imageBundle == that.imageBundle and
             self.parentName == that.parentName )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.name )
 
-class Task( object ):
+class Task( _Model ):
    ''' Task class, Stores information about a Task
 
    State variables:
       taskId -- work order Id assigned to the task
       description -- information explaining what task is about
    '''
+   __slots__ = ( 'taskId', 'description' )
 
    def __init__( self, taskId, description ):
-      self.taskId = taskId,
+      self.taskId = taskId
       self.description = description
 
    def __eq__( self, that ):
       return ( self.taskId == that.taskId and
             self.description == that.description )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.taskId )
 
-class Device( object ):
+class Device( _Model ):
    ''' Device class helps store all the information about a particular device
 
    state variables:
@@ -111,15 +171,18 @@ class Device( object ):
       imageBundle -- name of the imageBundle assigned to device
       configlets -- list of names of configlets assigned to the device
    '''
+   __slots__ = ( 'ipAddress', 'fqdn', 'key', 'containerName', 'containerId',
+         'imageBundle', 'configlets' )
+
    def __init__( self, ipAddress, fqdn, key, containerName, containerId,
          imageBundle, configlets ):
       self.ipAddress = ipAddress
       self.fqdn = fqdn
       self.key = key
-      self.containerName = containerName
+      self.containerName = internName( containerName )
       self.containerId = containerId
-      self.imageBundle = imageBundle
-      self.configlets = configlets
+      self.imageBundle = internName( imageBundle )
+      self.configlets = _internList( configlets )
 
    def __eq__( self, that ):
       return ( self.ipAddress == that.ipAddress and
@@ -129,11 +192,10 @@ class Device( object ):
             self.imageBundle == that.imageBundle and
             self.configlets == that.configlets )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.ipAddress )
 
-class Configlet( object ):
+class Configlet( _Model ):
    '''Configlet class stores all the information necessary about the
    configlet
 
@@ -144,11 +206,13 @@ class Configlet( object ):
       containerList -- List of containers to which this configlet is applied
       deviceList -- List of devices to which this configlet is applied
    '''
+   __slots__ = ( 'name', 'config', 'key', 'containerList', 'deviceList' )
+
    def __init__( self, name, config, key, containerList, deviceList ):
-      self.name = name
+      self.name = internName( name )
       self.config = config
       self.key = key
-      self.containerList = containerList
+      self.containerList = _internList( containerList )
       self.deviceList = deviceList
 
    def __eq__( self, that ):
@@ -157,11 +221,10 @@ class Configlet( object ):
              self.containerList == that.containerList and
              self.deviceList == that.deviceList )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.name )
 
-class ImageBundle( object ):
+class ImageBundle( _Model ):
    '''ImageBundle class objects stores all necessary information about the
    bundle
 
@@ -173,13 +236,16 @@ class ImageBundle( object ):
       containerList -- list of containers to which image bundle is mapped to
       certified -- indicates whether image bundle is certified or not
    '''
+   __slots__ = ( 'name', 'key', 'imageKeys', 'deviceList', 'containerList',
+         'certified' )
+
    def __init__( self, name, key, imageKeys, certified, containerList,
          deviceList ):
-      self.name = name
+      self.name = internName( name )
       self.key = key
       self.imageKeys = imageKeys
       self.deviceList = deviceList
-      self.containerList = containerList
+      self.containerList = _internList( containerList )
       self.certified = certified
 
    def __eq__( self, that ):
@@ -189,9 +255,233 @@ class ImageBundle( object ):
              self.deviceList == that.deviceList and
              self.certified == that.certified )
 
-   def jsonable( self ):
-      ''' Returns dictionary object which implements class namespace'''
-      return self.__dict__
+   def __hash__( self ):
+      return hash( self.name )
+
+class ContainerIndex( object ):
+   '''ContainerIndex class indexes the container hierarchy returned by
+   retrieveInventory so that containers can be resolved by name or key
+   without searching the Cvp instance.
+
+   state variables:
+      rootName -- name of the root container
+      nameToKey -- Dictionary mapping container names to container keys
+      keyToName -- Dictionary mapping container keys to container names
+      keyToParent -- Dictionary mapping container keys to parent container keys
+      nameToChildren -- Dictionary mapping container names to the names of
+                        their child containers
+   '''
+   def __init__( self, rootContainer ):
+      self.rootName = rootContainer[ 'name' ]
+      self.nameToKey = {}
+      self.keyToName = {}
+      self.keyToParent = {}
+      self.nameToChildren = {}
+      stack = [ rootContainer ]
+      while stack:
+         container = stack.pop()
+         self.nameToKey[ container[ 'name' ] ] = container[ 'key' ]
+         self.keyToName[ container[ 'key' ] ] = container[ 'name' ]
+         self.keyToParent[ container[ 'key' ] ] = container[ 'parentContainerId' ]
+         childList = container[ 'childContainerList' ] or []
+         self.nameToChildren[ container[ 'name' ] ] = [ child[ 'name' ]
+               for child in childList ]
+         stack.extend( childList )
+      if 'Undefined' not in self.nameToKey:
+         self.nameToKey[ 'Undefined' ] = 'undefined_container'
+         self.keyToName[ 'undefined_container' ] = 'Undefined'
+
+   def __contains__( self, containerName ):
+      return containerName in self.nameToKey
+
+   def key( self, containerName ):
+      '''Returns the key of the container
+
+      Argument:
+         containerName -- name of the container ( type : String )
+
+      Raises:
+         CvpError -- If container name is invalid
+
+      Returns:
+         containerKey -- key of the container ( type : String )
+      '''
+      if containerName not in self.nameToKey:
+         raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
+      return self.nameToKey[ containerName ]
+
+   def name( self, containerKey ):
+      '''Returns the name of the container having key containerKey, or
+      None if there is no such container'''
+      return self.keyToName.get( containerKey )
+
+   def parentKey( self, containerKey ):
+      '''Returns the key of the parent of the container having key
+      containerKey, or None for the root container'''
+      return self.keyToParent.get( containerKey )
+
+   def parentName( self, containerName ):
+      '''Returns the name of the parent container, empty string for the root
+      container'''
+      parentKey = self.keyToParent.get( self.key( containerName ) )
+      return self.keyToName.get( parentKey, '' )
+
+   def children( self, containerName ):
+      '''Returns the names of the child containers of the container'''
+      return self.nameToChildren.get( containerName, [] )
+
+class CvpSnapshot( object ):
+   '''CvpSnapshot class holds a point-in-time copy of the Cvp state, fetched
+   once by Cvp.snapshot(), together with indexes answering the usual lookups
+   without any request to the Cvp instance. Snapshots are read only.
+
+   Public methods:
+      deviceByIp( ipAddress )
+      deviceByMac( macAddress )
+      deviceByFqdn( fqdn )
+      devicesInContainer( containerName )
+      container( containerName )
+      configlet( configletName )
+      configletDevices( configletName )
+      configletContainers( configletName )
+      imageBundle( imageBundleName )
+      imageBundleDevices( imageBundleName )
+      imageBundleContainers( imageBundleName )
+
+   state variables:
+      timestamp -- time at which the snapshot was taken
+      devices -- all devices ( type : Tuple of Device ( class ) )
+      containers -- all containers ( type : Tuple of Container ( class ) )
+      configlets -- all configlets ( type : Tuple of Configlet ( class ) )
+      imageBundles -- all image bundles ( type : Tuple of ImageBundle ( class ) )
+      containerIndex -- index of the container hierarchy ( type : ContainerIndex )
+   '''
+   def __init__( self, timestamp, devices, containers, configlets, imageBundles,
+         containerIndex ):
+      setattr_ = super( CvpSnapshot, self ).__setattr__
+      setattr_( 'timestamp', timestamp )
+      setattr_( 'devices', tuple( devices ) )
+      setattr_( 'containers', tuple( containers ) )
+      setattr_( 'configlets', tuple( configlets ) )
+      setattr_( 'imageBundles', tuple( imageBundles ) )
+      setattr_( 'containerIndex', containerIndex )
+
+      byIp = {}
+      byMac = {}
+      byFqdn = {}
+      byContainer = {}
+      for device in self.devices:
+         byIp[ device.ipAddress ] = device
+         byMac[ device.key ] = device
+         byFqdn[ device.fqdn ] = device
+         byContainer.setdefault( device.containerName, [] ).append( device )
+      containerByName = dict( ( container.name, container )
+            for container in self.containers )
+      configletByName = dict( ( configlet.name, configlet )
+            for configlet in self.configlets )
+      imageBundleByName = dict( ( imageBundle.name, imageBundle )
+            for imageBundle in self.imageBundles )
+
+      setattr_( '_byIp', byIp )
+      setattr_( '_byMac', byMac )
+      setattr_( '_byFqdn', byFqdn )
+      setattr_( '_byContainer', dict( ( name, tuple( deviceList ) )
+            for name, deviceList in byContainer.iteritems() ) )
+      setattr_( '_containers', containerByName )
+      setattr_( '_configlets', configletByName )
+      setattr_( '_imageBundles', imageBundleByName )
+      setattr_( '_configletDevices', self._invert( self.configlets,
+            'deviceList', byIp ) )
+      setattr_( '_configletContainers', self._invert( self.configlets,
+            'containerList', containerByName ) )
+      setattr_( '_imageBundleDevices', self._invert( self.imageBundles,
+            'deviceList', byIp ) )
+      setattr_( '_imageBundleContainers', self._invert( self.imageBundles,
+            'containerList', containerByName ) )
+
+   def __setattr__( self, name, value ):
+      raise AttributeError( 'CvpSnapshot is read only' )
+
+   @staticmethod
+   def _invert( entityList, attribute, index ):
+      '''Maps the name of each entity to the objects, looked up in index, that
+      are named by its attribute list'''
+      mapping = {}
+      for entity in entityList:
+         mapping[ entity.name ] = tuple( index[ name ]
+               for name in getattr( entity, attribute ) or [] if name in index )
+      return mapping
+
+   @staticmethod
+   def _lookup( index, name, errorCode ):
+      '''Returns index[ name ] or raises CvpError with errorCode'''
+      if name not in index:
+         raise cvpServices.CvpError( errorCode )
+      return index[ name ]
+
+   def deviceByIp( self, ipAddress ):
+      '''Returns the device having ip address ipAddress
+
+      Raises:
+         CvpError -- If there is no device with that ip address
+      '''
+      return self._lookup( self._byIp, ipAddress,
+            errorCodes.INVALID_DEVICE_IP_ADDRESS )
+
+   def deviceByMac( self, macAddress ):
+      '''Returns the device having mac address ( key ) macAddress, or None'''
+      return self._byMac.get( macAddress )
+
+   def deviceByFqdn( self, fqdn ):
+      '''Returns the device having fully qualified domain name fqdn, or None'''
+      return self._byFqdn.get( fqdn )
+
+   def devicesInContainer( self, containerName ):
+      '''Returns the devices whose parent container is containerName'''
+      return self._byContainer.get( containerName, () )
+
+   def container( self, containerName ):
+      '''Returns the container named containerName
+
+      Raises:
+         CvpError -- If container name is invalid
+      '''
+      return self._lookup( self._containers, containerName,
+            errorCodes.INVALID_CONTAINER_NAME )
+
+   def configlet( self, configletName ):
+      '''Returns the configlet named configletName
+
+      Raises:
+         CvpError -- If configlet name is invalid
+      '''
+      return self._lookup( self._configlets, configletName,
+            errorCodes.INVALID_CONFIGLET_NAME )
+
+   def configletDevices( self, configletName ):
+      '''Returns the devices to which the configlet is applied'''
+      return self._configletDevices.get( configletName, () )
+
+   def configletContainers( self, configletName ):
+      '''Returns the containers to which the configlet is applied'''
+      return self._configletContainers.get( configletName, () )
+
+   def imageBundle( self, imageBundleName ):
+      '''Returns the image bundle named imageBundleName
+
+      Raises:
+         CvpError -- If image bundle name is invalid
+      '''
+      return self._lookup( self._imageBundles, imageBundleName,
+            errorCodes.INVALID_IMAGE_BUNDLE_NAME )
+
+   def imageBundleDevices( self, imageBundleName ):
+      '''Returns the devices to which the image bundle is applied'''
+      return self._imageBundleDevices.get( imageBundleName, () )
+
+   def imageBundleContainers( self, imageBundleName ):
+      '''Returns the containers to which the image bundle is applied'''
+      return self._imageBundleContainers.get( imageBundleName, () )
 
 class Cvp( object ):
    '''Class Cvp contains all the methods essentials for downloading the
@@ -200,50 +490,101 @@ class Cvp( object ):
 
    Public methods:
       authenticate( username, password )
+      snapshot()
       getDevices()
-      getDevice( deviceIpAddress )
+      getDevice( deviceIpAddress, snapshot )
       addDevice( device, loginCredentials )
-      addDevices( deviceList )
-      deviceComplainceCheck( deviceIpAddress )
+      addDevices( deviceList, callback )
+      addDevicesIter( deviceList )
+      deviceComplainceCheck( deviceIpAddress, snapshot )
+      complianceSweep( deviceFilter, callback, maxWorkers, snapshot )
+      complianceSweepIter( deviceFilter, maxWorkers, snapshot )
       deleteDevice( device )
       getConfiglets()
-      getConfiglet( configName )
+      getConfiglet( configName, snapshot )
       addConfiglet( configlet )
       updateConfiglet( configlet )
+      syncConfiglets( configlets )
       deleteConfiglet( configlet )
+      getConfigletKeys( refresh )
       mapConfigToDevice( device , configList )
       addContainer( container )
       getContainers()
-      getContainer( containerName )
+      getContainer( containerName, snapshot )
       getRootContainerInfo()
       renameContainer( oldContainerName, newContainerName )
       addContainers( containerInfoList )
+      getContainerIndex( refresh )
       deleteContainer( container )
-      getImages( storageDirPath )
-      getImage(  imageName , storageDirPath )
-      addImage( imageName )
+      enableImageCache( cacheDir, maxBytes )
+      getImages( storageDirPath, maxParallel, progress )
+      getImage(  imageName , storageDirPath, progress )
+      addImage( imageName, progress )
       getImageBundles()
       getImageBundle( imageBundleName )
       deleteImageBundle( imageBundle )
-      addImageBundle( imageBundle, imageNameList )
-      updateImageBundle( imageBundle, imageNameList )
+      addImageBundle( imageBundle, imageNameList, maxParallel, progress )
+      stageImages( imageNameList, maxParallel, progress )
+      updateImageBundle( imageBundle, imageNameList, maxParallel, progress )
       mapImageBundleToDevice( device, imageBundleName)
       mapImageBundleToContainer( container, imageBundleName )
       mapConfigToContainer( container , configNameList )
       removeConfigFromContainer( container, configList )
-      executeAllPendingTask()
+      executeAllPendingTask( maxInFlight, groupBy, maxPerGroup )
+      changeSet( chunkSize, raiseOnFailure )
       executeTask( taskId )
       getPendingTasksInfo()
-      monitorTaskStatus( taskIdList )
+      monitorTaskStatus( taskIdList, callback, timeout )
+      watchTasks( taskIdList, callback, timeout )
 
    State variables:
       cvpService -- CvpService class instance
+      maxWorkers -- number of worker threads used for the per-configlet and
+                    per-image bundle lookups
+      deviceTimeout -- seconds to wait for devices being added to leave the
+                       connecting state
+      imageCache -- local store of the downloaded images, None when disabled
+                    ( type : ImageCache ( class ) )
 
       '''
 
-   def __init__( self, host, ssl=False, port=80 ):
+   def __init__( self, host, ssl=False, port=80,
+         poolSize=cvpServices.DEFAULT_POOL_SIZE, maxWorkers=DEFAULT_MAX_WORKERS ):
       '''Constructer for Cvp class.'''
-      self.cvpService = cvpServices.CvpService( host, ssl, port )
+      self.cvpService = cvpServices.CvpService( host, ssl, port, poolSize )
+      self.maxWorkers = maxWorkers
+      self._containerIndex = None
+      self._configletIndex = None
+      self._imageIndex = None
+      self.imageCache = None
+      self.deviceTimeout = cvpPollers.DEFAULT_DEVICE_DEADLINE
+
+   def _parallelMap( self, func, argList, maxWorkers=None ):
+      '''Calls func on every element of argList from a bounded pool of
+      maxWorkers threads.
+
+      Arguments:
+         func -- function to be called ( type : callable )
+         argList -- arguments, one per call ( type : List )
+         maxWorkers -- size of the pool, self.maxWorkers by default
+                       ( optional ) ( type : int )
+
+      Raises:
+         The first exception raised by func
+
+      Returns:
+         resultList -- results of func in the order of argList ( type : List )
+      '''
+      argList = list( argList )
+      maxWorkers = maxWorkers or self.maxWorkers
+      if maxWorkers <= 1 or len( argList ) <= 1:
+         return [ func( arg ) for arg in argList ]
+      pool = ThreadPool( min( maxWorkers, len( argList ) ) )
+      try:
+         return pool.map( func, argList )
+      finally:
+         pool.close()
+         pool.join()
 
    def authenticate( self, username, password ):
       '''Authenticate the user login credentials
@@ -269,18 +610,12 @@ class Cvp( object ):
             value is list of configlet applied to that container ( type : Dict )
       '''
       configMap = {}
-      for configName in configNameList:
-         containers = self.cvpService.configAppliedContainers( configName )
+      containerLists = self._parallelMap( self.cvpService.configAppliedContainers,
+            configNameList )
+      for configName, containers in zip( configNameList, containerLists ):
          for container in containers:
-            configList = []
-            key = container[ 'containerName' ]
-            if key in configMap:
-               configList = configMap[ container[ 'containerName' ] ]
-               configList.append( configName )
-               configMap[ container[ 'containerName' ] ] = configList
-            else :
-               configList.append( configName )
-               configMap[ container[ 'containerName' ] ] = configList
+            configList = configMap.setdefault( container[ 'containerName' ], [] )
+            configList.append( configName )
       return configMap
 
    def _getDeviceConfigMap( self, configNameList ):
@@ -294,18 +629,12 @@ class Cvp( object ):
          value is list of configlets applied to that device ( type : Dict )
       '''
       configMap = {}
-      for configName in configNameList:
-         devices = self.cvpService.configAppliedDevices( configName )
+      deviceLists = self._parallelMap( self.cvpService.configAppliedDevices,
+            configNameList )
+      for configName, devices in zip( configNameList, deviceLists ):
          for device in devices:
-            configList = []
-            key = device[ 'ipAddress' ]
-            if key in configMap:
-               configList = configMap[ device[ 'ipAddress' ] ]
-               configList.append( configName )
-               configMap[device[ 'ipAddress' ] ] = configList
-            else:
-               configList.append( configName )
-               configMap[ device[ 'ipAddress' ] ] = configList
+            configList = configMap.setdefault( device[ 'ipAddress' ], [] )
+            configList.append( configName )
       return configMap
 
    def _getContainerImageBundleMap( self, imageBundleNameList ):
@@ -319,9 +648,10 @@ class Cvp( object ):
          value is image bundle applied to that container ( type : Dict )
       '''
       imageBundleMap = {}
-      for imageBundleName in imageBundleNameList:
-         containerList = self.cvpService.imageBundleAppliedContainers(
-               imageBundleName )
+      containerLists = self._parallelMap(
+            self.cvpService.imageBundleAppliedContainers, imageBundleNameList )
+      for imageBundleName, containerList in zip( imageBundleNameList,
+            containerLists ):
          for container in containerList:
             imageBundleMap[ container [ 'containerName' ] ] = imageBundleName
       return imageBundleMap
@@ -337,8 +667,9 @@ class Cvp( object ):
          value is image bundle applied to that device ( type : Dict )
       '''
       imageBundleMap = {}
-      for imageBundleName in imageBundleNameList:
-         devices = self.cvpService.imageBundleAppliedDevices( imageBundleName )
+      deviceLists = self._parallelMap( self.cvpService.imageBundleAppliedDevices,
+            imageBundleNameList )
+      for imageBundleName, devices in zip( imageBundleNameList, deviceLists ):
          for device in devices:
             imageBundleMap[ device [ 'ipAddress' ] ] = imageBundleName
       return imageBundleMap
@@ -371,6 +702,87 @@ class Cvp( object ):
          configNameList.append( config[ 'name' ] )
       return configNameList
 
+   def snapshot( self ):
+      '''Fetches the inventory, the container hierarchy, the configlets, the
+      image bundles and their mappings once, in parallel, and returns them as
+      a consistent read only snapshot.
+
+      Arguments None
+
+      Returns:
+         snapshot -- state of the Cvp instance ( type : CvpSnapshot ( class ) )
+      '''
+      timestamp = time.time()
+      inventory, hierarchy, configlets, imageBundles = self._parallelMap(
+            lambda request: request(), [ self.cvpService.getInventory,
+               self.cvpService.retrieveInventory,
+               self.cvpService.getConfigletsInfo,
+               self.cvpService.getImageBundles ] )
+      configNameList = [ config[ 'name' ] for config in configlets ]
+      imageBundleNameList = [ bundle[ 'name' ] for bundle in imageBundles ]
+      requestList = ( [ ( self.cvpService.configAppliedDevices, name )
+            for name in configNameList ] +
+            [ ( self.cvpService.configAppliedContainers, name )
+            for name in configNameList ] +
+            [ ( self.cvpService.imageBundleAppliedDevices, name )
+            for name in imageBundleNameList ] +
+            [ ( self.cvpService.imageBundleAppliedContainers, name )
+            for name in imageBundleNameList ] )
+      responses = iter( self._parallelMap( lambda request: request[ 0 ](
+            request[ 1 ] ), requestList ) )
+      configDevices = [ [ device[ 'ipAddress' ] for device in next( responses ) ]
+            for _ in configNameList ]
+      configContainers = [ [ container[ 'containerName' ]
+            for container in next( responses ) ] for _ in configNameList ]
+      bundleDevices = [ [ device[ 'ipAddress' ] for device in next( responses ) ]
+            for _ in imageBundleNameList ]
+      bundleContainers = [ [ container[ 'containerName' ]
+            for container in next( responses ) ] for _ in imageBundleNameList ]
+
+      deviceConfigMap = {}
+      containerConfigMap = {}
+      for configName, ipAddressList, containerNameList in zip( configNameList,
+            configDevices, configContainers ):
+         for ipAddress in ipAddressList:
+            deviceConfigMap.setdefault( ipAddress, [] ).append( configName )
+         for containerName in containerNameList:
+            containerConfigMap.setdefault( containerName, [] ).append( configName )
+      deviceImageMap = {}
+      containerImageMap = {}
+      for imageBundleName, ipAddressList, containerNameList in zip(
+            imageBundleNameList, bundleDevices, bundleContainers ):
+         for ipAddress in ipAddressList:
+            deviceImageMap[ ipAddress ] = imageBundleName
+         for containerName in containerNameList:
+            containerImageMap[ containerName ] = imageBundleName
+
+      rootContainer, _ = hierarchy
+      containerIndex = ContainerIndex( rootContainer )
+      devices, deviceContainers = inventory
+      deviceList = []
+      for dut in devices:
+         parentContainerName = deviceContainers.get( dut[ 'key' ] )
+         if not parentContainerName:
+            raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
+         deviceList.append( Device( dut[ 'ipAddress' ], dut[ 'fqdn' ],
+            dut[ 'key' ], parentContainerName,
+            containerIndex.key( parentContainerName ),
+            deviceImageMap.get( dut[ 'ipAddress' ], '' ),
+            deviceConfigMap.get( dut[ 'ipAddress' ], '' ) ) )
+      containerList = self._recursiveParse( [], [ rootContainer ],
+            containerConfigMap, containerImageMap, '' )
+      configletList = [ Configlet( config[ 'name' ], config[ 'config' ],
+            config[ 'key' ], containerNameList, ipAddressList )
+            for config, containerNameList, ipAddressList in zip( configlets,
+               configContainers, configDevices ) ]
+      imageBundleList = [ ImageBundle( bundle[ 'name' ], bundle[ 'key' ],
+            bundle[ 'imageIds' ], bundle[ 'isCertifiedImageBundle' ],
+            containerNameList, ipAddressList )
+            for bundle, containerNameList, ipAddressList in zip( imageBundles,
+               bundleContainers, bundleDevices ) ]
+      return CvpSnapshot( timestamp, deviceList, containerList, configletList,
+            imageBundleList, containerIndex )
+
    def getDevices( self ):
       '''Collect information of all the devices. Information of device consist
       of the device specifications like ip address, mac address, configlets and
@@ -394,9 +806,7 @@ class Cvp( object ):
          if not deviceContainer[ dut[ 'key' ] ]:
             raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
          parentContainerName = deviceContainer[ dut[ 'key' ] ]
-         parentContainerId = 'undefined_container' if ( parentContainerName
-               == 'Undefined' ) else self._getContainerInfo(
-                     parentContainerName )[ 'key' ]
+         parentContainerId = self._getContainerKey( parentContainerName )
          appliedConfigs = configMap[ dut[ 'ipAddress' ] ] if ( dut[ 'ipAddress' ]
                in configMap ) else ''
          appliedImageBundle = imageMap[ dut[ 'ipAddress' ] ] if ( dut[ 'ipAddress' ]
@@ -406,6 +816,144 @@ class Cvp( object ):
             appliedImageBundle, appliedConfigs ) )
       return deviceInfoList
 
+   def changeSet( self, chunkSize=cvpServices.DEFAULT_CHANGE_SET_CHUNK_SIZE,
+         raiseOnFailure=True ):
+      '''Batches the topology changes made inside a with block. Configlet and
+      image bundle mappings, container additions, renames and deletions and
+      device deletions made in the block are saved together, in chunks of
+      chunkSize actions, when the block exits. Inside the block the configlet
+      and image bundle keys are fetched once, and the inventory saved once,
+      instead of once per mapping. The change set only collects the changes
+      made by the calling thread.
+
+         with cvp.changeSet():
+            for device in deviceList:
+               cvp.mapConfigToDevice( device, configNameList )
+
+      A container added in the block has no key until the block exits, hence
+      mapping configlets or an image bundle to it, or adding containers or
+      devices under it, in the same block raises INVALID_CONTAINER_NAME. Use
+      addContainers, or a first block for the containers and a second one
+      for the mappings.
+
+      Arguments:
+         chunkSize -- maximum number of actions saved by one request
+                      ( type : int )
+         raiseOnFailure -- raise when the block exits if some chunks could
+                           not be saved, otherwise they are only recorded in
+                           the failures of the change set ( optional )
+                           ( type : boolean )
+
+      Raises:
+         ChangeSetError -- On exit, if raiseOnFailure and chunks could not
+                           be saved, once all of them have been tried
+
+      Returns:
+         changeSet -- ( type : TopologyChangeSet ( class ) )
+      '''
+      return self.cvpService.changeSet( chunkSize, raiseOnFailure )
+
+   def _changeSetLookup( self, name, fetch, refresh=False ):
+      '''Returns fetch(), called once per change set when the calling thread
+      is in one, on every call otherwise
+
+      Arguments:
+         name -- name under which the result is cached ( type : String )
+         fetch -- function issuing the lookup ( type : callable )
+         refresh -- fetch again even if cached ( type : boolean )
+      '''
+      changeSet = self.cvpService._activeChangeSet()
+      if changeSet is None:
+         return fetch()
+      if refresh or name not in changeSet.cache:
+         changeSet.cache[ name ] = fetch()
+      return changeSet.cache[ name ]
+
+   def _getContainerIndex( self ):
+      '''Returns the index of the container hierarchy, fetching the hierarchy
+      from the Cvp instance if the index was invalidated
+
+      Returns:
+         containerIndex -- index of the containers ( type : ContainerIndex )
+      '''
+      # read once, another thread may invalidate the index meanwhile
+      containerIndex = self._containerIndex
+      if containerIndex is None:
+         containers, _ = self.cvpService.retrieveInventory()
+         containerIndex = self._containerIndex = ContainerIndex( containers )
+      return containerIndex
+
+   def _invalidateContainerIndex( self ):
+      '''Drops the container index after the hierarchy has been modified'''
+      self._containerIndex = None
+
+   def getContainerIndex( self, refresh=False ):
+      '''Returns the index of the container hierarchy, the one kept by the
+      Cvp instance unless refresh
+
+      Arguments:
+         refresh -- fetch the hierarchy again ( optional ) ( type : boolean )
+
+      Returns:
+         containerIndex -- index of the containers ( type : ContainerIndex )
+      '''
+      if refresh:
+         self._invalidateContainerIndex()
+      return self._getContainerIndex()
+
+   def _getContainerKey( self, containerName ):
+      '''Returns the key of the container. The index is refreshed once if the
+      container is not present in it, in case it was created by someone else.
+
+      Argument:
+         containerName -- name of the contianer ( type : String)
+
+      Raises :
+         CvpError -- Name of the container ( containerName ) is invalid
+
+      Returns:
+         containerKey -- key of the container ( type : String )
+      '''
+      if containerName not in self._getContainerIndex():
+         self._invalidateContainerIndex()
+      return self._getContainerIndex().key( containerName )
+
+   def _getConfigletIndex( self ):
+      '''Returns the index of the configlets on the Cvp instance, mapping
+      configlet names to their key and configletHash of their configuration.
+      The configlets are fetched if the index was invalidated.
+
+      Returns:
+         configletIndex -- ( type : Dict of ( String, String ) Tuple )
+      '''
+      # read once, another thread may invalidate the index meanwhile
+      configletIndex = self._configletIndex
+      if configletIndex is None:
+         configletIndex = self._configletIndex = dict( ( config[ 'name' ],
+               ( config[ 'key' ], configletHash( config[ 'config' ] ) ) )
+               for config in self.cvpService.getConfigletsInfo() )
+      return configletIndex
+
+   def _invalidateConfigletIndex( self ):
+      '''Drops the configlet index after configlets have been added or
+      deleted'''
+      self._configletIndex = None
+
+   def getConfigletKeys( self, refresh=False ):
+      '''Returns the keys of the configlets by name, from the configlet index
+      kept by the Cvp instance unless refresh
+
+      Arguments:
+         refresh -- fetch the configlets again ( optional ) ( type : boolean )
+
+      Returns:
+         configletKeys -- ( type : Dict of String )
+      '''
+      if refresh:
+         self._invalidateConfigletIndex()
+      return dict( ( name, key )
+            for name, ( key, _ ) in self._getConfigletIndex().iteritems() )
+
    def _getContainerInfo( self, containerName ):
       '''Returns container information for given container name
 
@@ -426,17 +974,24 @@ class Cvp( object ):
          if container[ 'name' ] == containerName:
             return container
 
-   def getDevice( self , deviceIpAddress ):
+   def getDevice( self , deviceIpAddress, snapshot=None ):
       '''Retrieve information about device.Information of device consist
       of the device specifications like ip address, mac address, configlets and
       image bundle applied to device.
 
       Argument:
          deviceIpAddress -- Ip address of the device ( type : String )
+         snapshot -- answer from this snapshot instead of the Cvp instance
+            ( optional ) ( type : CvpSnapshot ( class ) )
+
+      Raises:
+         CvpError -- If the snapshot has no device with that ip address
 
       Returns:
          deviceInfo -- Information about the device ( type : Device ( class ) )
       '''
+      if snapshot is not None:
+         return snapshot.deviceByIp( deviceIpAddress )
       imageBundleNameList = self._getImageBundleNameList()
       imageMap = self._getDeviceImageBundleMap( imageBundleNameList )
       configNameList = self._getConfigNameList()
@@ -451,9 +1006,7 @@ class Cvp( object ):
                break
          if not parentContainerName:
             raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
-         parentContainerId = 'undefined_container' if ( parentContainerName
-               == 'Undefined' ) else self._getContainerInfo(
-                     parentContainerName )[ 'key' ]
+         parentContainerId = self._getContainerKey( parentContainerName )
          appliedConfigs = configMap[ dut[ 'ipAddress' ] ] if ( dut[ 'ipAddress' ]
                in configMap ) else ''
          appliedImageBundle = imageMap[ dut[ 'ipAddress' ] ] if ( dut[ 'ipAddress' ]
@@ -568,13 +1121,15 @@ class Cvp( object ):
             appliedImageBundle, parentContainerName ) )
       return containerInfoList
 
-   def getContainer( self, containerName ):
+   def getContainer( self, containerName, snapshot=None ):
       '''Retrieve a container Information.Information of container consist of
       specifications like container Key, parent container key, container name,
       configlets and image bundle applied to container
 
       Arguments
          ContainerName -- name of the container ( type : String )
+         snapshot -- answer from this snapshot instead of the Cvp instance
+            ( optional ) ( type : CvpSnapshot ( class ) )
 
       Raises:
          CvpError -- If container name is invalid
@@ -583,6 +1138,8 @@ class Cvp( object ):
          containerInfo -- Information about the container( type : Container(
          class ) )
       '''
+      if snapshot is not None:
+         return snapshot.container( containerName )
       container = self._getContainerInfo( containerName )
       imageBundleNameList = self._getImageBundleNameList()
       imageMap = self._getContainerImageBundleMap( imageBundleNameList )
@@ -599,36 +1156,74 @@ class Cvp( object ):
             appliedImageBundle, parentName )
       return containerInfo
 
-   def getImages( self , storageDirPath='' ):
-      ''' Images are downloaded and saved to the file path.
+   def getImages( self , storageDirPath='', maxParallel=None, progress=None ):
+      ''' Images are downloaded and saved to the file path, maxParallel of
+      them at once. Each image is verified against its md5, and images
+      already downloaded, fully or partly, are not transferred again.
 
       Argument:
          storageDirPath -- path to directory for storing image files ( optional )
             ( type : String )
+         maxParallel -- number of images downloaded at once, maxWorkers by
+                        default ( optional ) ( type : int )
+         progress -- progress callback, see CvpService.downloadImage. It is
+                     called from the download threads ( optional )
+                     ( type : callable )
+
+      Raises:
+         CvpError -- If an image does not match its md5
 
       Returns:
          imageList -- List of inforamtion of images downloaded
             ( type : List of Image ( class ) )'''
 
-      imageList = []
       images = self.cvpService.getImagesInfo()
-      for image in images:
-         imageList.append( Image( image[ 'name' ], image[ 'key' ],
-            image[ 'imageId' ] ) )
+      self._parallelMap( lambda image: self._downloadImage( image,
+            storageDirPath, progress ), images, maxParallel )
+      return [ Image( image[ 'name' ], image[ 'key' ], image[ 'imageId' ] )
+            for image in images ]
+
+   def enableImageCache( self, cacheDir, maxBytes=imageCache.DEFAULT_MAX_BYTES ):
+      '''Keeps the images downloaded by getImage and getImages in a local
+      store so that they are linked, not downloaded again, the next time
+
+      Arguments:
+         cacheDir -- directory of the store ( type : String )
+         maxBytes -- size cap of the store in bytes ( type : int )
+
+      Returns:
+         imageCache -- the store, whose stats() method gives the hit and miss
+                       counters ( type : ImageCache ( class ) )
+      '''
+      self.imageCache = imageCache.ImageCache( cacheDir, maxBytes )
+      return self.imageCache
+
+   def _downloadImage( self, image, storageDirPath, progress ):
+      '''Downloads an image, as returned by getImagesInfo, into
+      storageDirPath through the image cache when it is enabled'''
+      if self.imageCache is None:
          self.cvpService.downloadImage( image[ 'name' ], image[ 'imageId' ],
-               storageDirPath )
-      return imageList
+               storageDirPath, image.get( 'md5' ), progress )
+         return
+      def download( cacheDirPath, key ):
+         self.cvpService.downloadImage( key, image[ 'imageId' ], cacheDirPath,
+               image.get( 'md5' ), progress )
+      self.imageCache.fetch( self.imageCache.imageKey( image ),
+            storageDirPath + image[ 'name' ], download )
 
-   def getImage( self, imageName , storageDirPath='' ):
+   def getImage( self, imageName , storageDirPath='', progress=None ):
       ''' Image is downloaded and saved in the workspace
 
       Argument :
          imageName -- name of image to be downloaded ( type : String )
          storageDirPath -- path to directory for storing image files ( optional )
          ( type : String )
+         progress -- progress callback, see CvpService.downloadImage
+                     ( optional ) ( type : callable )
 
       Raises:
          CvpError -- If image name is incorrect
+         CvpError -- If the image does not match its md5
 
       Returns:
          imageInfo -- information of image downloaded. ( type : Image ( class )
@@ -640,18 +1235,20 @@ class Cvp( object ):
             imagePresentFlag = True
             imageInfo = Image( image[ 'name' ], image[ 'key' ],
                   image[ 'imageId' ] )
-            self.cvpService.downloadImage( image[ 'name' ], image[ 'imageId' ],
-                  storageDirPath )
+            self._downloadImage( image, storageDirPath, progress )
             break
       if imagePresentFlag == False:
          raise cvpServices.CvpError( errorCodes.INVALID_IMAGE_NAME )
       return imageInfo
 
-   def getConfiglet( self, configName ):
+   def getConfiglet( self, configName, snapshot=None ):
       '''Retrieve a specific configlet.
 
       Argument:
          configName -- name of the configlet ( type : String )
+         snapshot -- answer from this snapshot instead of the Cvp instance,
+            containers and devices of the configlet are then filled in
+            ( optional ) ( type : CvpSnapshot ( class ) )
 
       Raises:
          CvpError : If configlet name is invalid
@@ -659,30 +1256,18 @@ class Cvp( object ):
       Returns:
          Configlet -- information of the configlet ( type : Configlet ( class ) )
       '''
+      if snapshot is not None:
+         return snapshot.configlet( configName )
       config = self.cvpService.getConfigletByName( configName )
       return Configlet( config[ 'name' ], config[ 'config' ], config[ 'key' ],
             '', '' )
 
    def _getparentInfo( self , parentId ):
-      ''' retrieve information of parent for newly added container using the
-      recursive Depth First Search returns name of the parent container'''
+      ''' retrieve information of parent for newly added container from the
+      container index, returns name of the parent container'''
       if parentId == None:
          return ''
-      containers, _ = self.cvpService.retrieveInventory()
-      rawContainersInfo = []
-      rawContainersInfo.append( containers )
-      parentName = self._recursiveParentInfo( rawContainersInfo, parentId )
-      return parentName
-
-   def _recursiveParentInfo( self, childContainerList, parentId ):
-      ''' internal function for getting parent container info in the hierarchy'''
-      for container in childContainerList:
-         if container[ 'key' ] == parentId:
-            return container[ 'name' ]
-         elif len( container[ 'childContainerList' ] ) > 0 :
-            parentName = self._recursiveParentInfo(
-                  container[ 'childContainerList' ], parentId )
-            return parentName
+      return self._getContainerIndex().name( parentId )
 
    def addContainers( self, containerInfoList ):
       '''Add containers to the inventory by maintaining the hierarchy of the
@@ -692,25 +1277,65 @@ class Cvp( object ):
          containerInfoList -- List of container inforamtion
             ( type : List of Container ( class ) )
 
+      The tree is sorted into depth levels once, before any request. Each
+      level is then created by a single change set, and the container index
+      is refreshed once per level so that the next level finds the keys of
+      its parents. Containers already present in the Cvp instance, such as
+      the root container, are skipped.
+
       Raise :
          Assertion Error -- if container is not Container type
-         CvpError -- If container already exists
-         CvpError -- If parent container name is invalid
+         CvpError -- If a level could not be created
 
-      Returns None
+      Returns:
+         orphans -- containers which were not created because their parent is
+                    neither in the Cvp instance nor in containerInfoList
+            ( type : List of Container ( class ) )
       '''
-      currRootContainerInfo = self.getRootContainerInfo()
-      containerCount = len( containerInfoList )
-      parentQueue = Queue.Queue()
-      parentName = currRootContainerInfo.name
-      while containerCount > 1 :
-         for container in containerInfoList:
-            assert isinstance( container, Container )
-            if container.parentName == parentName:
-               self.addContainer( container )
-               parentQueue.put( container.name )
-               containerCount = containerCount - 1
-         parentName = parentQueue.get()
+      levels, orphans = self._containerLevels( containerInfoList,
+            self._getContainerIndex() )
+      for level in levels:
+         containerIndex = self._getContainerIndex()
+         try:
+            with self.changeSet():
+               for container in level:
+                  self.cvpService.addContainer( container.name,
+                        container.parentName,
+                        containerIndex.key( container.parentName ) )
+         finally:
+            self._invalidateContainerIndex()
+      return orphans
+
+   @staticmethod
+   def _containerLevels( containerInfoList, containerIndex ):
+      '''Sorts the containers to be created into depth levels: the parents of
+      the containers of a level are either in the Cvp instance or in a
+      previous level.
+
+      Returns:
+         levels -- containers to be created, level by level
+            ( type : List of List of Container ( class ) )
+         orphans -- containers whose parent cannot be found
+            ( type : List of Container ( class ) )
+      '''
+      children = {}
+      for container in containerInfoList:
+         assert isinstance( container, Container )
+         if container.name not in containerIndex:
+            children.setdefault( container.parentName, [] ).append( container )
+      levels = []
+      level = [ container for parentName in children
+            if parentName in containerIndex
+            for container in children[ parentName ] ]
+      created = set()
+      while level:
+         levels.append( level )
+         created.update( container.name for container in level )
+         level = [ container for parent in level
+               for container in children.get( parent.name, [] ) ]
+      orphans = [ container for containerList in children.itervalues()
+            for container in containerList if container.name not in created ]
+      return levels, orphans
 
    def addConfiglet( self, configlet ):
       '''Add a configlet to cvp inventory
@@ -727,9 +1352,14 @@ class Cvp( object ):
       '''
       assert isinstance( configlet, Configlet )
       self.cvpService.addConfiglet( configlet.name, configlet.config )
+      self._invalidateConfigletIndex()
 
    def updateConfiglet( self, configlet ):
-      ''' updating an existing configlet in Cvp instance
+      ''' updating an existing configlet in Cvp instance. The update is
+      skipped, and no task is created, if the configuration is identical to
+      the one on the Cvp instance. The configlet index is only trusted to
+      detect changes: when it claims the configuration is identical, the
+      configlet is fetched again, since someone else may have edited it.
 
       Argument:
           configlet -- updated information of the configlet
@@ -738,12 +1368,94 @@ class Cvp( object ):
       Raises:
          CvpError -- If configlet name is invalid
          Assertion Error -- If configlet is not of type Configlet
-      Returns None
+      Returns:
+         updated -- False if the configlet was unchanged ( type : boolean )
       '''
       assert isinstance( configlet, Configlet )
-      currConfig = self.cvpService.getConfigletByName( configlet.name )
+      if configlet.name not in self._getConfigletIndex():
+         self._invalidateConfigletIndex()
+      configletIndex = self._getConfigletIndex()
+      if configlet.name not in configletIndex:
+         raise cvpServices.CvpError( errorCodes.INVALID_CONFIGLET_NAME )
+      configletKey, currHash = configletIndex[ configlet.name ]
+      newHash = configletHash( configlet.config )
+      if newHash == currHash:
+         current = self.cvpService.getConfigletByName( configlet.name )
+         configletKey = current[ 'key' ]
+         currHash = configletHash( current[ 'config' ] )
+         configletIndex[ configlet.name ] = ( configletKey, currHash )
+         if newHash == currHash:
+            return False
       self.cvpService.updateConfiglet( configlet.name, configlet.config,
-            currConfig[ 'key' ] )
+            configletKey )
+      configletIndex[ configlet.name ] = ( configletKey, newHash )
+      return True
+
+   def syncConfiglets( self, configlets ):
+      '''Brings the configlets of the Cvp instance in line with configlets.
+      Their hashes are compared against a freshly fetched configlet index and
+      only the new or changed configlets are uploaded, from maxWorkers
+      threads. Configlets absent from configlets are left untouched.
+
+      Arguments:
+         configlets -- a directory holding one file per configlet, named
+                       after the configlet, or a Dictionary mapping configlet
+                       names to configurations, or a List of Configlet
+            ( type : String, Dict or List of Configlet ( class ) )
+
+      Returns:
+         report -- number of configlets added, updated and skipped, and the
+                   CvpError raised for each configlet which failed, by name
+                   ( type : Dict )
+      '''
+      if isinstance( configlets, basestring ):
+         configMap = {}
+         for fileName in sorted( os.listdir( configlets ) ):
+            filePath = os.path.join( configlets, fileName )
+            if fileName.startswith( '.' ) or not os.path.isfile( filePath ):
+               continue
+            with open( filePath ) as configFile:
+               configMap[ fileName ] = configFile.read()
+      elif isinstance( configlets, dict ):
+         configMap = configlets
+      else:
+         configMap = dict( ( configlet.name, configlet.config )
+               for configlet in configlets )
+
+      self._invalidateConfigletIndex()
+      configletIndex = self._getConfigletIndex()
+      uploadList = []
+      skipped = 0
+      for name, config in sorted( configMap.items() ):
+         if name not in configletIndex:
+            uploadList.append( ( 'added', name, config, None ) )
+         elif configletHash( config ) != configletIndex[ name ][ 1 ]:
+            uploadList.append( ( 'updated', name, config,
+               configletIndex[ name ][ 0 ] ) )
+         else:
+            skipped += 1
+
+      def upload( uploadInfo ):
+         outcome, name, config, configletKey = uploadInfo
+         try:
+            if configletKey is None:
+               self.cvpService.addConfiglet( name, config )
+            else:
+               self.cvpService.updateConfiglet( name, config, configletKey )
+         except cvpServices.CvpError as e:
+            return 'failed', name, e
+         return outcome, name, None
+
+      report = { 'added' : 0, 'updated' : 0, 'skipped' : skipped,
+            'failed' : {} }
+      for outcome, name, error in self._parallelMap( upload, uploadList ):
+         if error is not None:
+            report[ 'failed' ][ name ] = error
+         else:
+            report[ outcome ] += 1
+      if uploadList:
+         self._invalidateConfigletIndex()
+      return report
 
    def deleteConfiglet( self, configlet ):
       '''Remove a configlet from the Cvp instance
@@ -760,87 +1472,221 @@ class Cvp( object ):
       '''
       assert isinstance( configlet, Configlet )
       self.cvpService.deleteConfiglet( configlet.name, configlet.key )
+      self._invalidateConfigletIndex()
 
-   def updateImageBundle( self, imageBundle, imageNameList ):
-      '''update an image bundle in Cvp instance
+   def updateImageBundle( self, imageBundle, imageNameList, maxParallel=None,
+         progress=None ):
+      '''update an image bundle in Cvp instance. The images are staged as
+      by addImageBundle.
 
       Argument:
          imageBundle -- updated image bundle information.
             ( type : ImageBundle ( class ) )
          imageNameList -- names of the images
+         maxParallel -- number of images hashed or uploaded at once,
+                        maxWorkers by default ( optional ) ( type : int )
+         progress -- upload progress callback, see CvpService.addImage
+                     ( optional ) ( type : callable )
 
       Raises:
          Assertion Error -- if imagebundle is not ImageBundle type
          CvpError -- If image bundle name is invalid
 
-      Returns None
+      Returns:
+         timings -- how each image was staged, see stageImages
+                    ( type : List of Dict )
       '''
       currImageBundle = self.cvpService.getImageBundleByName( imageBundle.name )
       imageBundleKey = currImageBundle[ 'id' ]
-      imageInfoList = []
-      for imageName in imageNameList:
-         imageData = self.addImage( str( imageName ) )
-         imageInfoList.append( imageData )
+      imageInfoList, timings = self.stageImages( imageNameList, maxParallel,
+            progress )
       self.cvpService.updateImageBundle( imageBundle.name, imageBundle.certified,
             imageInfoList, imageBundleKey )
+      return timings
 
-   def addImageBundle( self, imageBundle, imageNameList ):
-      ''' Add an image bundle with an image.
+   def addImageBundle( self, imageBundle, imageNameList, maxParallel=None,
+         progress=None ):
+      ''' Add an image bundle with an image. The images are resolved against
+      a single fetch of the image catalog, the missing ones are uploaded
+      concurrently and the bundle is saved as soon as the last upload
+      completes.
 
       Arguments:
          imageBundle -- image bundle inforamtion object ( type: ImageBundle
          (class ) ) imageNameList -- name of the images in image bundle ( type
          : List od string )
+         maxParallel -- number of images hashed or uploaded at once,
+                        maxWorkers by default ( optional ) ( type : int )
+         progress -- upload progress callback, see CvpService.addImage
+                     ( optional ) ( type : callable )
 
       Raises:
          CvpError -- If image bundle with same name already exists
          Assertion Error -- If imageBundle is not of type ImageBundle
 
-      Returns None
+      Returns:
+         timings -- how each image was staged, see stageImages
+                    ( type : List of Dict )
       '''
       assert isinstance( imageBundle, ImageBundle )
-      imageInfoList = []
-      for imageName in imageNameList:
-         imageData = self.addImage( str( imageName ) )
-         imageInfoList.append( imageData )
+      imageInfoList, timings = self.stageImages( imageNameList, maxParallel,
+            progress )
       self.cvpService.saveImageBundle( imageBundle.name, imageBundle.certified,
             imageInfoList )
+      return timings
 
-   def addImage( self, imageName ):
-      '''Check if image is already present in CVP instance or not.
+   def stageImages( self, imageNameList, maxParallel=None, progress=None ):
+      '''Makes sure every image of imageNameList is present in the Cvp
+      instance. The image catalog is fetched once; images unknown by name are
+      hashed in parallel, and those whose md5 is not in the catalog either
+      are uploaded in parallel, once per distinct content.
+
+      Arguments:
+         imageNameList -- paths of the image files ( type : List of String )
+         maxParallel -- number of images hashed or uploaded at once,
+                        maxWorkers by default ( optional ) ( type : int )
+         progress -- upload progress callback, see CvpService.addImage
+                     ( optional ) ( type : callable )
+
+      Returns:
+         imageInfoList -- information of the images, in the order of
+                          imageNameList ( type : List of Dict )
+         timings -- for each image its name, its status ( 'present',
+                    'duplicate' of an image with the same md5, or
+                    'uploaded' ) and the seconds spent hashing and uploading
+                    it ( type : List of Dict )
+      '''
+      imageNameList = [ str( imageName ) for imageName in imageNameList ]
+      self._invalidateImageIndex()
+      imagesByName, imagesByMd5 = self._getImageIndex()
+      timings = [ { 'name' : os.path.basename( imageName ), 'status' : 'present',
+            'hashSeconds' : 0.0, 'uploadSeconds' : 0.0 }
+            for imageName in imageNameList ]
+      pending = [ index for index, timing in enumerate( timings )
+            if timing[ 'name' ] not in imagesByName ]
+
+      def hashImage( index ):
+         startTime = time.time()
+         md5 = cvpServices.fileMd5( imageNameList[ index ] ).hexdigest()
+         timings[ index ][ 'hashSeconds' ] = time.time() - startTime
+         return md5
+      md5ByIndex = dict( zip( pending, self._parallelMap( hashImage, pending,
+            maxParallel ) ) )
+      uploads = collections.OrderedDict()
+      for index in pending:
+         md5 = md5ByIndex[ index ]
+         if md5 in imagesByMd5 or md5 in uploads:
+            timings[ index ][ 'status' ] = 'duplicate'
+         else:
+            uploads[ md5 ] = index
+
+      def uploadImage( index ):
+         startTime = time.time()
+         imageInfo = self.cvpService.addImage( imageNameList[ index ], progress )
+         timings[ index ][ 'status' ] = 'uploaded'
+         timings[ index ][ 'uploadSeconds' ] = time.time() - startTime
+         return imageInfo
+      uploadedList = self._parallelMap( uploadImage, uploads.values(),
+            maxParallel )
+      for index, imageInfo in zip( uploads.values(), uploadedList ):
+         image = dict( imageInfo, name=timings[ index ][ 'name' ] )
+         imagesByName[ image[ 'name' ] ] = image
+         # by the local md5, the one looked up below, the server may omit it
+         # or spell it differently
+         imagesByMd5[ md5ByIndex[ index ] ] = image
+
+      imageInfoList = []
+      for index, timing in enumerate( timings ):
+         image = imagesByName.get( timing[ 'name' ] )
+         if index in md5ByIndex:
+            image = imagesByMd5[ md5ByIndex[ index ] ]
+         # images uploaded by this call are referenced without a key
+         key = None if md5ByIndex.get( index ) in uploads else image[ 'key' ]
+         imageInfoList.append( self._imageData( image, key ) )
+      return imageInfoList, timings
+
+   @staticmethod
+   def _imageData( image, key ):
+      '''Returns the image information expected in an image bundle, the md5
+      being None if the Cvp instance did not report it'''
+      return { 'name' : image[ 'name' ],
+            'imageSize' : image[ 'imageSize' ],
+            'imageId' : image[ 'imageId' ],
+            'md5' : image.get( 'md5' ),
+            'version' : image[ 'version' ],
+            'key' : key }
+
+   def addImage( self, imageName, progress=None ):
+      '''Check if image is already present in CVP instance or not, by name or
+      by md5 so that a renamed copy of an image is never uploaded twice.
       If not then add the image to the CVP in instance.
 
       Arguments:
          imageName -- name of the image
+         progress -- upload progress callback, see CvpService.addImage
+                     ( optional ) ( type : callable )
 
       Returns:
          imageData -- information of the added image
       '''
-      imageAddFlag = False
-      images = self.cvpService.getImagesInfo()
-      for image in images:
-         if image[ 'name' ] == imageName:
-            imageAddFlag = True
+      name = os.path.basename( imageName )
+      image = self._getImageIndex()[ 0 ].get( name )
+      if image is None:
+         md5 = cvpServices.fileMd5( imageName ).hexdigest()
+         image = self._getImageIndex()[ 1 ].get( md5 )
+         if image is None:
+            # refresh once in case the image was added by someone else
+            self._invalidateImageIndex()
+            imagesByName, imagesByMd5 = self._getImageIndex()
+            image = imagesByName.get( name ) or imagesByMd5.get( md5 )
+      if image is None:
+         imageInfo = self.cvpService.addImage( imageName, progress )
+         imagesByName, imagesByMd5 = self._getImageIndex()
+         imagesByName[ name ] = dict( imageInfo, name=name )
+         # by the local md5, the server may omit it or spell it differently
+         imagesByMd5[ md5 ] = imagesByName[ name ]
+         return self._imageData( imagesByName[ name ], None )
+      return self._imageData( image, image[ 'key' ] )
+
+   def _getImageIndex( self ):
+      '''Returns the index of the images on the Cvp instance, fetching the
+      images if the index was invalidated or is older than IMAGE_INDEX_TTL
+
+      Returns:
+         imagesByName -- images keyed by name ( type : Dict )
+         imagesByMd5 -- images keyed by md5 checksum ( type : Dict )
+      '''
+      # read once, another thread may invalidate the index meanwhile
+      imageIndex = self._imageIndex
+      if imageIndex is None or time.time() - imageIndex[ 0 ] > IMAGE_INDEX_TTL:
+         images = self.cvpService.getImagesInfo()
+         imageIndex = self._imageIndex = ( time.time(),
+               dict( ( image[ 'name' ], image ) for image in images ),
+               dict( ( image[ 'md5' ], image )
+                  for image in images if image.get( 'md5' ) ) )
+      return imageIndex[ 1 : ]
+
+   def _invalidateImageIndex( self ):
+      '''Drops the image index'''
+      self._imageIndex = None
+
+   def _getImageBundleKey( self, imageBundleName ):
+      '''Returns the key of the image bundle, the image bundles being fetched
+      once per change set. A cached list is refreshed once if the bundle is
+      not in it, in case it was created since.
+
+      Raises:
+         CvpError -- If image bundle name is invalid
+      '''
+      for refresh in ( False, True ):
+         imageBundles = self._changeSetLookup( 'imageBundles',
+               self.cvpService.getImageBundles, refresh )
+         for imageBundle in imageBundles:
+            if imageBundle[ 'name' ] == imageBundleName:
+               return imageBundle[ 'key' ]
+         if self.cvpService._activeChangeSet() is None:
             break
-      if imageAddFlag == False:
-         imageInfo = self.cvpService.addImage( imageName )
-         imageData = { 'name' : os.path.basename( imageName ),
-               'imageSize' : imageInfo[ 'imageSize' ],
-               'imageId' : imageInfo[ 'imageId' ],
-               'md5' : imageInfo[ 'md5' ],
-               'version' : imageInfo[ 'version' ],
-               'key' : None }
-         return imageData
-      else:
-         for image in images:
-            if imageName == image['name']:
-               imageData = { 'name' : os.path.basename( imageName ),
-                     'imageSize' : image[ 'imageSize' ],
-                     'imageId' : image[ 'imageId' ],
-                     'md5' : image[ 'md5' ],
-                     'version' : image[ 'version' ],
-                     'key' : image[ 'key' ] }
-         return imageData
+      raise cvpServices.CvpError( errorCodes.INVALID_IMAGE_BUNDLE_NAME )
 
    def mapImageBundleToDevice( self, device, imageBundleName):
       '''Map image Bundle to device
@@ -858,14 +1704,7 @@ class Cvp( object ):
       assert isinstance( device, Device )
       if not imageBundleName:
          return
-      imageBundleKey = ''
-      imageBundles = self.cvpService.getImageBundles()
-      for imageBundle in imageBundles:
-         if imageBundle[ 'name' ] == imageBundleName:
-            imageBundleKey = imageBundle[ 'key' ]
-            break
-      if imageBundleKey == '':
-         raise cvpServices.CvpError( errorCodes.INVALID_IMAGE_BUNDLE_NAME )
+      imageBundleKey = self._getImageBundleKey( imageBundleName )
       self.cvpService.applyImageBundleToDevice( device.key, device.fqdn,
             imageBundleName, imageBundleKey )
 
@@ -886,22 +1725,16 @@ class Cvp( object ):
       assert isinstance( container, Container )
       if not imageBundleName:
          return 'No image bundle name provided'
-      imageBundleKey = ''
-      containerInfo = self._getContainerInfo( container.name )
-      containerKey = containerInfo[ 'key' ]
-      imageBundles = self.cvpService.getImageBundles()
-      for imageBundle in imageBundles:
-         if imageBundle[ 'name' ] == imageBundleName:
-            imageBundleKey = imageBundle[ 'key' ]
-            break
-      if imageBundleKey == '':
-         raise cvpServices.CvpError( errorCodes.INVALID_IMAGE_BUNDLE_NAME )
+      containerKey = self._getContainerKey( container.name )
+      imageBundleKey = self._getImageBundleKey( imageBundleName )
       self.cvpService.applyImageBundleToContainer( container.name, containerKey,
             imageBundleName, imageBundleKey )
 
    def _getConfigKeys( self, configNameList ):
       '''Returns keys for corresponding configlet names in the
-      configNameList
+      configNameList, in the same order. The configlets are fetched once per
+      change set; a cached list is refreshed once if a name is not in it, in
+      case the configlet was created since.
 
       Arguments:
          configNameList -- List of configlet names to be applied
@@ -913,16 +1746,16 @@ class Cvp( object ):
       Returns:
          configKeyList -- List of the configlet keys ( type : List of Strings ) )
       '''
-      configKeyList = []
-      configNum = len( configNameList )
-      configlets = self.cvpService.getConfigletsInfo()
-      for config in configlets:
-         if config[ 'name' ] in configNameList:
-            configNum -= 1
-            configKeyList.append( config[ 'key' ] )
-      if configNum > 0:
-         raise cvpServices.CvpError( errorCodes.INVALID_CONFIGLET_NAME )
-      return configKeyList
+      for refresh in ( False, True ):
+         configlets = self._changeSetLookup( 'configlets',
+               self.cvpService.getConfigletsInfo, refresh )
+         keyByName = dict( ( config[ 'name' ], config[ 'key' ] )
+               for config in configlets )
+         if all( name in keyByName for name in configNameList ):
+            return [ keyByName[ name ] for name in configNameList ]
+         if self.cvpService._activeChangeSet() is None:
+            break
+      raise cvpServices.CvpError( errorCodes.INVALID_CONFIGLET_NAME )
 
    def mapConfigToContainer( self, container , configNameList ):
       '''Map the configlets to container
@@ -942,8 +1775,7 @@ class Cvp( object ):
       if not configNameList:
          return 'No configlets to map'
       configKeyList = self._getConfigKeys( configNameList )
-      containerInfo = self._getContainerInfo( container.name )
-      containerKey = containerInfo[ 'key' ]
+      containerKey = self._getContainerKey( container.name )
       self.cvpService.applyConfigToContainer( container.name, containerKey,
             configNameList, configKeyList )
 
@@ -965,8 +1797,7 @@ class Cvp( object ):
       if not configList:
          return 'No configlets to map'
       configKeyList = self._getConfigKeys( configList )
-      containerInfo = self._getContainerInfo( container.name )
-      containerKey = containerInfo[ 'key' ]
+      containerKey = self._getContainerKey( container.name )
       self.cvpService.removeConfigFromContainer( container.name, containerKey,
             configList, configKeyList )
 
@@ -985,11 +1816,10 @@ class Cvp( object ):
       Returns None
       '''
       assert isinstance( container, Container )
-      parentContainerName = container.parentName
-      parentContainerInfo = self._getContainerInfo( parentContainerName )
-      parentContainerId = parentContainerInfo[ 'key' ]
+      parentContainerId = self._getContainerKey( container.parentName )
       self.cvpService.addContainer( container.name,
             container.parentName, parentContainerId )
+      self._invalidateContainerIndex()
 
    def addDevice( self, device, loginCredentials = None ):
       '''Add the device in proper container in Cvp Inventory
@@ -1028,19 +1858,15 @@ class Cvp( object ):
       '''
 
       parentContainerName = device.containerName
-      if parentContainerName == 'Undefined':
-         parentContainerId = 'undefined_container'
-      else:
-         parentContainerInfo = self._getContainerInfo( parentContainerName )
-         parentContainerId = parentContainerInfo[ 'key' ]
+      parentContainerId = self._getContainerKey( parentContainerName )
       status = self._getDeviceStatus( device )
       if not status:
          self.cvpService.addToInventory( device.ipAddress, parentContainerName,
                parentContainerId )
-         status = self._getDeviceStatus( device )
-         while status[ 'status' ] == 'Connecting':
-            status = self._getDeviceStatus( device )
+         status = self._waitForDevices( [ device ] )[ 0 ]
       self.cvpService.saveInventory()
+      if not status:
+         raise cvpServices.CvpError( errorCodes.DEVICE_CONNECTION_ATTEMPT_FAILURE )
       if status[ 'status' ] == 'Duplicate' :
          self.cvpService.deleteDuplicateDevice( status[ 'key' ] )
       elif status[ 'status' ] == 'Connected' :
@@ -1052,12 +1878,14 @@ class Cvp( object ):
       else:
          raise cvpServices.CvpError( errorCodes.DEVICE_CONNECTION_ATTEMPT_FAILURE )
 
-   def addDevices( self, deviceList ):
+   def addDevices( self, deviceList, callback=None ):
       '''Adding devices to the inventory in pipeline manner
 
       Argument:
          deviceList -- List of devices to be added to inventory
                ( type : List of Device objects )
+         callback -- called as callback( device, status ) as soon as the final
+               status of each device is known, see addDevicesIter ( optional )
 
       Raises:
          Assertion Error -- If device objects are not of type Device
@@ -1074,35 +1902,100 @@ class Cvp( object ):
       connectedDeviceList = []
       unauthorisedDeviceList = []
       connFailureDeviceList = []
+      deviceStatus = {}
+      for device, status in self.addDevicesIter( deviceList ):
+         deviceStatus[ id( device ) ] = status
+         if callback:
+            callback( device, status )
       for device in deviceList:
-         assert isinstance( device, Device )
-         parentContainerName = device.containerName
-         if parentContainerName == 'Undefined':
-            parentContainerId = 'undefined_container'
-         else:
-            parentContainerInfo = self._getContainerInfo( parentContainerName )
-            parentContainerId = parentContainerInfo[ 'key' ]
-         status = self._getDeviceStatus( device )
-         if not status:
-            self.cvpService.addToInventory( device.ipAddress, parentContainerName,
-                  parentContainerId )
-
-      for device in deviceList:
-         status = self._getDeviceStatus( device )
-         while status[ 'status' ] == 'Connecting' :
-            status = self._getDeviceStatus( device )
-         if status[ 'status' ] == 'Connected':
+         status = deviceStatus[ id( device ) ]
+         if status in ( 'Connected', 'Duplicate' ):
             connectedDeviceList.append( device )
-         elif status[ 'status' ] == 'Login':
+         elif status == 'Login':
             unauthorisedDeviceList.append( device )
-         elif status[ 'status' ] == 'Duplicate':
-            connectedDeviceList.append( device )
-            self.cvpService.deleteDuplicateDevice( status[ 'key' ] )
          else:
             connFailureDeviceList.append( device )
-      self.cvpService.saveInventory()
       return ( connectedDeviceList, unauthorisedDeviceList, connFailureDeviceList )
 
+   def addDevicesIter( self, deviceList ):
+      '''Adds devices to the inventory and returns a generator yielding each
+      of them as soon as its final status is known, so that it can be
+      configured while the other devices are still connecting. The devices
+      are validated and added before returning, their status is only polled
+      as the generator is consumed. Connected devices are saved in the
+      inventory and duplicates are deleted before being yielded; the
+      inventory is saved at least once.
+
+      Argument:
+         deviceList -- List of devices to be added to inventory
+               ( type : List of Device objects )
+
+      Raises:
+         Assertion Error -- If device objects are not of type Device
+         CvpError -- If parent container name is invalid, before any device
+                     is added
+
+      Returns:
+         generator of ( device, status ) tuples, status being one of
+         'Connected', 'Duplicate', 'Login' or 'Failed'
+      '''
+      deviceList = list( deviceList )
+      containerKeys = []
+      for device in deviceList:
+         assert isinstance( device, Device )
+         containerKeys.append( self._getContainerKey( device.containerName ) )
+      _, tempDevices = self.cvpService.retrieveInventory()
+      statusLookup = cvpPollers.DeviceStatusPoller.statusLookup( tempDevices )
+      poller = cvpPollers.DeviceStatusPoller( self.cvpService, self.deviceTimeout )
+      for device, parentContainerId in zip( deviceList, containerKeys ):
+         if not statusLookup( device ):
+            self.cvpService.addToInventory( device.ipAddress,
+                  device.containerName, parentContainerId )
+         poller.add( device )
+      return self._deviceStatusIter( poller )
+
+   def _deviceStatusIter( self, poller ):
+      '''Yields the ( device, status ) tuples of the devices being added, batch
+      by batch, saving the inventory after each batch which connected devices
+      and once at the end if none did'''
+      saved = False
+      for batch in poller.iterBatches():
+         resultList = []
+         saveInventory = False
+         for device, deviceInfo in batch:
+            status = deviceInfo[ 'status' ] if deviceInfo else 'Failed'
+            if status == 'Duplicate':
+               self.cvpService.deleteDuplicateDevice( deviceInfo[ 'key' ] )
+            elif status not in ( 'Connected', 'Login' ):
+               status = 'Failed'
+            saveInventory = saveInventory or status in ( 'Connected', 'Duplicate' )
+            resultList.append( ( device, status ) )
+         if saveInventory:
+            self.cvpService.saveInventory()
+            saved = True
+         for result in resultList:
+            yield result
+      if not saved:
+         self.cvpService.saveInventory()
+
+   def _waitForDevices( self, deviceList ):
+      '''Waits for the devices to leave the connecting state, polling the
+      status of all of them at once with an increasing interval, for at most
+      deviceTimeout seconds
+
+      Arguments:
+         deviceList -- devices being added ( type : List of Device( class ) )
+
+      Returns:
+         statusList -- final status of each device, in the order of deviceList,
+               the last known status ( or None ) for devices still connecting
+               at the deadline ( type : List of Dict )
+      '''
+      poller = cvpPollers.DeviceStatusPoller( self.cvpService, self.deviceTimeout )
+      futures = [ poller.add( device ) for device in deviceList ]
+      poller.wait()
+      return [ future.result() for future in futures ]
+
    def _getDeviceStatus( self, device ):
       '''Retrieve the device status from the Cvp instance
 
@@ -1148,12 +2041,10 @@ class Cvp( object ):
       for username in loginCredentials:
          self.cvpService.retryAddToInventory( deviceKey,
                device.ipAddress, username, loginCredentials[ username ] )
-         status = self._getDeviceStatus( device )
-         while status[ 'status' ] == 'Connecting':
-            status = self._getDeviceStatus( device )
-         if status[ 'status' ] == 'Connected':
+         status = self._waitForDevices( [ device ] )[ 0 ]
+         if status and status[ 'status' ] == 'Connected':
             break
-      if status[ 'status' ] == 'Login':
+      if status and status[ 'status' ] == 'Login':
          raise cvpServices.CvpError( errorCodes.DEVICE_INVALID_LOGIN_CREDENTIALS )
 
    def mapConfigToDevice( self, device , configList ):
@@ -1171,7 +2062,7 @@ class Cvp( object ):
          CvpError -- If device information is incorrect
          CvpError -- If configList contains invalid configlet name
       '''
-      self.cvpService.saveInventory()
+      self._changeSetLookup( 'saveInventory', self.cvpService.saveInventory )
       if not configList :
          return 'No configlet in configlet List'
       configKeyList = self._getConfigKeys( configList )
@@ -1179,17 +2070,45 @@ class Cvp( object ):
       self.cvpService.applyConfigToDevice( device.ipAddress,
             device.fqdn, device.key, configList, configKeyList )
 
-   def executeAllPendingTask( self ):
-      '''Executes all the pending tasks.
+   def executeAllPendingTask( self, maxInFlight=None, groupBy=None,
+         maxPerGroup=None ):
+      '''Executes all the pending tasks, several of them at once.
 
-      Arguments None
+      Arguments:
+         maxInFlight -- maximum number of tasks being executed at once,
+               defaults to maxWorkers ( optional ) ( type : int )
+         groupBy -- 'container' or 'device', groups the tasks by the parent
+               container or by the device they apply to. Groups are served in
+               round robin ( optional ) ( type : String )
+         maxPerGroup -- maximum number of tasks of the same group being
+               executed at once ( optional ) ( type : int )
 
-      Returns None
+      Returns:
+         failures -- CvpError raised for each task which could not be
+               executed, keyed by work order Id ( type : Dict )
       '''
       tasks = self.cvpService.getTasks()
-      for task in tasks:
-         if task['workOrderUserDefinedStatus'] == 'Pending':
-            self.executeTask( task[ 'workOrderId' ] )
+      pendingTasks = [ task for task in tasks
+            if task['workOrderUserDefinedStatus'] == 'Pending' ]
+      groupKey = None
+      if groupBy == 'device':
+         groupKey = self._taskDeviceKey
+      elif groupBy == 'container':
+         _, deviceContainers = self.cvpService.getInventory()
+         groupKey = lambda task: deviceContainers.get(
+               self._taskDeviceKey( task ) )
+      elif groupBy is not None:
+         raise ValueError( 'groupBy must be container or device' )
+      scheduler = taskScheduler.TaskScheduler(
+            lambda task: self.executeTask( task[ 'workOrderId' ] ),
+            maxInFlight or self.maxWorkers, groupKey, maxPerGroup )
+      return scheduler.run( pendingTasks )
+
+   @staticmethod
+   def _taskDeviceKey( task ):
+      '''Returns the mac address of the device a task applies to'''
+      details = task.get( 'workOrderDetails' ) or {}
+      return details.get( 'netElementId' )
 
    def executeTask( self, taskId ):
       '''Executes task having id taskId.
@@ -1222,24 +2141,49 @@ class Cvp( object ):
                task['description'] ) )
       return taskList
 
-   def monitorTaskStatus( self, taskIdList ):
-      '''Get information about the tasks whose Id is present in taskIdList
+   def watchTasks( self, taskIdList, callback=None, timeout=None ):
+      '''Starts watching the tasks whose Id is present in taskIdList. The
+      returned watcher polls the Cvp instance when its wait() method is
+      called and reports the task throughput.
 
       Argument:
-         taskId -- Id of the task
+         taskIdList -- Work order Ids of the tasks ( type : List of String )
+         callback -- called with the details of each task once it completed
+                     or failed ( optional ) ( type : callable )
+         timeout -- seconds after which the watcher gives up ( optional )
 
       Returns:
-         taskStatus -- Current status of the task
+         taskWatcher -- watcher of the tasks ( type : TaskWatcher )
       '''
-      tasks = self.cvpService.getTasks()
-      while len( taskIdList ) > 0 :
-         for task in tasks:
-            if task[ 'workOrderId' ] in taskIdList:
-               if ( task['workOrderUserDefinedStatus'] == 'Completed' or
-                     task['workOrderUserDefinedStatus'] == 'Failed' ):
-                  taskIdList.remove( str ( task[ 'workOrderId' ] ) )
-                  break
-         tasks = self.cvpService.getTasks()
+      taskWatcher = cvpPollers.TaskWatcher( self.cvpService, timeout,
+            maxWorkers=self.maxWorkers )
+      for taskId in taskIdList:
+         taskWatcher.watch( taskId, callback )
+      return taskWatcher
+
+   def monitorTaskStatus( self, taskIdList, callback=None, timeout=None ):
+      '''Waits for the tasks whose Id is present in taskIdList to complete
+      or fail
+
+      Argument:
+         taskIdList -- Work order Ids of the tasks ( type : List of String )
+         callback -- called with the details of each task once it completed
+                     or failed ( optional ) ( type : callable )
+         timeout -- seconds after which monitoring stops ( optional )
+
+      Returns:
+         taskStatus -- final status of each task, keyed by task Id, None for
+                       tasks never seen ( type : Dict )
+      '''
+      taskWatcher = self.watchTasks( taskIdList, callback, timeout )
+      futures = [ ( str( taskId ), taskWatcher.watch( taskId ) )
+            for taskId in taskIdList ]
+      taskWatcher.wait()
+      taskStatus = {}
+      for taskId, future in futures:
+         task = future.result()
+         taskStatus[ taskId ] = task[ 'workOrderUserDefinedStatus' ] if task else None
+      return taskStatus
 
    def getImageBundles( self ):
       '''Retrieves information on all the image bundles.Image bundle information
@@ -1297,12 +2241,17 @@ class Cvp( object ):
       '''
       assert isinstance( imageBundle, ImageBundle )
       self.cvpService.deleteImageBundle( imageBundle.key, imageBundle.name )
+      # the images of the bundle may have been deleted along with it
+      self._invalidateImageIndex()
 
-   def deviceComplainceCheck( self, deviceIpAddress ):
+   def deviceComplainceCheck( self, deviceIpAddress, snapshot=None ):
       '''Run compliance check on the device
 
       Argument:
          deviceIpAddress -- Ip address of the device.
+         snapshot -- take the device and configlet keys from this snapshot
+            instead of the Cvp instance ( optional )
+            ( type : CvpSnapshot ( class ) )
 
       Returns:
          complianceCheck -- Boolean flag indicating successful or un-successful
@@ -1311,8 +2260,12 @@ class Cvp( object ):
       Raises:
          CvpError -- If device mac address ( deviceMacAddress ) is invalid
       '''
-      device = self.getDevice( deviceIpAddress )
-      configIdList = self._getConfigKeys( device.configlets )
+      device = self.getDevice( deviceIpAddress, snapshot )
+      if snapshot is not None:
+         configIdList = [ snapshot.configlet( configName ).key
+               for configName in device.configlets ]
+      else:
+         configIdList = self._getConfigKeys( device.configlets )
       complianceReport = self.cvpService.deviceComplianceCheck( configIdList,
             device.key )
       if complianceReport[ 'complianceIndication' ] != 'NONE' :
@@ -1321,6 +2274,103 @@ class Cvp( object ):
          complianceCheck = True
       return complianceCheck
 
+   def complianceSweep( self, deviceFilter=None, callback=None,
+         maxWorkers=None, snapshot=None ):
+      '''Runs the compliance check on all the devices, or those selected by
+      deviceFilter, see complianceSweepIter
+
+      Arguments:
+         deviceFilter -- ip addresses of the devices to be checked, or called
+                         with each Device and returning whether to check it
+                         ( optional ) ( type : List of String or callable )
+         callback -- called as callback( device, compliant, error ) as soon
+                     as each device has been checked ( optional )
+         maxWorkers -- number of checks in flight at once, maxWorkers by
+                       default ( optional ) ( type : int )
+         snapshot -- take the devices and configlet keys from this snapshot
+                     ( optional ) ( type : CvpSnapshot ( class ) )
+
+      Returns:
+         summary -- number of devices checked, compliant, non compliant and
+                    failed, ip addresses of the non compliant devices, the
+                    exception of each failed device by ip address and the
+                    seconds taken ( type : Dict )
+      '''
+      startTime = time.time()
+      summary = { 'checked' : 0, 'compliant' : 0, 'nonCompliant' : 0,
+            'failed' : 0, 'nonCompliantDevices' : [], 'failures' : {} }
+      for device, compliant, error in self.complianceSweepIter( deviceFilter,
+            maxWorkers, snapshot ):
+         summary[ 'checked' ] += 1
+         if error is not None:
+            summary[ 'failed' ] += 1
+            summary[ 'failures' ][ device.ipAddress ] = error
+         elif compliant:
+            summary[ 'compliant' ] += 1
+         else:
+            summary[ 'nonCompliant' ] += 1
+            summary[ 'nonCompliantDevices' ].append( device.ipAddress )
+         if callback:
+            callback( device, compliant, error )
+      summary[ 'elapsed' ] = time.time() - startTime
+      return summary
+
+   def complianceSweepIter( self, deviceFilter=None, maxWorkers=None,
+         snapshot=None ):
+      '''Runs the compliance check on all the devices, or those selected by
+      deviceFilter, and yields each of them as soon as its check completes.
+      The devices and their configlet keys are taken from a single snapshot
+      and the checks run from a pool of maxWorkers threads.
+
+      Arguments:
+         deviceFilter -- ip addresses of the devices to be checked, or called
+                         with each Device and returning whether to check it
+                         ( optional ) ( type : List of String or callable )
+         maxWorkers -- number of checks in flight at once, maxWorkers by
+                       default ( optional ) ( type : int )
+         snapshot -- take the devices and configlet keys from this snapshot
+                     ( optional ) ( type : CvpSnapshot ( class ) )
+
+      Returns:
+         Generator of ( device, compliant, error ) tuples, compliant being
+         None and error the exception raised when the check failed, such as
+         a CvpError, a connection error or a KeyError for a configlet not in
+         the snapshot
+      '''
+      if snapshot is None:
+         snapshot = self.snapshot()
+      if deviceFilter is None:
+         deviceList = list( snapshot.devices )
+      elif callable( deviceFilter ):
+         deviceList = [ device for device in snapshot.devices
+               if deviceFilter( device ) ]
+      else:
+         deviceList = [ snapshot.deviceByIp( ipAddress )
+               for ipAddress in deviceFilter ]
+      configKeys = dict( ( configlet.name, configlet.key )
+            for configlet in snapshot.configlets )
+
+      def check( device ):
+         try:
+            configIdList = [ configKeys[ configName ]
+                  for configName in device.configlets or [] ]
+            complianceReport = self.cvpService.deviceComplianceCheck(
+                  configIdList, device.key )
+         except Exception as e:
+            # a failure must not abort the other checks of the sweep
+            return device, None, e
+         return device, complianceReport[ 'complianceIndication' ] == 'NONE', None
+
+      if not deviceList:
+         return
+      pool = ThreadPool( min( maxWorkers or self.maxWorkers, len( deviceList ) ) )
+      try:
+         for result in pool.imap_unordered( check, deviceList ):
+            yield result
+      finally:
+         pool.terminate()
+         pool.join()
+
    def renameContainer( self, oldContainerName, newContainerName ):
       ''' Renames the container to desired new name
 
@@ -1333,9 +2383,10 @@ class Cvp( object ):
       Raises:
          CvpError -- If the oldContainerName is invalid
       '''
-      containerKey = self._getContainerInfo( oldContainerName )[ 'key' ]
+      containerKey = self._getContainerKey( oldContainerName )
       self.cvpService.changeContainerName( oldContainerName, newContainerName,
             containerKey )
+      self._invalidateContainerIndex()
 
    def getRootContainerInfo( self ):
       ''' Returns information about the root container
@@ -1363,14 +2414,11 @@ class Cvp( object ):
       Returns None
       '''
       assert isinstance( container, Container )
-      containerKey = ''
-      parentKey = ''
-      containerInfo = self._getContainerInfo( container.name )
-      containerKey = containerInfo[ 'key' ]
-      parentInfo = self._getContainerInfo( container.parentName )
-      parentKey = parentInfo[ 'key' ]
+      containerKey = self._getContainerKey( container.name )
+      parentKey = self._getContainerKey( container.parentName )
       self.cvpService.deleteContainer( container.name, containerKey,
             container.parentName, parentKey )
+      self._invalidateContainerIndex()
 
    def deleteDevice( self, device ):
       '''Delete the device from the Cvp inventory.
@@ -1385,9 +2433,5 @@ class Cvp( object ):
       Returns: None
       '''
       assert isinstance( device, Device )
-      if device.containerName == 'Undefined':
-         containerKey = 'undefined_container'
-      else:
-         containerInfo = self._getContainerInfo( device.containerName )
-         containerKey = containerInfo[ 'key' ]
+      containerKey = self._getContainerKey( device.containerName )
       self.cvpService.deleteDevice( device.key, device.containerName, containerKey )
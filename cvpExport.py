@@ -0,0 +1,245 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+CvpExport.py dumps the state of a Cvp instance as a JSON Lines stream, one
+record per line, written while the state is being fetched:
+
+   { "type" : "header", "data" : { "version" : 1, "timestamp" : ... } }
+   { "type" : "container", "data" : { ... Container.jsonable() ... } }
+   { "type" : "device", "data" : { ... Device.jsonable() ... } }
+   ...
+   { "type" : "summary", "data" : { "container" : 12, "device" : 3000, ... } }
+
+The parts ( containers, devices, configlets, images, image bundles and
+tasks ) are fetched concurrently and the per-configlet and per-bundle
+lookups run from a bounded pool. Records go through a bounded queue to a
+single writer, so that memory stays bounded whatever the size of the fleet.
+Files ending with .gz are compressed.
+
+The configlet and image bundle mappings are carried by the containerList
+and deviceList of the configlet and image bundle records; the configlets
+and imageBundle fields of the container and device records are left empty
+so that they can be written before every mapping is known.
+
+It contains 1 class
+   CvpExporter -- Streams the state of a Cvp instance to a file
+'''
+import gzip
+import json
+import Queue
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import cvp
+
+EXPORT_VERSION = 1
+DEFAULT_QUEUE_SIZE = 1000
+PARTS = ( 'containers', 'devices', 'configlets', 'images', 'imageBundles',
+      'tasks' )
+# marks the end of the records of a part in the queue
+_PART_DONE = object()
+
+def openExport( filePath, mode='rb' ):
+   '''Opens an export file, through gzip if its name ends with .gz'''
+   if filePath.endswith( '.gz' ):
+      return gzip.open( filePath, mode )
+   return open( filePath, mode )
+
+def readExport( filePath ):
+   '''Reads an export file record by record
+
+   Arguments:
+      filePath -- path of the export ( type : String )
+
+   Returns:
+      Generator of ( record type, record data ) tuples
+   '''
+   with openExport( filePath ) as exportFile:
+      for line in exportFile:
+         if line.strip():
+            record = json.loads( line )
+            yield record[ 'type' ], record[ 'data' ]
+
+class CvpExporter( object ):
+   '''CvpExporter class streams the state of a Cvp instance.
+
+   Public methods:
+      export( filePath, parts )
+      iterRecords( parts )
+
+   Instance variables:
+      cvp -- Cvp instance to be exported ( type : Cvp ( class ) )
+      maxWorkers -- number of lookups in flight at once
+      queueSize -- maximum number of records fetched but not written yet
+   '''
+   def __init__( self, cvpInstance, maxWorkers=None,
+         queueSize=DEFAULT_QUEUE_SIZE ):
+      self.cvp = cvpInstance
+      self.cvpService = cvpInstance.cvpService
+      self.maxWorkers = maxWorkers or cvpInstance.maxWorkers
+      self.queueSize = queueSize
+      self._indexLock = threading.Lock()
+      self._containerIndex = None
+
+   def export( self, filePath, parts=PARTS ):
+      '''Writes the records of parts to filePath, compressed if its name ends
+      with .gz
+
+      Arguments:
+         filePath -- path of the export ( type : String )
+         parts -- parts to be exported ( type : List of String )
+
+      Raises:
+         CvpError -- If a part cannot be fetched
+
+      Returns:
+         counts -- number of records written per record type ( type : Dict )
+      '''
+      counts = {}
+      with openExport( filePath, 'wb' ) as exportFile:
+         for recordType, data in self.iterRecords( parts ):
+            exportFile.write( json.dumps( { 'type' : recordType, 'data' : data },
+               default=cvp.encoder ) + '\n' )
+            if recordType != 'header':
+               counts[ recordType ] = counts.get( recordType, 0 ) + 1
+         exportFile.write( json.dumps( { 'type' : 'summary',
+            'data' : counts } ) + '\n' )
+      return counts
+
+   def iterRecords( self, parts=PARTS ):
+      '''Fetches parts concurrently and yields their records as they arrive
+
+      Arguments:
+         parts -- parts to be exported ( type : List of String )
+
+      Raises:
+         CvpError -- If a part cannot be fetched
+
+      Returns:
+         Generator of ( record type, model or Dict ) tuples
+      '''
+      yield 'header', { 'version' : EXPORT_VERSION, 'timestamp' : time.time(),
+            'host' : self.cvpService.hostname, 'parts' : list( parts ) }
+      records = Queue.Queue( self.queueSize )
+      stop = threading.Event()
+      pool = ThreadPool( self.maxWorkers )
+      producers = [ threading.Thread( target=self._produce,
+            args=( part, records, stop, pool ) ) for part in parts ]
+      for producer in producers:
+         producer.daemon = True
+         producer.start()
+      try:
+         pending = len( producers )
+         while pending:
+            record = records.get()
+            if record is _PART_DONE:
+               pending -= 1
+            elif isinstance( record, Exception ):
+               raise record
+            else:
+               yield record
+      finally:
+         stop.set()
+         for producer in producers:
+            producer.join()
+         pool.terminate()
+         pool.join()
+
+   def _produce( self, part, records, stop, pool ):
+      '''Body of the thread fetching one part'''
+      def put( record ):
+         while not stop.is_set():
+            try:
+               records.put( record, timeout=0.1 )
+               return True
+            except Queue.Full:
+               pass
+         return False
+      try:
+         for record in getattr( self, '_%sRecords' % part )( pool ):
+            if not put( record ):
+               return
+      except Exception as e:
+         put( e )
+      put( _PART_DONE )
+
+   def _boundedMap( self, pool, func, itemList ):
+      '''Like pool.imap, but at most a few windows of maxWorkers results are
+      held at once'''
+      window = self.maxWorkers * 4
+      for index in range( 0, len( itemList ), window ):
+         for result in pool.imap( func, itemList[ index : index + window ] ):
+            yield result
+
+   def _getContainerIndex( self ):
+      '''Returns the container index, fetched once for all the parts'''
+      with self._indexLock:
+         if self._containerIndex is None:
+            rootContainer, _ = self.cvpService.retrieveInventory()
+            self._containerIndex = cvp.ContainerIndex( rootContainer )
+         return self._containerIndex
+
+   def _containersRecords( self, pool ):
+      '''Yields the containers, parents first'''
+      containerIndex = self._getContainerIndex()
+      stack = [ containerIndex.rootName ]
+      while stack:
+         name = stack.pop()
+         key = containerIndex.key( name )
+         yield 'container', cvp.Container( name, key,
+               containerIndex.parentKey( key ), [], '',
+               containerIndex.parentName( name ) )
+         stack.extend( reversed( containerIndex.children( name ) ) )
+
+   def _devicesRecords( self, pool ):
+      '''Yields the devices of the inventory'''
+      devices, deviceContainers = self.cvpService.getInventory()
+      containerIndex = self._getContainerIndex()
+      for dut in devices:
+         containerName = deviceContainers.get( dut[ 'key' ], '' )
+         yield 'device', cvp.Device( dut[ 'ipAddress' ], dut[ 'fqdn' ],
+               dut[ 'key' ], containerName,
+               containerIndex.nameToKey.get( containerName, '' ), '', [] )
+
+   def _configletsRecords( self, pool ):
+      '''Yields the configlets with their mappings, looked up from the pool'''
+      def lookup( config ):
+         containers = self.cvpService.configAppliedContainers( config[ 'name' ] )
+         devices = self.cvpService.configAppliedDevices( config[ 'name' ] )
+         return cvp.Configlet( config[ 'name' ], config[ 'config' ],
+               config[ 'key' ], [ container[ 'containerName' ]
+               for container in containers ],
+               [ device[ 'ipAddress' ] for device in devices ] )
+      for configlet in self._boundedMap( pool, lookup,
+            self.cvpService.getConfigletsInfo() ):
+         yield 'configlet', configlet
+
+   def _imagesRecords( self, pool ):
+      '''Yields the images'''
+      for image in self.cvpService.getImagesInfo():
+         yield 'image', cvp.Image( image[ 'name' ], image[ 'key' ],
+               image[ 'imageId' ] )
+
+   def _imageBundlesRecords( self, pool ):
+      '''Yields the image bundles with their mappings, looked up from the
+      pool'''
+      def lookup( bundle ):
+         containers = self.cvpService.imageBundleAppliedContainers(
+               bundle[ 'name' ] )
+         devices = self.cvpService.imageBundleAppliedDevices( bundle[ 'name' ] )
+         return cvp.ImageBundle( bundle[ 'name' ], bundle[ 'key' ],
+               bundle[ 'imageIds' ], bundle[ 'isCertifiedImageBundle' ],
+               [ container[ 'containerName' ] for container in containers ],
+               [ device[ 'ipAddress' ] for device in devices ] )
+      for imageBundle in self._boundedMap( pool, lookup,
+            self.cvpService.getImageBundles() ):
+         yield 'imageBundle', imageBundle
+
+   def _tasksRecords( self, pool ):
+      '''Yields the tasks'''
+      for task in self.cvpService.getTasks():
+         yield 'task', cvp.Task( str( task[ 'workOrderId' ] ),
+               task[ 'description' ] )
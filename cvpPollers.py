@@ -0,0 +1,421 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+CvpPollers contains the pollers used to wait for state changes in the Cvp
+instance without hammering the web server. Each poll fetches the state of all
+the watched objects at once, the interval between polls grows while nothing
+changes, and the result of each watched object is delivered through a Future.
+
+It contains 4 classes
+   Future -- Result which becomes available later
+   Backoff -- Adaptive polling interval
+   DeviceStatusPoller -- Waits for devices being added to the inventory
+   TaskWatcher -- Waits for tasks to complete
+'''
+import collections
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_DEVICE_DEADLINE = 600
+DEFAULT_TASK_WORKERS = 4
+# Above this number of pending tasks one getTasks request is cheaper than
+# one getTaskById request per task
+DEFAULT_TASK_BULK_THRESHOLD = 50
+TERMINAL_TASK_STATES = ( 'Completed', 'Failed', 'Cancelled' )
+DEFAULT_MIN_INTERVAL = 0.5
+DEFAULT_MAX_INTERVAL = 10
+DEFAULT_BACKOFF_FACTOR = 1.5
+
+class Future( object ):
+   '''Future class holds a result which becomes available later, once the
+   poller which created it resolves it.
+
+   Public methods:
+      done()
+      result( timeout )
+      addDoneCallback( callback )
+      setResult( result )
+   '''
+   def __init__( self ):
+      self._event = threading.Event()
+      self._lock = threading.Lock()
+      self._result = None
+      self._callbacks = []
+
+   def done( self ):
+      '''Returns True once the result is available'''
+      return self._event.is_set()
+
+   def result( self, timeout=None ):
+      '''Waits for the result and returns it
+
+      Arguments:
+         timeout -- maximum time to wait in seconds ( optional ) ( type : float )
+
+      Returns:
+         result -- the result, None if it is not available after timeout
+      '''
+      self._event.wait( timeout )
+      return self._result
+
+   def addDoneCallback( self, callback ):
+      '''Calls callback( result ) once the result is available, immediately if
+      it already is'''
+      with self._lock:
+         if not self._event.is_set():
+            self._callbacks.append( callback )
+            return
+      callback( self._result )
+
+   def setResult( self, result ):
+      '''Makes result available and runs the registered callbacks'''
+      with self._lock:
+         self._result = result
+         self._event.set()
+         callbacks, self._callbacks = self._callbacks, []
+      for callback in callbacks:
+         callback( result )
+
+class Backoff( object ):
+   '''Backoff class computes polling intervals which grow geometrically from
+   minInterval up to maxInterval, and start over when reset.
+
+   Public methods:
+      next()
+      reset()
+   '''
+   def __init__( self, minInterval=DEFAULT_MIN_INTERVAL,
+         maxInterval=DEFAULT_MAX_INTERVAL, factor=DEFAULT_BACKOFF_FACTOR ):
+      self.minInterval = minInterval
+      self.maxInterval = maxInterval
+      self.factor = factor
+      self.interval = minInterval
+
+   def next( self ):
+      '''Returns the interval to wait before the next poll'''
+      interval = self.interval
+      self.interval = min( self.interval * self.factor, self.maxInterval )
+      return interval
+
+   def reset( self ):
+      '''Goes back to the shortest interval, used when a poll made progress'''
+      self.interval = self.minInterval
+
+class DeviceStatusPoller( object ):
+   '''DeviceStatusPoller class waits for devices being added to the Cvp
+   inventory to leave the 'Connecting' state. A single retrieveInventory
+   request per poll serves all the pending devices, the temporary devices it
+   returns being indexed by ip address and short host name.
+
+   Public methods:
+      statusLookup( tempDevices )
+      add( device )
+      poll()
+      wait()
+      iterResults()
+      iterBatches()
+
+   Instance variables:
+      cvpService -- CvpService instance used for polling
+      timeout -- seconds, counted from the first poll, after which devices
+                 still pending are given up on
+      deadline -- time after which devices still pending are given up on, None
+                  until the first poll
+      backoff -- polling interval policy ( type : Backoff )
+   '''
+   def __init__( self, cvpService, timeout=DEFAULT_DEVICE_DEADLINE,
+         backoff=None ):
+      '''Constructer for the DeviceStatusPoller class
+
+      Arguments:
+         cvpService -- CvpService instance ( type : CvpService ( class ) )
+         timeout -- seconds after which devices still connecting are given up
+                    on, counted from the first poll so that the time spent
+                    adding the devices does not eat into it ( type : float )
+         backoff -- polling interval policy ( optional ) ( type : Backoff )
+      '''
+      self.cvpService = cvpService
+      self.timeout = timeout
+      self.deadline = None
+      self.backoff = backoff or Backoff()
+      self._pending = []
+      self._lastStatus = {}
+      self._ready = collections.deque()
+      self._polled = False
+
+   @staticmethod
+   def statusLookup( tempDevices ):
+      '''Indexes the temporary devices returned by retrieveInventory
+
+      Arguments:
+         tempDevices -- temporary devices ( type : List of Dict )
+
+      Returns:
+         lookup -- function returning the status of a device, matched by ip
+                   address or short host name, or None ( type : callable )
+      '''
+      byIpAddress = {}
+      byHostName = {}
+      for deviceInfo in tempDevices:
+         byIpAddress.setdefault( deviceInfo[ 'ipAddress' ], deviceInfo )
+         byHostName.setdefault( deviceInfo[ 'fqdn' ], deviceInfo )
+      def lookup( device ):
+         status = byIpAddress.get( device.ipAddress )
+         if status is None and device.fqdn:
+            status = byHostName.get( device.fqdn.split( '.' )[ 0 ] )
+         return status
+      return lookup
+
+   def add( self, device ):
+      '''Starts watching device
+
+      Arguments:
+         device -- device being added ( type : Device ( class ) )
+
+      Returns:
+         future -- resolved with the status of the device ( type : Dict ) once
+                   it is no longer connecting, with its last known status ( or
+                   None ) if the deadline passes first ( type : Future )
+      '''
+      future = Future()
+      self._pending.append( ( device, future ) )
+      return future
+
+   def _resolve( self, device, future, status ):
+      '''Resolves the future of device and queues the result for
+      iterResults'''
+      future.setResult( status )
+      self._ready.append( ( device, status ) )
+
+   def poll( self ):
+      '''Fetches the status of all pending devices once and resolves the
+      futures of the devices which are no longer connecting
+
+      Returns:
+         resolved -- number of devices resolved by this poll ( type : int )
+      '''
+      if self.deadline is None:
+         self.deadline = time.time() + self.timeout
+      _, tempDevices = self.cvpService.retrieveInventory()
+      self._polled = True
+      lookup = self.statusLookup( tempDevices )
+      stillPending = []
+      for device, future in self._pending:
+         status = lookup( device )
+         if status is None or status[ 'status' ] == 'Connecting':
+            self._lastStatus[ id( device ) ] = status
+            stillPending.append( ( device, future ) )
+         else:
+            self._resolve( device, future, status )
+      resolved = len( self._pending ) - len( stillPending )
+      self._pending = stillPending
+      return resolved
+
+   def _step( self ):
+      '''Polls, first sleeping for the backoff interval unless this is the
+      first poll. Devices still pending at the deadline are resolved with
+      their last known status.'''
+      if self._polled:
+         remaining = self.deadline - time.time()
+         if remaining > 0:
+            time.sleep( min( self.backoff.next(), remaining ) )
+      if time.time() >= self.deadline and self._polled:
+         for device, future in self._pending:
+            self._resolve( device, future,
+                  self._lastStatus.get( id( device ) ) )
+         self._pending = []
+         return
+      if self.poll():
+         self.backoff.reset()
+
+   def wait( self ):
+      '''Polls until no device is pending any more
+
+      Returns: None
+      '''
+      for _ in self.iterResults():
+         pass
+
+   def iterResults( self ):
+      '''Polls until no device is pending any more, yielding each device as
+      soon as its final status is known
+
+      Returns:
+         generator of ( device, status ) tuples
+      '''
+      for batch in self.iterBatches():
+         for result in batch:
+            yield result
+
+   def iterBatches( self ):
+      '''Polls until no device is pending any more, yielding the devices
+      resolved by each poll together
+
+      Returns:
+         generator of lists of ( device, status ) tuples
+      '''
+      while self._pending or self._ready:
+         if self._ready:
+            batch = list( self._ready )
+            self._ready.clear()
+            yield batch
+         if self._pending:
+            self._step()
+
+class TaskWatcher( object ):
+   '''TaskWatcher class waits for a set of tasks to reach a terminal state
+   ( Completed, Failed or Cancelled ). Each poll fetches the pending tasks by
+   id, or all the tasks at once when many of them are pending, and polling
+   stops as soon as every watched task is terminal.
+
+   Public methods:
+      watch( taskId, callback )
+      poll()
+      wait()
+      pendingCount()
+      throughput()
+      stats()
+
+   Instance variables:
+      cvpService -- CvpService instance used for polling
+      deadline -- time after which tasks still pending are given up on, None
+                  to wait for ever
+      backoff -- polling interval policy ( type : Backoff )
+      maxWorkers -- number of tasks fetched by id in parallel
+      bulkThreshold -- number of pending tasks above which all the tasks are
+                       fetched in one request
+   '''
+   def __init__( self, cvpService, timeout=None, backoff=None,
+         maxWorkers=DEFAULT_TASK_WORKERS, bulkThreshold=DEFAULT_TASK_BULK_THRESHOLD ):
+      '''Constructer for the TaskWatcher class
+
+      Arguments:
+         cvpService -- CvpService instance ( type : CvpService ( class ) )
+         timeout -- seconds after which tasks still pending are given up on
+                    ( optional ) ( type : float )
+         backoff -- polling interval policy ( optional ) ( type : Backoff )
+         maxWorkers -- number of tasks fetched by id in parallel ( type : int )
+         bulkThreshold -- number of pending tasks above which getTasks is used
+                          ( type : int )
+      '''
+      self.cvpService = cvpService
+      self.startTime = time.time()
+      self.deadline = None if timeout is None else self.startTime + timeout
+      self.backoff = backoff or Backoff()
+      self.maxWorkers = maxWorkers
+      self.bulkThreshold = bulkThreshold
+      self._pending = collections.OrderedDict()
+      self._lastTask = {}
+      self._finished = 0
+      self._polls = 0
+      self._lastFinishTime = None
+
+   def watch( self, taskId, callback=None ):
+      '''Starts watching a task
+
+      Arguments:
+         taskId -- Work order Id of the task ( type : String )
+         callback -- called with the task details once it is terminal
+                     ( optional ) ( type : callable )
+
+      Returns:
+         future -- resolved with the details of the task ( type : Dict ) once
+                   it is terminal, with its last known details if the deadline
+                   passes first ( type : Future )
+      '''
+      taskId = str( taskId )
+      future = self._pending.get( taskId )
+      if future is None:
+         future = Future()
+         self._pending[ taskId ] = future
+      if callback:
+         future.addDoneCallback( callback )
+      return future
+
+   def pendingCount( self ):
+      '''Returns the number of watched tasks which are not terminal yet'''
+      return len( self._pending )
+
+   def _fetch( self ):
+      '''Returns the details of the pending tasks, keyed by task id'''
+      taskIdList = list( self._pending )
+      if len( taskIdList ) > self.bulkThreshold:
+         return dict( ( str( task[ 'workOrderId' ] ), task )
+               for task in self.cvpService.getTasks()
+               if str( task[ 'workOrderId' ] ) in self._pending )
+      if self.maxWorkers <= 1 or len( taskIdList ) <= 1:
+         taskList = [ self.cvpService.getTaskById( taskId )
+               for taskId in taskIdList ]
+      else:
+         pool = ThreadPool( min( self.maxWorkers, len( taskIdList ) ) )
+         try:
+            taskList = pool.map( self.cvpService.getTaskById, taskIdList )
+         finally:
+            pool.close()
+            pool.join()
+      return dict( zip( taskIdList, taskList ) )
+
+   def poll( self ):
+      '''Fetches the pending tasks once and resolves the futures of the tasks
+      which are terminal
+
+      Returns:
+         finished -- number of tasks which became terminal ( type : int )
+      '''
+      if not self._pending:
+         return 0
+      tasks = self._fetch()
+      self._polls += 1
+      finished = 0
+      for taskId in list( self._pending ):
+         task = tasks.get( taskId )
+         if task is None:
+            continue
+         self._lastTask[ taskId ] = task
+         if task[ 'workOrderUserDefinedStatus' ] in TERMINAL_TASK_STATES:
+            self._pending.pop( taskId ).setResult( task )
+            finished += 1
+      if finished:
+         self._finished += finished
+         self._lastFinishTime = time.time()
+      return finished
+
+   def wait( self ):
+      '''Polls until every watched task is terminal or the deadline passed
+
+      Returns: None
+      '''
+      while self._pending:
+         if self.poll():
+            self.backoff.reset()
+         if not self._pending:
+            break
+         interval = self.backoff.next()
+         if self.deadline is not None:
+            remaining = self.deadline - time.time()
+            if remaining <= 0:
+               for taskId, future in self._pending.items():
+                  future.setResult( self._lastTask.get( taskId ) )
+               self._pending.clear()
+               break
+            interval = min( interval, remaining )
+         time.sleep( interval )
+
+   def throughput( self ):
+      '''Returns the number of tasks which became terminal per minute since
+      the watcher was created ( type : float )'''
+      endTime = self._lastFinishTime if not self._pending else time.time()
+      elapsed = ( endTime or time.time() ) - self.startTime
+      if elapsed <= 0:
+         return 0.0
+      return self._finished * 60.0 / elapsed
+
+   def stats( self ):
+      '''Returns the number of finished and pending tasks, the number of polls
+      and the throughput in tasks per minute ( type : Dict )'''
+      return { 'finished' : self._finished, 'pending' : len( self._pending ),
+            'polls' : self._polls, 'tasksPerMinute' : self.throughput() }
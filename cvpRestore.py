@@ -0,0 +1,358 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+CvpRestore.py rebuilds a Cvp instance from an export written by cvpExport.
+The restore is split into stages forming a dependency graph:
+
+   images -> imageBundles
+   containers -> devices
+   containers, configlets, imageBundles, devices -> mappings
+
+Every stage whose dependencies are complete runs at once, each of them
+parallel or batched internally: images are uploaded concurrently,
+containers are created one depth level per change set, configlets are
+synced by content hash and all the mappings are saved by a single change
+set, with keys resolved from one fetch instead of one per name. The stages
+only use the public methods of Cvp, whose indexes stay consistent when the
+stages of a tier share them.
+
+Completed stages are recorded in a checkpoint file, so that a restore which
+failed resumes with the stages left. A stage which left failures, such as a
+configlet or a device which could not be added, is recorded with its result
+but not as completed, as is a container whose parent is missing from the
+export. Every stage skips what already exists, so a stage
+interrupted half way or left with failures is simply run again. The
+checkpoint only applies to the export it was written for, identified by its
+path, size and modification time.
+
+Image files are not part of an export; they are read from imageDir, for
+instance a directory filled by Cvp.getImages.
+
+It contains 1 class
+   CvpRestore -- Restores an export into a Cvp instance
+'''
+import json
+import os
+from multiprocessing.pool import ThreadPool
+import cvp
+import cvpExport
+import cvpServices
+import errorCodes
+
+# stage -> stages it depends on
+STAGES = { 'images' : (),
+      'imageBundles' : ( 'images', ),
+      'containers' : (),
+      'configlets' : (),
+      'devices' : ( 'containers', ),
+      'mappings' : ( 'containers', 'configlets', 'imageBundles', 'devices' ) }
+
+def _exportStamp( exportPath ):
+   '''Returns the size and modification time of the export, identifying it
+   in the checkpoint ( type : List )'''
+   status = os.stat( exportPath )
+   return [ status.st_size, status.st_mtime ]
+
+class CvpRestore( object ):
+   '''CvpRestore class applies an export to a Cvp instance.
+
+   Public methods:
+      tiers()
+      restore()
+
+   Instance variables:
+      cvp -- Cvp instance to be restored ( type : Cvp ( class ) )
+      exportPath -- path of the export ( type : String )
+      checkpointPath -- path of the checkpoint file ( type : String )
+      imageDir -- directory holding the image files, images and image bundles
+                  are not restored when None ( type : String )
+      completed -- stages already completed ( type : List of String )
+      results -- outcome of each stage run, completed or left with failures
+                 ( type : Dict )
+   '''
+   def __init__( self, cvpInstance, exportPath, checkpointPath=None,
+         imageDir=None ):
+      '''Constructer for the CvpRestore class, the export is loaded and the
+      checkpoint, if present, picked up
+
+      Arguments:
+         cvpInstance -- authenticated Cvp instance ( type : Cvp ( class ) )
+         exportPath -- path of the export ( type : String )
+         checkpointPath -- path of the checkpoint file, exportPath followed by
+                           .checkpoint by default ( optional ) ( type : String )
+         imageDir -- directory holding the image files ( optional )
+                     ( type : String )
+      '''
+      self.cvp = cvpInstance
+      self.cvpService = cvpInstance.cvpService
+      self.exportPath = exportPath
+      self.checkpointPath = checkpointPath or exportPath + '.checkpoint'
+      self.imageDir = imageDir
+      self.records = {}
+      for recordType, data in cvpExport.readExport( exportPath ):
+         self.records.setdefault( recordType, [] ).append( data )
+      self.completed = []
+      self.results = {}
+      if os.path.isfile( self.checkpointPath ):
+         with open( self.checkpointPath ) as checkpointFile:
+            checkpoint = json.load( checkpointFile )
+         if ( checkpoint.get( 'exportPath' ) == exportPath and
+               checkpoint.get( 'exportStamp' ) == _exportStamp( exportPath ) ):
+            self.completed = checkpoint[ 'completed' ]
+            self.results = checkpoint[ 'results' ]
+
+   def _saveCheckpoint( self ):
+      '''Records the completed stages, replacing the checkpoint atomically'''
+      tempPath = self.checkpointPath + '.tmp'
+      with open( tempPath, 'w' ) as checkpointFile:
+         json.dump( { 'exportPath' : self.exportPath,
+            'exportStamp' : _exportStamp( self.exportPath ),
+            'completed' : self.completed, 'results' : self.results },
+            checkpointFile, default=cvp.encoder )
+      os.rename( tempPath, self.checkpointPath )
+
+   def tiers( self ):
+      '''Returns the stages left, grouped in tiers of stages which can run
+      at once ( type : List of List of String )'''
+      done = set( self.completed )
+      tiers = []
+      while len( done ) < len( STAGES ):
+         tier = sorted( stage for stage, dependencies in STAGES.iteritems()
+               if stage not in done and set( dependencies ) <= done )
+         tiers.append( tier )
+         done.update( tier )
+      return [ tier for tier in ( [ stage for stage in tier
+            if stage not in self.completed ] for tier in tiers ) if tier ]
+
+   def restore( self, callback=None ):
+      '''Runs the stages left, tier by tier, the stages of a tier in parallel.
+      The checkpoint is updated after every stage. A stage whose result lists
+      failures keeps its result but is not completed, hence it is run again
+      by the next restore and the stages depending on it are not run.
+
+      Arguments:
+         callback -- called as callback( stage, result ) after every stage
+                     ( optional )
+
+      Raises:
+         The first exception raised by a stage, the stages completed before
+         are kept in the checkpoint
+         CvpError -- If a stage left failures
+
+      Returns:
+         results -- outcome of each stage ( type : Dict )
+      '''
+      for tier in self.tiers():
+         pool = ThreadPool( len( tier ) )
+         try:
+            asyncResults = [ ( stage, pool.apply_async( getattr( self,
+               '_restore%s' % ( stage[ 0 ].upper() + stage[ 1 : ] ) ) ) )
+               for stage in tier ]
+            error = None
+            for stage, asyncResult in asyncResults:
+               try:
+                  result = asyncResult.get()
+               except Exception as e:
+                  error = error or e
+                  continue
+               self.results[ stage ] = result
+               if result.get( 'failed' ):
+                  error = error or cvpServices.CvpError(
+                        errorCodes.RESTORE_STAGE_INCOMPLETE )
+               else:
+                  self.completed.append( stage )
+               self._saveCheckpoint()
+               if callback:
+                  callback( stage, result )
+            if error is not None:
+               raise error
+         finally:
+            pool.close()
+            pool.join()
+      return self.results
+
+   def _imagePaths( self, imageNameList ):
+      '''Returns the paths of the image files'''
+      return [ os.path.join( self.imageDir, imageName )
+            for imageName in imageNameList ]
+
+   def _restoreImages( self ):
+      '''Uploads the images missing from the Cvp instance'''
+      if self.imageDir is None:
+         return { 'skipped' : len( self.records.get( 'image', [] ) ) }
+      _, timings = self.cvp.stageImages( self._imagePaths(
+            image[ 'name' ] for image in self.records.get( 'image', [] ) ) )
+      statusCount = {}
+      for timing in timings:
+         statusCount[ timing[ 'status' ] ] = statusCount.get(
+               timing[ 'status' ], 0 ) + 1
+      return statusCount
+
+   def _restoreImageBundles( self ):
+      '''Creates the image bundles missing from the Cvp instance'''
+      bundleList = self.records.get( 'imageBundle', [] )
+      if self.imageDir is None:
+         return { 'skipped' : len( bundleList ) }
+      imageNames = dict( ( image[ 'key' ], image[ 'name' ] )
+            for image in self.records.get( 'image', [] ) )
+      existing = set( bundle[ 'name' ]
+            for bundle in self.cvpService.getImageBundles() )
+      missing = [ bundle for bundle in bundleList
+            if bundle[ 'name' ] not in existing ]
+      # one at a time, the images stage already uploaded the images and the
+      # bundles would otherwise race on the image index of the Cvp instance
+      for bundle in missing:
+         imageBundle = cvp.ImageBundle( bundle[ 'name' ], '', [],
+               bundle[ 'certified' ], [], [] )
+         self.cvp.addImageBundle( imageBundle, self._imagePaths(
+               imageNames[ key ] for key in bundle[ 'imageKeys' ] ) )
+      return { 'added' : len( missing ),
+            'skipped' : len( bundleList ) - len( missing ) }
+
+   def _restoreContainers( self ):
+      '''Creates the containers missing from the Cvp instance'''
+      containerList = [ cvp.Container( container[ 'name' ], '', '', [], '',
+            container[ 'parentName' ] )
+            for container in self.records.get( 'container', [] ) ]
+      orphans = self.cvp.addContainers( containerList )
+      # the parent of an orphan is missing from the export, the stage is
+      # retried once it has been created
+      return { 'containers' : len( containerList ),
+            'failed' : sorted( container.name for container in orphans ) }
+
+   def _restoreConfiglets( self ):
+      '''Adds the missing configlets and updates the changed ones'''
+      report = self.cvp.syncConfiglets( dict( ( configlet[ 'name' ],
+            configlet[ 'config' ] )
+            for configlet in self.records.get( 'configlet', [] ) ) )
+      report[ 'failed' ] = sorted( report[ 'failed' ] )
+      return report
+
+   def _restoreDevices( self ):
+      '''Adds the devices missing from the inventory. The devices whose
+      container is not in the Cvp instance are skipped and reported as
+      unresolved.'''
+      devices, _ = self.cvpService.getInventory()
+      existing = set( device[ 'ipAddress' ] for device in devices )
+      containerIndex = self.cvp.getContainerIndex( refresh=True )
+      missing = []
+      unresolved = { 'containers' : set(), 'devices' : [] }
+      for device in self.records.get( 'device', [] ):
+         if device[ 'ipAddress' ] in existing:
+            continue
+         if device[ 'containerName' ] not in containerIndex:
+            unresolved[ 'containers' ].add( device[ 'containerName' ] )
+            unresolved[ 'devices' ].append( device[ 'ipAddress' ] )
+            continue
+         missing.append( cvp.Device( device[ 'ipAddress' ], device[ 'fqdn' ],
+            device[ 'key' ], device[ 'containerName' ], '', '', [] ) )
+      statusCount = {}
+      failed = []
+      for device, status in self.cvp.addDevicesIter( missing ):
+         statusCount[ status ] = statusCount.get( status, 0 ) + 1
+         if status not in ( 'Connected', 'Duplicate' ):
+            failed.append( device.ipAddress )
+      return { 'status' : statusCount, 'failed' : failed,
+            'skipped' : sum( 1 for device in self.records.get( 'device', [] )
+               if device[ 'ipAddress' ] in existing ),
+            'unresolved' : dict( ( kind, sorted( names ) )
+               for kind, names in unresolved.iteritems() ) }
+
+   def _mappings( self, listName ):
+      '''Returns the configlet names and the image bundle name mapped to each
+      container or device, according to the export'''
+      configletMap = {}
+      for configlet in self.records.get( 'configlet', [] ):
+         for name in configlet[ listName ]:
+            configletMap.setdefault( name, [] ).append( configlet[ 'name' ] )
+      bundleMap = {}
+      for bundle in self.records.get( 'imageBundle', [] ):
+         for name in bundle[ listName ]:
+            bundleMap[ name ] = bundle[ 'name' ]
+      return configletMap, bundleMap
+
+   def _keys( self ):
+      '''Returns the configlet keys and the image bundle keys by name'''
+      configletKeys = self.cvp.getConfigletKeys( refresh=True )
+      bundleKeys = dict( ( bundle[ 'name' ], bundle[ 'key' ] )
+            for bundle in self.cvpService.getImageBundles() )
+      return configletKeys, bundleKeys
+
+   def _restoreMappings( self ):
+      '''Maps the configlets and image bundles to the containers and to the
+      devices of the inventory, in a single change set. The configlets,
+      containers and image bundles of the export missing from the Cvp
+      instance are skipped and reported as unresolved.'''
+      containerConfiglets, containerBundles = self._mappings( 'containerList' )
+      deviceConfiglets, deviceBundles = self._mappings( 'deviceList' )
+      configletKeys, bundleKeys = self._keys()
+      containerIndex = self.cvp.getContainerIndex( refresh=True )
+      devices, _ = self.cvpService.getInventory()
+      deviceByIp = dict( ( device[ 'ipAddress' ], device )
+            for device in devices )
+      self.cvpService.saveInventory()
+      mapped = { 'containerConfiglets' : 0, 'containerImageBundles' : 0,
+            'deviceConfiglets' : 0, 'deviceImageBundles' : 0,
+            'missingDevices' : sorted( ipAddress for ipAddress in
+               set( deviceConfiglets ) | set( deviceBundles )
+               if ipAddress not in deviceByIp ) }
+      unresolved = { 'configlets' : set(), 'containers' : set(),
+            'imageBundles' : set() }
+
+      def resolveConfiglets( configNameList ):
+         '''Returns the configlets of configNameList present, and their keys'''
+         unresolved[ 'configlets' ].update( name for name in configNameList
+               if name not in configletKeys )
+         nameList = [ name for name in configNameList if name in configletKeys ]
+         return nameList, [ configletKeys[ name ] for name in nameList ]
+
+      def resolveContainer( containerName ):
+         '''Returns the key of the container, None if it is not present'''
+         if containerName not in containerIndex.nameToKey:
+            unresolved[ 'containers' ].add( containerName )
+            return None
+         return containerIndex.key( containerName )
+
+      def resolveBundle( bundleName ):
+         '''Returns the key of the image bundle, None if it is not present'''
+         if bundleName not in bundleKeys:
+            unresolved[ 'imageBundles' ].add( bundleName )
+            return None
+         return bundleKeys[ bundleName ]
+
+      with self.cvp.changeSet():
+         for containerName, configNameList in sorted(
+               containerConfiglets.items() ):
+            containerKey = resolveContainer( containerName )
+            nameList, keyList = resolveConfiglets( configNameList )
+            if containerKey is not None and nameList:
+               self.cvpService.applyConfigToContainer( containerName,
+                     containerKey, nameList, keyList )
+               mapped[ 'containerConfiglets' ] += 1
+         for containerName, bundleName in sorted( containerBundles.items() ):
+            containerKey = resolveContainer( containerName )
+            bundleKey = resolveBundle( bundleName )
+            if containerKey is not None and bundleKey is not None:
+               self.cvpService.applyImageBundleToContainer( containerName,
+                     containerKey, bundleName, bundleKey )
+               mapped[ 'containerImageBundles' ] += 1
+         for ipAddress, configNameList in sorted( deviceConfiglets.items() ):
+            device = deviceByIp.get( ipAddress )
+            nameList, keyList = resolveConfiglets( configNameList )
+            if device is not None and nameList:
+               self.cvpService.applyConfigToDevice( ipAddress, device[ 'fqdn' ],
+                     device[ 'key' ], nameList, keyList )
+               mapped[ 'deviceConfiglets' ] += 1
+         for ipAddress, bundleName in sorted( deviceBundles.items() ):
+            device = deviceByIp.get( ipAddress )
+            bundleKey = resolveBundle( bundleName )
+            if device is not None and bundleKey is not None:
+               self.cvpService.applyImageBundleToDevice( device[ 'key' ],
+                     device[ 'fqdn' ], bundleName, bundleKey )
+               mapped[ 'deviceImageBundles' ] += 1
+      mapped[ 'unresolved' ] = dict( ( entityType, sorted( names ) )
+            for entityType, names in unresolved.iteritems() )
+      return mapped
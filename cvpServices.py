@@ -8,17 +8,48 @@ CvpServices script is used for making request to the Cvp web-serves.
 These requests comprise of  addition, modification, deletion and retrieval of
 Cvp instance.
 
-It contains 2 classes
+It contains 6 classes
    CvpError -- Handles exceptions
+   ChangeSetError -- Chunks of a change set which could not be saved
+   ResponseCache -- Caches responses of the read-mostly list endpoints
+   TopologyChangeSet -- Batches topology actions into few saveTopology requests
+   MultipartFileStream -- Streams a file as a multipart/form-data body
    CvpService -- Handles requests
 '''
+import collections
+import copy
+import hashlib
 import requests
 import json
-import urllib
+import os
+import threading
+import time
+import uuid
 import errorCodes
+from requests.adapters import HTTPAdapter
 
 DEFAULT_USER = "cvpadmin"
 DEFAULT_PASSWORD = "cvpadmin"
+DEFAULT_POOL_SIZE = 10
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# seconds without any byte received after which an image download fails
+DOWNLOAD_TIMEOUT = 60
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+DEFAULT_CACHE_SIZE = 64
+DEFAULT_CHANGE_SET_CHUNK_SIZE = 200
+# time to live in seconds of the cached responses of each list endpoint
+DEFAULT_CACHE_TTLS = { 'configlets' : 30,
+      'images' : 300,
+      'imageBundles' : 60 }
+
+def fileMd5( fileName ):
+   '''Returns the md5 hash object of the content of fileName, read in
+   chunks'''
+   checksum = hashlib.md5()
+   with open( fileName, 'rb' ) as imageFile:
+      for chunk in iter( lambda: imageFile.read( DOWNLOAD_CHUNK_SIZE ), '' ):
+         checksum.update( chunk )
+   return checksum
 
 class CvpError( Exception ):
    '''CvpError is a class for containing the exception information and passing that
@@ -43,7 +74,10 @@ class CvpError( Exception ):
    message[ 4002 ] = errorCodes.DEVICE_LOGIN_UNAUTHORISED
    message[ 4003 ] = errorCodes.DEVICE_INVALID_LOGIN_CREDENTIALS
    message[ 4005 ] = errorCodes.DEVICE_CONNECTION_ATTEMPT_FAILURE
+   message[ 4006 ] = errorCodes.INVALID_DEVICE_IP_ADDRESS
    message[ 5001 ] = errorCodes.INVALID_IMAGE_NAME
+   message[ 5002 ] = errorCodes.IMAGE_CHECKSUM_MISMATCH
+   message[ 8001 ] = errorCodes.RESTORE_STAGE_INCOMPLETE
    message[ 112498 ] = errorCodes.INVALID_LOGIN_CREDENTIALS
    message[ 121500 ] = errorCodes.IMAGE_BUNDLE_CVP_RUNTIME_EXCEPTION
    message[ 122401 ] = errorCodes.USER_UNAUTHORISED
@@ -74,6 +108,307 @@ class CvpError( Exception ):
       '''returns string value of the object'''
       return str( self.errorCode )
 
+class ChangeSetError( CvpError ):
+   '''ChangeSetError is raised when a change set exits after some of its
+   chunks could not be saved. Its error code is the one of the first chunk
+   which failed.
+
+   Instance variables:
+      failures -- chunks which could not be saved, as ( chunk number, actions,
+                  CvpError ) tuples ( type : List of Tuple )
+   '''
+   def __init__( self, failures ):
+      '''Constructor for the ChangeSetError class'''
+      super( ChangeSetError, self ).__init__( failures[ 0 ][ 2 ].value )
+      self.failures = failures
+
+def _checkResponse( response ):
+   '''Checks the response of a request
+
+   Arguments:
+      response -- ( type : requests.Response ( class ) )
+
+   Raises:
+      CvpError -- If response is not ok or response contains error code
+   '''
+   if not response.ok:
+      raise CvpError( 2 )
+   if 'errorCode' in response.text:
+      errorCode = response.json().get( 'errorCode', 0 )
+      raise CvpError( errorCode )
+
+class ResponseCache( object ):
+   '''ResponseCache class keeps the responses of the list endpoints for a
+   limited time. Entries are evicted in least recently used order once
+   maxEntries is reached. Expired entries keep their ETag and Last-Modified
+   validators so that they can be revalidated with a conditional request.
+
+   Every invalidation of an endpoint bumps its generation. A response is only
+   stored if the generation of its endpoint is still the one read before the
+   request was issued, so that a response fetched before a write is not
+   cached after the write invalidated the endpoint.
+
+   Public methods:
+      lookup( url )
+      generation( endpoint )
+      store( endpoint, url, body, etag, lastModified, generation )
+      refresh( url )
+      invalidate( endpoint )
+      stats()
+
+   Instance variables:
+      ttls -- time to live in seconds for each endpoint ( type : Dict )
+      maxEntries -- maximum number of cached responses ( type : int )
+   '''
+   def __init__( self, ttls=None, maxEntries=DEFAULT_CACHE_SIZE ):
+      self.ttls = dict( DEFAULT_CACHE_TTLS )
+      if ttls:
+         self.ttls.update( ttls )
+      self.maxEntries = maxEntries
+      self._entries = collections.OrderedDict()
+      self._generations = collections.defaultdict( int )
+      self._lock = threading.Lock()
+      self._hits = 0
+      self._misses = 0
+      self._revalidations = 0
+
+   def lookup( self, url ):
+      '''Returns the cached entry of url
+
+      Arguments:
+         url -- url of the request ( type : String )
+
+      Returns:
+         entry -- None if nothing is cached, otherwise Dictionary with the
+                  keys body, etag, lastModified and fresh ( type : Dict )
+      '''
+      with self._lock:
+         entry = self._entries.pop( url, None )
+         if entry is None:
+            self._misses += 1
+            return None
+         self._entries[ url ] = entry
+         fresh = entry[ 'expiry' ] > time.time()
+         if fresh:
+            self._hits += 1
+         else:
+            # stale entries cost a request, even when revalidated
+            self._misses += 1
+         return dict( entry, fresh=fresh )
+
+   def generation( self, endpoint ):
+      '''Returns the number of invalidations of endpoint ( type : int )'''
+      with self._lock:
+         return self._generations[ endpoint ]
+
+   def store( self, endpoint, url, body, etag=None, lastModified=None,
+         generation=None ):
+      '''Caches the response body of url for the ttl of endpoint, unless
+      endpoint was invalidated since generation was read'''
+      with self._lock:
+         if ( generation is not None and
+               generation != self._generations[ endpoint ] ):
+            return
+         self._entries.pop( url, None )
+         self._entries[ url ] = { 'endpoint' : endpoint, 'body' : body,
+               'etag' : etag, 'lastModified' : lastModified,
+               'expiry' : time.time() + self.ttls.get( endpoint, 0 ) }
+         while len( self._entries ) > self.maxEntries:
+            self._entries.popitem( last=False )
+
+   def refresh( self, url ):
+      '''Restarts the ttl of url after the server confirmed that the cached
+      response is still valid'''
+      with self._lock:
+         entry = self._entries.get( url )
+         if entry is not None:
+            self._revalidations += 1
+            entry[ 'expiry' ] = time.time() + self.ttls.get(
+                  entry[ 'endpoint' ], 0 )
+
+   def invalidate( self, endpoint ):
+      '''Drops every cached response of endpoint'''
+      with self._lock:
+         self._generations[ endpoint ] += 1
+         for url in [ url for url, entry in self._entries.iteritems()
+               if entry[ 'endpoint' ] == endpoint ]:
+            del self._entries[ url ]
+
+   def stats( self ):
+      '''Returns the number of cached entries, hits, misses and successful
+      revalidations ( type : Dict )'''
+      with self._lock:
+         return { 'entries' : len( self._entries ), 'hits' : self._hits,
+               'misses' : self._misses, 'revalidations' : self._revalidations }
+
+class TopologyChangeSet( object ):
+   '''TopologyChangeSet class collects the topology actions of many write
+   methods ( configlet, image bundle, container and device changes ) and
+   commits them with as few saveTopology requests as possible. It is used as
+   a context manager, obtained from CvpService.changeSet(): while the block
+   runs the actions are collected instead of being saved, and they are
+   committed when the block exits without exception. Once every chunk has
+   been tried, a ChangeSetError is raised if some could not be saved, unless
+   raiseOnFailure is False.
+
+   A change set only collects the actions of the thread which entered it;
+   other threads sharing the CvpService keep saving theirs directly. The
+   cache lets the callers look up configlet or image bundle keys once for the
+   whole block rather than once per action.
+
+   Public methods:
+      add( actionList )
+      commit()
+      discard()
+
+   Instance variables:
+      chunkSize -- maximum number of actions saved by one request
+      raiseOnFailure -- raise ChangeSetError when the block exits and chunks
+                        failed, instead of only recording them in failures
+                        ( type : boolean )
+      actions -- actions collected so far ( type : List of Dict )
+      failures -- chunks which could not be saved, as ( chunk number, actions,
+                  CvpError ) tuples ( type : List of Tuple )
+      cache -- lookups made once for the life of the change set ( type : Dict )
+   '''
+   def __init__( self, cvpService, chunkSize=DEFAULT_CHANGE_SET_CHUNK_SIZE,
+         raiseOnFailure=True ):
+      self.cvpService = cvpService
+      self.chunkSize = max( 1, chunkSize )
+      self.raiseOnFailure = raiseOnFailure
+      self.actions = []
+      self.failures = []
+      self.cache = {}
+      self._needsSave = False
+      self._lock = threading.Lock()
+
+   def __enter__( self ):
+      self.cvpService._attachChangeSet( self )
+      return self
+
+   def __exit__( self, excType, excValue, traceback ):
+      self.cvpService._detachChangeSet( self )
+      if excType is None:
+         if self.commit() and self.raiseOnFailure:
+            raise ChangeSetError( list( self.failures ) )
+      else:
+         self.discard()
+      return False
+
+   def add( self, actionList ):
+      '''Collects topology actions. An empty list records that temporary
+      actions were created on the server and need to be saved.'''
+      with self._lock:
+         self._needsSave = True
+         self.actions.extend( actionList )
+
+   def discard( self ):
+      '''Drops the collected actions'''
+      with self._lock:
+         self.actions = []
+         self._needsSave = False
+
+   def commit( self ):
+      '''Saves the collected actions in chunks of chunkSize actions. Each
+      action gets a unique id, and each new container a unique temporary node
+      id. A chunk which fails does not prevent the next ones from being saved.
+
+      Returns:
+         failures -- chunks which could not be saved, as ( chunk number,
+                     actions, CvpError ) tuples ( type : List of Tuple )
+      '''
+      with self._lock:
+         actions, self.actions = self.actions, []
+         needsSave, self._needsSave = self._needsSave, False
+      for actionId, action in enumerate( actions, 1 ):
+         action[ 'id' ] = actionId
+         if ( action.get( 'action' ) == 'add' and
+               action.get( 'nodeType' ) == 'container' ):
+            action[ 'nodeId' ] = 'New_container%d' % actionId
+      chunks = [ actions[ index : index + self.chunkSize ]
+            for index in range( 0, len( actions ), self.chunkSize ) ]
+      if needsSave and not chunks:
+         chunks = [ [] ]
+      for chunkNumber, chunk in enumerate( chunks ):
+         try:
+            self.cvpService._postTopology( chunk )
+         except CvpError as e:
+            self.failures.append( ( chunkNumber, chunk, e ) )
+      return self.failures
+
+class MultipartFileStream( object ):
+   '''MultipartFileStream class is a file-like multipart/form-data body
+   holding one file. The file is read in chunks of chunkSize bytes as the
+   body is sent, so that it is never held in memory, and its md5 is computed
+   on the way. The len attribute lets requests send a Content-Length.
+
+   Instance variables:
+      len -- size of the body in bytes
+      contentType -- value of the Content-Type header of the body
+      checksum -- md5 hash object of the file content sent so far
+      sent -- number of bytes of the file sent so far
+   '''
+   def __init__( self, fieldName, filePath, chunkSize=UPLOAD_CHUNK_SIZE,
+         progress=None ):
+      boundary = uuid.uuid4().hex
+      self.contentType = 'multipart/form-data; boundary=%s' % boundary
+      self.fileName = os.path.basename( filePath )
+      self.fileSize = os.path.getsize( filePath )
+      self.chunkSize = chunkSize
+      self.progress = progress
+      self.checksum = hashlib.md5()
+      self.sent = 0
+      self._file = open( filePath, 'rb' )
+      self._buffer = ( '--%s\r\nContent-Disposition: form-data; name="%s"; '
+            'filename="%s"\r\nContent-Type: application/octet-stream\r\n\r\n'
+            % ( boundary, fieldName, self.fileName ) )
+      self._tail = '\r\n--%s--\r\n' % boundary
+      self._position = 0
+      self.len = len( self._buffer ) + self.fileSize + len( self._tail )
+      self._startTime = None
+
+   def _nextPiece( self ):
+      '''Returns the next chunk of the file, then the closing boundary, then
+      an empty string'''
+      if self._file is None:
+         return ''
+      if self._startTime is None:
+         self._startTime = time.time()
+      chunk = self._file.read( self.chunkSize )
+      if not chunk:
+         self.close()
+         return self._tail
+      self.checksum.update( chunk )
+      self.sent += len( chunk )
+      if self.progress:
+         elapsed = max( time.time() - self._startTime, 1e-6 )
+         self.progress( self.fileName, self.sent, self.fileSize,
+               self.sent / elapsed )
+      return chunk
+
+   def read( self, size=-1 ):
+      '''Returns the next size bytes of the body, all of it if size is
+      negative'''
+      pieces = []
+      wanted = size
+      while size < 0 or wanted > 0:
+         if self._position >= len( self._buffer ):
+            self._buffer, self._position = self._nextPiece(), 0
+            if not self._buffer:
+               break
+         end = len( self._buffer ) if size < 0 else self._position + wanted
+         piece = self._buffer[ self._position : end ]
+         self._position += len( piece )
+         wanted -= len( piece )
+         pieces.append( piece )
+      return ''.join( pieces )
+
+   def close( self ):
+      '''Closes the file'''
+      if self._file is not None:
+         self._file.close()
+         self._file = None
+
 class CvpService( object ):
    '''CvpService class is responsible for hitting endpoints of the Cvp web-server
    for retrieving, updating, adding and deleting state of Cvp
@@ -105,6 +440,7 @@ class CvpService( object ):
       retryAddToInventory( deviceKey, deviceIpAddress, username, password )
       executeTask( taskId )
       getTasks()
+      getTaskById( taskId )
       getImageBundles()
       deleteImageBundle( imageBundleKey, imageBundleName )
       deleteDuplicateDevice( tempDeviceId )
@@ -124,6 +460,11 @@ class CvpService( object ):
          imageBundleKey )
       deviceComplianceCheck( deviceConfigIdList, deviceMacAddress )
       changeContainerName( oldName, newName, containerKey )
+      connectionStats()
+      close()
+      enableCache( ttls, maxEntries )
+      disableCache()
+      changeSet( chunkSize, raiseOnFailure )
 
    Instance variables:
       self.port -- Port where Http/Https request made to web server
@@ -131,18 +472,31 @@ class CvpService( object ):
       self.headers -- headers required for the Http/Https requests
       self.hostname -- name of the host
       self.cookies -- cookies of the session establised
+      self.session -- keep-alive session shared by all the requests
+      self.adapter -- connection pool adapter mounted on the session
+      self.cache -- cache of the list endpoint responses, None when disabled
    '''
-   def __init__( self, hostname, ssl=False, port=80 ):
+   def __init__( self, hostname, ssl=False, port=80,
+         poolSize=DEFAULT_POOL_SIZE ):
       '''Constructer for the CvpService class
 
       Arguments:
          hostname -- name of the host ( type : String )
          SSL -- secured socket layer ( type : boolean )
          port -- port number (type : int )
+         poolSize -- maximum number of connections kept alive to the host
+                     ( type : int )
       '''
       self.hostname = hostname
       self.port = port
       self.cookies = None
+      self.session = requests.Session()
+      self.adapter = HTTPAdapter( pool_connections=1, pool_maxsize=poolSize )
+      self.session.mount( 'http://', self.adapter )
+      self.session.mount( 'https://', self.adapter )
+      self.cache = None
+      # the change set of each thread
+      self._local = threading.local()
       if ssl == True:
          self.url = 'https://%s:%d' % ( self.hostname, self.port )
       else:
@@ -169,13 +523,107 @@ class CvpService( object ):
       if not 'cookies' in kwargs:
          kwargs[ 'cookies' ] = self.cookies
       response = method( url, *args, **kwargs )
-      if not response.ok:
-         raise CvpError( 2 )
-      if 'errorCode' in response.text:
-         errorCode = response.json().get( 'errorCode', 0 )
-         raise CvpError( errorCode )
+      _checkResponse( response )
       return response.json()
 
+   def enableCache( self, ttls=None, maxEntries=DEFAULT_CACHE_SIZE ):
+      '''Caches the responses of getConfigletsInfo, getImagesInfo and
+      getImageBundles. Cached responses are dropped when a write to the same
+      kind of object succeeds.
+
+      Arguments:
+         ttls -- time to live in seconds overriding DEFAULT_CACHE_TTLS for
+                 some endpoints ( optional ) ( type : Dict )
+         maxEntries -- maximum number of cached responses ( type : int )
+
+      Returns: None
+      '''
+      self.cache = ResponseCache( ttls, maxEntries )
+
+   def disableCache( self ):
+      '''Stops caching responses and drops the cached ones'''
+      self.cache = None
+
+   def _cachedRequest( self, endpoint, url ):
+      '''Issues a GET request through the response cache. A fresh cached
+      response is returned without contacting the server, an expired one is
+      revalidated with If-None-Match / If-Modified-Since when the server
+      provided validators. Callers get their own copy of the response, so
+      that modifying it does not corrupt the cache.
+
+      Arguments:
+         endpoint -- name of the cached endpoint ( type : String )
+         url -- url of the request ( type : String )
+
+      Returns:
+         response -- Json response from the endpoint
+
+      Raises:
+         CvpError -- If response is not json or response contains error code
+      '''
+      cache = self.cache
+      if cache is None:
+         return self.doRequest( self.session.get, url )
+      entry = cache.lookup( url )
+      if entry and entry[ 'fresh' ]:
+         return copy.deepcopy( entry[ 'body' ] )
+      generation = cache.generation( endpoint )
+      headers = {}
+      if entry and entry[ 'etag' ]:
+         headers[ 'If-None-Match' ] = entry[ 'etag' ]
+      if entry and entry[ 'lastModified' ]:
+         headers[ 'If-Modified-Since' ] = entry[ 'lastModified' ]
+      response = self.session.get( url, cookies=self.cookies, headers=headers )
+      if entry and response.status_code == 304:
+         cache.refresh( url )
+         return copy.deepcopy( entry[ 'body' ] )
+      _checkResponse( response )
+      body = response.json()
+      cache.store( endpoint, url, copy.deepcopy( body ),
+            response.headers.get( 'ETag' ),
+            response.headers.get( 'Last-Modified' ), generation )
+      return body
+
+   def _invalidateCache( self, endpoint ):
+      '''Drops the cached responses of endpoint after a successful write'''
+      if self.cache is not None:
+         self.cache.invalidate( endpoint )
+
+   def connectionStats( self ):
+      '''Reports how well the pooled session reuses its connections
+
+      Arguments: None
+
+      Returns:
+         stats -- number of requests issued, connections opened and requests
+                  served over an already open connection ( type : Dict )
+
+      Raises: None
+      '''
+      requestCount = 0
+      connectionCount = 0
+      pools = self.adapter.poolmanager.pools
+      for poolKey in pools.keys():
+         pool = pools.get( poolKey )
+         if pool is None:
+            continue
+         requestCount += pool.num_requests
+         connectionCount += pool.num_connections
+      return { 'requests' : requestCount,
+            'connections' : connectionCount,
+            'reused' : max( requestCount - connectionCount, 0 ) }
+
+   def close( self ):
+      '''Closes all the connections kept alive by the session
+
+      Arguments: None
+
+      Returns: None
+
+      Raises: None
+      '''
+      self.session.close()
+
    def _authenticationRequest( self, method, url, *args, **kwargs ):
       '''Issues an Http request for authentication
 
@@ -194,11 +642,7 @@ class CvpService( object ):
                      If parameter data structures are incorrect
       '''
       response = method( url, *args, **kwargs )
-      if not response.ok:
-         raise CvpError( 2 )
-      if 'errorCode' in response.text:
-         errorCode = response.json().get( 'errorCode', 0 )
-         raise CvpError( errorCode )
+      _checkResponse( response )
       return response
 
    def getConfigletsInfo( self ):
@@ -212,7 +656,7 @@ class CvpService( object ):
 
       Raises: None
       '''
-      configlets = self.doRequest( requests.get,
+      configlets = self._cachedRequest( 'configlets',
             '%s/web/configlet/getConfiglets.do?startIndex=%d&endIndex=%d'
                   % ( self.url, 0, 0 ) )
       return configlets[ 'data' ]
@@ -238,7 +682,7 @@ class CvpService( object ):
       data = { 'netElementId' : deviceMacAddress,
             'configIdList' : deviceConfigIdList }
 
-      complianceReport = self.doRequest( requests.post,
+      complianceReport = self.doRequest( self.session.post,
             '%s/web/ztp/runConfigSync.do' % self.url, data=json.dumps( data ),
             cookies=self.cookies )
       return complianceReport
@@ -257,7 +701,7 @@ class CvpService( object ):
                      If parameter data structures are incorrect
       '''
       authData = { 'userId' : username, 'password' : password }
-      authentication =  self._authenticationRequest( requests.post,
+      authentication =  self._authenticationRequest( self.session.post,
             '%s/web/login/authenticate.do' % self.url, data=json.dumps( authData ),
             headers=self.headers )
       self.cookies = authentication.cookies
@@ -276,7 +720,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      containers = self.doRequest( requests.get,
+      containers = self.doRequest( self.session.get,
             '%s/web/image/getImageBundleAppliedContainers.do?'
             'imageName=%s&startIndex=%d&endIndex=%d&queryparam=null'
             %( self.url, imageBundleName, 0, 0 ) )
@@ -309,7 +753,7 @@ class CvpService( object ):
          "toName" : "",
          "toIdType" : "container",
          "oldNodeName" : oldName } ]
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/ztp/addTempAction.do?format=topology&queryParam=&nodeId=%s' %
             ( self.url, containerKey ), data=json.dumps( data ),
             cookies=self.cookies )
@@ -328,7 +772,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      container = self.doRequest( requests.get,
+      container = self.doRequest( self.session.get,
             '%s/web/inventory/add/searchContainers.do?queryparam=%s&startIndex=%d'
             '&endIndex=%d' %(self.url, containerName, 0, 0 ) )
       return container[ 'data' ]
@@ -346,51 +790,133 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      devices = self.doRequest( requests.get,
+      devices = self.doRequest( self.session.get,
             '%s/web/image/getImageBundleAppliedDevices.do?'
             'imageName=%s&startIndex=%d&endIndex=%d&queryparam=null'
             % (self.url, imageBundleName, 0, 0) )
       return devices[ 'data' ]
 
-   def addImage( self, imageName ):
-      '''Add image to Cvp instance
+   def addImage( self, imageName, progress=None ):
+      '''Add image to Cvp instance. The image is streamed in chunks of
+      UPLOAD_CHUNK_SIZE bytes and its md5 is checked against the one Cvp
+      reports.
       Warning -- image file with imageName as file should exist
 
       Argument:
          imageName -- name of the image ( type : String )
+         progress -- called after every chunk with the image name, the bytes
+                     sent so far, the size of the image and the throughput in
+                     bytes per second ( optional ) ( type : callable )
 
       Raises:
          Assertion Error -- If imageName is not of type string
          FileNotFoundError -- If image file doesn't exist
+         CvpError -- If the image received by Cvp does not match the file
 
       Returns:
          imageInfo -- information of image added to the cvp instance
       '''
       assert isinstance( imageName, str )
-      image = open( imageName, 'r' )
-      imageInfo = self.doRequest( requests.post,
-            '%s/web/image/addImage.do' % self.url, files={ 'file' : image } )
+      body = MultipartFileStream( 'file', imageName, progress=progress )
+      try:
+         imageInfo = self.doRequest( self.session.post,
+               '%s/web/image/addImage.do' % self.url, data=body,
+               headers={ 'Content-Type' : body.contentType } )
+      finally:
+         body.close()
+      self._invalidateCache( 'images' )
+      if imageInfo.get( 'md5' ) and imageInfo[ 'md5' ] != body.checksum.hexdigest():
+         raise CvpError( errorCodes.IMAGE_CHECKSUM_MISMATCH )
       return imageInfo
 
-   def downloadImage( self, imageName, imageId, filePath='' ):
+   def downloadImage( self, imageName, imageId, filePath='', md5=None,
+         progress=None ):
       '''Download the image file from Cvp Instance and stores at corresponding
-      file path or current directory
+      file path or current directory. The image is streamed to a .part file
+      which is renamed once complete; a download interrupted earlier resumes
+      from the end of the .part file with an Http Range request. When md5 is
+      given an image already present with this checksum is not downloaded
+      again, and the downloaded image is verified against it. Without md5, a
+      .part file the server reports as complete is only kept when its size is
+      the size of the image.
 
       Arguments:
          imageName -- name of image (type : string )
          imageId -- unique Id assigned to the image ( type : string )
          filePath -- storage path in the local system (optional)( type : string )
+         md5 -- md5 checksum of the image reported by Cvp
+                (optional)( type : string )
+         progress -- called after every chunk with the image name, the bytes
+                     written so far, the size of the image ( None if unknown )
+                     and the throughput in bytes per second
+                     (optional)( type : callable )
 
       Raises:
-         Http 500 -- If the imageId is invalid
+         CvpError -- If the imageId is invalid
+                     If the downloaded image does not match md5
          IOERROR -- If invalid file path is provided
 
-      Returns None
+      Returns:
+         received -- number of bytes transferred ( type : int )
       '''
       fileName = filePath + imageName
+      partName = fileName + '.part'
+      if md5 and os.path.isfile( fileName ):
+         if fileMd5( fileName ).hexdigest() == md5:
+            return 0
+      offset = os.path.getsize( partName ) if os.path.isfile( partName ) else 0
       URL =  '%s/web/services/image/getImagebyId/%s' % ( self.url, imageId )
-      imageSWI = urllib.URLopener()
-      imageSWI.retrieve( URL, fileName )
+      response = self._imageRequest( URL, offset )
+      try:
+         if ( response.status_code == 416 and not md5 and
+               self._rangeSize( response ) != offset ):
+            # without md5 the .part file is only trusted when its size is the
+            # size of the image, otherwise it is downloaded again
+            response.close()
+            os.remove( partName )
+            offset = 0
+            response = self._imageRequest( URL, offset )
+         # 416: the .part file already holds the whole image
+         complete = response.status_code == 416
+         if not complete and not response.ok:
+            raise CvpError( 2 )
+         elif not complete and response.status_code != 206:
+            offset = 0
+         checksum = fileMd5( partName ) if offset else hashlib.md5()
+         length = response.headers.get( 'Content-Length' )
+         total = offset + int( length ) if length and not complete else None
+         received = 0
+         startTime = time.time()
+         with open( partName, 'ab' if offset else 'wb' ) as imageSWI:
+            if not complete:
+               for chunk in response.iter_content( DOWNLOAD_CHUNK_SIZE ):
+                  imageSWI.write( chunk )
+                  checksum.update( chunk )
+                  received += len( chunk )
+                  if progress:
+                     elapsed = max( time.time() - startTime, 1e-6 )
+                     progress( imageName, offset + received, total,
+                           received / elapsed )
+      finally:
+         response.close()
+      if md5 and checksum.hexdigest() != md5:
+         os.remove( partName )
+         raise CvpError( errorCodes.IMAGE_CHECKSUM_MISMATCH )
+      os.rename( partName, fileName )
+      return received
+
+   def _imageRequest( self, url, offset ):
+      '''Issues the streamed GET request of an image, from byte offset'''
+      headers = { 'Range' : 'bytes=%d-' % offset } if offset else {}
+      return self.session.get( url, cookies=self.cookies, stream=True,
+            headers=headers, timeout=DOWNLOAD_TIMEOUT )
+
+   @staticmethod
+   def _rangeSize( response ):
+      '''Returns the size of the image given by the Content-Range header of a
+      response, None if absent'''
+      size = response.headers.get( 'Content-Range', '' ).rpartition( '/' )[ 2 ]
+      return int( size ) if size.isdigit() else None
 
    def firstLoginDefaultPasswordReset( self,  newPassword, emailId ):
       '''Reset the password for the first login into the Cvp Web-UI
@@ -410,7 +936,7 @@ class CvpService( object ):
             "oldPassword" : DEFAULT_PASSWORD,
             "currentPassword" : newPassword,
             "email" : emailId}
-      self.doRequest( requests.post, '%s/web/login/changePassword.do'
+      self.doRequest( self.session.post, '%s/web/login/changePassword.do'
             % self.url, data=json.dumps( data ) )
 
    def getInventory( self ):
@@ -426,7 +952,7 @@ class CvpService( object ):
 
       Raises: None
       '''
-      inventory = self.doRequest( requests.get,
+      inventory = self.doRequest( self.session.get,
             '%s/web/inventory/getInventory.do?queryparam=.&startIndex=%d'
             '&endIndex=%d' % ( self.url, 0, 0 ), cookies=self.cookies )
       return ( inventory[ 'netElementList' ], inventory[ 'containerList' ] )
@@ -445,7 +971,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      containers = self.doRequest( requests.get,
+      containers = self.doRequest( self.session.get,
             '%s/web/configlet/getAppliedContainers.do?configletName=%s'
             '&startIndex=%d&endIndex=%d&queryparam=null'
             % ( self.url, configletName, 0, 0 ) )
@@ -465,7 +991,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      devices = self.doRequest( requests.get,
+      devices = self.doRequest( self.session.get,
             '%s/web/configlet/getAppliedDevices.do?configletName=%s'
             '&startIndex=%d&endIndex=%d&queryparam=null'
             % ( self.url, configletName, 0, 0 ) )
@@ -485,7 +1011,7 @@ class CvpService( object ):
 
       Raises: None
       '''
-      inventory = self.doRequest(requests.get,
+      inventory = self.doRequest( self.session.get,
             '%s/web/inventory/add/retrieveInventory.do?startIndex=%d&endIndex=%d'
             %(self.url, 0, 0) )
       return (inventory[ 'containers' ], inventory[ 'tempNetElement' ] )
@@ -501,7 +1027,7 @@ class CvpService( object ):
 
       Raises: None
       '''
-      images = self.doRequest( requests.get,
+      images = self._cachedRequest( 'images',
             '%s/web/image/getImages.do?queryparam=&startIndex=%d&endIndex=%d'
             % ( self.url, 0, 0 ) )
       return images[ 'data' ]
@@ -521,9 +1047,10 @@ class CvpService( object ):
       '''
       configlet = { 'config' : configletContent,
             'name' : configletName }
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/configlet/addConfiglet.do' % self.url,
             data=json.dumps( configlet ) )
+      self._invalidateCache( 'configlets' )
 
    def getConfigletByName( self, configName ):
       '''Get information about configlet
@@ -538,7 +1065,7 @@ class CvpService( object ):
          CvpError -- If configlet name is invalid
                      If parameter data structures are incorrect
       '''
-      configlet = self.doRequest( requests.get,
+      configlet = self.doRequest( self.session.get,
             '%s/web/configlet/getConfigletByName.do?name=%s'
             % ( self.url, configName ) )
       return configlet
@@ -560,9 +1087,10 @@ class CvpService( object ):
       configlet = { 'config' : configletContent,
             'name' : configletName ,
             'key' : configletKey }
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/configlet/updateConfiglet.do' % ( self.url ),
             data=json.dumps( configlet ) )
+      self._invalidateCache( 'configlets' )
 
    def deleteConfiglet( self, configletName, configletKey ):
       '''Removes the configlet from Cvp instance
@@ -578,9 +1106,10 @@ class CvpService( object ):
                      If parameter data structures are incorrect
       '''
       configlet = [ { 'key' : configletKey, 'name' : configletName } ]
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/configlet/deleteConfiglet.do' % self.url,
             data=json.dumps( configlet ) )
+      self._invalidateCache( 'configlets' )
 
    def saveImageBundle( self, imageBundleName, imageBundleCertified,
          imageInfoList ):
@@ -602,9 +1131,10 @@ class CvpService( object ):
       data = { 'name' : imageBundleName,
             'isCertifiedImage' : str( imageBundleCertified ).lower(),
             'images' : imageInfoList }
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/image/saveImageBundle.do' % self.url,
             data=json.dumps( data ) )
+      self._invalidateCache( 'imageBundles' )
 
    def getImageBundleByName( self, imageBundleName ):
       '''Returns image bundle informations
@@ -618,7 +1148,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If parameter data structures are incorrect
       '''
-      imageBundle = self.doRequest( requests.get,
+      imageBundle = self.doRequest( self.session.get,
             '%s/web/image/getImageBundleByName.do?name=%s'
             % ( self.url, imageBundleName ) )
       return imageBundle
@@ -646,9 +1176,10 @@ class CvpService( object ):
             'isCertifiedImage' : str( imageBundleCertified ).lower(),
             'images' : imageInfoList,
             'id' : imageBundleKey }
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/image/updateImageBundle.do' % ( self.url ),
             data=json.dumps( data ) )
+      self._invalidateCache( 'imageBundles' )
 
    def addToInventory( self, deviceIpAddress, parentContainerName,
          parentContainerId ):
@@ -671,7 +1202,7 @@ class CvpService( object ):
          'containerType' : 'Existing',
          'ipAddress' : deviceIpAddress,
          'containerList' : [] }  ]
-      self.doRequest(requests.post,
+      self.doRequest( self.session.post,
             '%s/web/inventory/add/addToInventory.do?startIndex=%d&endIndex=%d'
             % ( self.url, 0, 0 ), data=json.dumps( data ) )
 
@@ -685,7 +1216,7 @@ class CvpService( object ):
       Raises: None
       '''
 
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/inventory/add/saveInventory.do' % ( self.url ) )
 
    def retryAddToInventory( self, deviceKey, deviceIpAddress, username,
@@ -706,14 +1237,62 @@ class CvpService( object ):
       '''
       loginData = { "key" : deviceKey, "ipAddress" : deviceIpAddress,
             "userName" : username, "password" : password }
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/inventory/add/retryAddDeviceToInventory.do' %( self.url ),
             data=json.dumps( loginData ) )
 
+   def changeSet( self, chunkSize=DEFAULT_CHANGE_SET_CHUNK_SIZE,
+         raiseOnFailure=True ):
+      '''Returns a change set which, used as a context manager, collects the
+      topology actions of the write methods called inside the block and saves
+      them together when the block exits.
+
+      Arguments:
+         chunkSize -- maximum number of actions saved by one request
+                      ( type : int )
+         raiseOnFailure -- raise ChangeSetError on exit if chunks could not
+                           be saved ( optional ) ( type : boolean )
+
+      Returns:
+         changeSet -- ( type : TopologyChangeSet ( class ) )
+      '''
+      return TopologyChangeSet( self, chunkSize, raiseOnFailure )
+
+   def _activeChangeSet( self ):
+      '''Returns the change set entered by the calling thread, or None'''
+      return getattr( self._local, 'changeSet', None )
+
+   def _attachChangeSet( self, changeSet ):
+      '''Starts collecting the topology actions of the calling thread in
+      changeSet'''
+      assert self._activeChangeSet() is None, 'change sets cannot be nested'
+      self._local.changeSet = changeSet
+
+   def _detachChangeSet( self, changeSet ):
+      '''Stops collecting topology actions in changeSet'''
+      if self._activeChangeSet() is changeSet:
+         self._local.changeSet = None
+
    def _saveTopology( self, data ):
       '''Schedule tasks for many operations like configlet and image bundle
       mapping/removal to/from device or container, addition/deletion of containers,
-      deletion of device.
+      deletion of device. The actions are collected instead when the calling
+      thread has entered a change set.
+
+      Arguments:
+         data -- Information required for scheduling tasks
+
+      Raises:
+         CvpError -- If incorrect data is used to schedule tasks
+      '''
+      changeSet = self._activeChangeSet()
+      if changeSet is not None:
+         changeSet.add( data )
+         return
+      self._postTopology( data )
+
+   def _postTopology( self, data ):
+      '''Saves topology actions in the Cvp instance
 
       Arguments:
          data -- Information required for scheduling tasks
@@ -721,7 +1300,7 @@ class CvpService( object ):
       Raises:
          CvpError -- If incorrect data is used to schedule tasks
       '''
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/ztp/saveTopology.do' % ( self.url ),
             data=json.dumps( data ) )
 
@@ -737,7 +1316,7 @@ class CvpService( object ):
          CvpError -- If work order Id of task is invalid
                      If parameter data structures are incorrect
       '''
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/workflow/executeTask.do' % ( self.url ),
             data=json.dumps( taskId ) )
 
@@ -751,11 +1330,27 @@ class CvpService( object ):
 
       Raises: None
       '''
-      tasks = self.doRequest( requests.get,
+      tasks = self.doRequest( self.session.get,
             '%s/web/workflow/getTasks.do?queryparam=&startIndex=%d&endIndex=%d'
             % (self.url, 0, 0) )
       return tasks[ 'data' ]
 
+   def getTaskById( self, taskId ):
+      '''Retrieve information about one task in Cvp Instance
+
+      Argument:
+         taskId -- Work order Id of the task ( type : String )
+
+      Returns:
+         task -- details of the task ( type : Dict )
+
+      Raises:
+         CvpError -- If work order Id of task is invalid
+      '''
+      task = self.doRequest( self.session.get,
+            '%s/web/workflow/getTaskById.do?taskId=%s' % ( self.url, taskId ) )
+      return task
+
    def getImageBundles( self ):
       '''Get all details of all image bundles from Cvp instance
 
@@ -768,7 +1363,7 @@ class CvpService( object ):
       Raises: None
       '''
 
-      imageBundles = self.doRequest( requests.get,
+      imageBundles = self._cachedRequest( 'imageBundles',
             '%s/web/image/getImageBundles.do?queryparam=&startIndex=%d&endIndex=%d'
             % ( self.url, 0, 0 ) )
       return imageBundles[ 'data' ]
@@ -789,9 +1384,10 @@ class CvpService( object ):
       '''
 
       data = [ { 'key' : imageBundleKey, 'name' : imageBundleName } ]
-      self.doRequest( requests.post,
+      self.doRequest( self.session.post,
             '%s/web/image/deleteImageBundles.do' % self.url,
             data=json.dumps( data ) )
+      self._invalidateCache( 'imageBundles' )
 
    def deleteDuplicateDevice( self, tempDeviceId ):
       '''Delete duplicate device from Cvp. Warning -- Method doesn't check
@@ -807,7 +1403,7 @@ class CvpService( object ):
          CvpError -- If parameter data structures are inconsistent
       '''
 
-      self.doRequest( requests.get,
+      self.doRequest( self.session.get,
             '%s/web/inventory/add/deleteFromInventory.do?netElementId=%s'
             % ( self.url, tempDeviceId ) )
 
@@ -0,0 +1,381 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+DeviceTable.py stores a fleet of devices column by column for reporting
+queries such as devices per container, image bundle distribution or
+devices missing a configlet.
+
+Every column is dictionary encoded: the distinct values are kept once and
+each device holds the code of its value in an array. The configlets column
+holds a set per device, laid out as one array of codes with an array of row
+offsets. An inverted index, built on first use, maps every code to the rows
+having it.
+
+Filters are evaluated on the distinct values rather than on the rows, and
+return a Selection, a bitmap of rows held in a Python integer, so that
+combining filters with &, | and ~ runs at C speed whatever the size of the
+fleet.
+
+   table = DeviceTable.fromSnapshot( cvpInstance.snapshot() )
+   leaves = table.where( 'containerName', lambda name: name.startswith( 'leaf' ) )
+   table.groupCount( 'imageBundle', leaves & ~table.where( 'configlets', 'ntp' ) )
+
+It contains 4 classes
+   Selection -- Set of rows of a DeviceTable
+   DeviceTable -- Columnar, dictionary encoded table of devices
+   _Column -- Dictionary encoded column
+   _SetColumn -- Dictionary encoded column holding a set of values per row
+'''
+import binascii
+import collections
+from array import array
+import cvp
+
+# columns with more distinct values do not keep a bitmap per value
+MAX_BITMAP_VALUES = 256
+
+def _bitmap( rowLists, size ):
+   '''Returns the bitmap of the rows in rowLists, bit n standing for row n'''
+   bits = bytearray( ( size + 7 ) // 8 )
+   for rows in rowLists:
+      for row in rows:
+         bits[ row >> 3 ] |= 1 << ( row & 7 )
+   bits.reverse()
+   return int( binascii.hexlify( bits ) or '0', 16 )
+
+class Selection( object ):
+   '''Selection class is a set of rows of a DeviceTable, as a bitmap.
+   Selections of the same table combine with &, |, - and ~.
+
+   state variables:
+      table -- table the rows belong to ( type : DeviceTable ( class ) )
+      bitmap -- bit n is set when row n is selected ( type : long )
+   '''
+   def __init__( self, table, bitmap ):
+      self.table = table
+      self.bitmap = bitmap
+
+   def _combine( self, that, bitmap ):
+      '''Returns a selection of the same table'''
+      if that.table is not self.table:
+         raise ValueError( 'Selections of different tables' )
+      return Selection( self.table, bitmap )
+
+   def __and__( self, that ):
+      return self._combine( that, self.bitmap & that.bitmap )
+
+   def __or__( self, that ):
+      return self._combine( that, self.bitmap | that.bitmap )
+
+   def __sub__( self, that ):
+      return self._combine( that, self.bitmap & ~that.bitmap )
+
+   def __invert__( self ):
+      return Selection( self.table, self.table.all().bitmap & ~self.bitmap )
+
+   def __len__( self ):
+      return bin( self.bitmap ).count( '1' )
+
+   def __nonzero__( self ):
+      return self.bitmap != 0
+
+   def __iter__( self ):
+      '''Yields the selected row numbers in increasing order'''
+      bits = bin( self.bitmap )[ : 1 : -1 ]
+      row = bits.find( '1' )
+      while row >= 0:
+         yield row
+         row = bits.find( '1', row + 1 )
+
+class _Column( object ):
+   '''_Column class holds a dictionary encoded column
+
+   state variables:
+      values -- distinct values, by code
+      codes -- code of the value of each row ( type : array )
+   '''
+   def __init__( self, valueList ):
+      self.values = []
+      self.codes = array( 'l' )
+      self._codeOf = {}
+      self._rows = None
+      self._bitmaps = None
+      self._encode( valueList )
+
+   def _encode( self, valueList ):
+      '''Fills the dictionary and the codes from the values of the rows'''
+      codeOf = self._codeOf
+      values = self.values
+      codes = self.codes
+      for value in valueList:
+         code = codeOf.get( value )
+         if code is None:
+            code = codeOf[ value ] = len( values )
+            values.append( value )
+         codes.append( code )
+
+   def code( self, value ):
+      '''Returns the code of value, or None if no row has it'''
+      return self._codeOf.get( value )
+
+   def rowCodes( self, row ):
+      '''Returns the codes of a row'''
+      return ( self.codes[ row ], )
+
+   def value( self, row ):
+      '''Returns the value of a row'''
+      return self.values[ self.codes[ row ] ]
+
+   def rows( self ):
+      '''Returns the inverted index, the rows having each code'''
+      if self._rows is None:
+         rows = [ array( 'l' ) for _ in self.values ]
+         for row, code in enumerate( self.codes ):
+            rows[ code ].append( row )
+         self._rows = rows
+      return self._rows
+
+   def matchingRows( self, codes ):
+      '''Returns the lists of rows having one of codes, scanning the codes
+      rather than building the inverted index of a column of mostly distinct
+      values'''
+      codes = set( codes )
+      if not codes:
+         return []
+      return [ [ row for row, code in enumerate( self.codes ) if code in codes ] ]
+
+   def bitmaps( self, size ):
+      '''Returns the bitmap of the rows having each code, or None when the
+      column has too many distinct values for them to be worth keeping'''
+      if len( self.values ) > MAX_BITMAP_VALUES:
+         return None
+      if self._bitmaps is None:
+         self._bitmaps = [ _bitmap( [ rows ], size ) for rows in self.rows() ]
+      return self._bitmaps
+
+class _SetColumn( _Column ):
+   '''_SetColumn class holds a dictionary encoded column of sets, the codes
+   of row n being codes[ offsets[ n ] : offsets[ n + 1 ] ]
+
+   state variables:
+      offsets -- start of the codes of each row, and their end
+                 ( type : array )
+   '''
+   def __init__( self, valueLists ):
+      self.offsets = array( 'l', [ 0 ] )
+      super( _SetColumn, self ).__init__( valueLists )
+
+   def _encode( self, valueLists ):
+      '''Fills the dictionary, the codes and the offsets from the value
+      lists of the rows, dropping the duplicates of a row'''
+      codeOf = self._codeOf
+      values = self.values
+      codes = self.codes
+      offsets = self.offsets
+      for valueList in valueLists:
+         start = len( codes )
+         for value in valueList or ():
+            code = codeOf.get( value )
+            if code is None:
+               code = codeOf[ value ] = len( values )
+               values.append( value )
+            if code not in codes[ start : ]:
+               codes.append( code )
+         offsets.append( len( codes ) )
+
+   def rowCodes( self, row ):
+      '''Returns the codes of a row'''
+      return self.codes[ self.offsets[ row ] : self.offsets[ row + 1 ] ]
+
+   def value( self, row ):
+      '''Returns the values of a row'''
+      return [ self.values[ code ] for code in self.rowCodes( row ) ]
+
+   def matchingRows( self, codes ):
+      '''Returns the lists of rows having each of codes'''
+      rows = self.rows()
+      return [ rows[ code ] for code in codes ]
+
+   def rows( self ):
+      '''Returns the inverted index, the rows having each code'''
+      if self._rows is None:
+         rows = [ array( 'l' ) for _ in self.values ]
+         offsets = self.offsets
+         codes = self.codes
+         for row in xrange( len( offsets ) - 1 ):
+            for index in xrange( offsets[ row ], offsets[ row + 1 ] ):
+               rows[ codes[ index ] ].append( row )
+         self._rows = rows
+      return self._rows
+
+class DeviceTable( object ):
+   '''DeviceTable class stores devices column by column.
+
+   Public methods:
+      fromSnapshot( snapshot )
+      all()
+      none()
+      where( column, value )
+      device( row )
+      devices( selection )
+      values( column, selection )
+      groupCount( column, selection )
+      join( column, entities, selection, attribute )
+
+   Instance variables:
+      columns -- columns by name, every Device attribute but configlets
+                 being a _Column and configlets a _SetColumn
+   '''
+   COLUMNS = ( 'ipAddress', 'fqdn', 'key', 'containerName', 'containerId',
+         'imageBundle' )
+
+   def __init__( self, devices=() ):
+      '''Constructer for the DeviceTable class
+
+      Arguments:
+         devices -- ( type : Iterable of Device ( class ) )
+      '''
+      devices = list( devices )
+      self.columns = dict( ( name, _Column( [ getattr( device, name )
+         for device in devices ] ) ) for name in self.COLUMNS )
+      self.columns[ 'configlets' ] = _SetColumn( [ device.configlets
+         for device in devices ] )
+      self._size = len( devices )
+
+   @classmethod
+   def fromSnapshot( cls, snapshot ):
+      '''Returns the table of the devices of snapshot
+
+      Arguments:
+         snapshot -- ( type : CvpSnapshot ( class ) )
+      '''
+      return cls( snapshot.devices )
+
+   def __len__( self ):
+      return self._size
+
+   def _column( self, name ):
+      '''Returns the column called name
+
+      Raises:
+         KeyError -- If there is no such column
+      '''
+      if name not in self.columns:
+         raise KeyError( 'No column %s in DeviceTable' % name )
+      return self.columns[ name ]
+
+   def all( self ):
+      '''Returns the selection of every row'''
+      return Selection( self, ( 1 << self._size ) - 1 )
+
+   def none( self ):
+      '''Returns the empty selection'''
+      return Selection( self, 0 )
+
+   def where( self, column, value ):
+      '''Selects the rows matching value. The configlets column matches when
+      one of the configlets of the row does.
+
+      Arguments:
+         column -- name of the column ( type : String )
+         value -- value to be matched: a callable is a predicate evaluated
+                  once per distinct value, a list, tuple or set matches any
+                  of its values, anything else is compared for equality
+
+      Raises:
+         KeyError -- If there is no such column
+
+      Returns:
+         selection -- ( type : Selection ( class ) )
+      '''
+      encoded = self._column( column )
+      if callable( value ):
+         codes = [ code for code, distinct in enumerate( encoded.values )
+               if value( distinct ) ]
+      else:
+         if not isinstance( value, ( list, tuple, set, frozenset ) ):
+            value = ( value, )
+         codes = [ code for code in ( encoded.code( item ) for item in value )
+               if code is not None ]
+      bitmaps = encoded.bitmaps( self._size )
+      if bitmaps is None:
+         return Selection( self, _bitmap( encoded.matchingRows( codes ),
+               self._size ) )
+      bitmap = 0
+      for code in codes:
+         bitmap |= bitmaps[ code ]
+      return Selection( self, bitmap )
+
+   def device( self, row ):
+      '''Returns the Device stored at row'''
+      return cvp.Device( *[ self.columns[ name ].value( row )
+         for name in self.COLUMNS + ( 'configlets', ) ] )
+
+   def devices( self, selection=None ):
+      '''Returns the selected rows as Device objects, every row by default'''
+      return [ self.device( row ) for row in
+         ( self.all() if selection is None else selection ) ]
+
+   def values( self, column, selection=None ):
+      '''Returns the values of a column for the selected rows, every row by
+      default'''
+      encoded = self._column( column )
+      if selection is None:
+         return [ encoded.value( row ) for row in xrange( self._size ) ]
+      return [ encoded.value( row ) for row in selection ]
+
+   def groupCount( self, column, selection=None ):
+      '''Counts the selected rows per value of a column, every row by default.
+      Rows count once per configlet for the configlets column.
+
+      Returns:
+         counts -- number of rows by value ( type : Dict )
+      '''
+      encoded = self._column( column )
+      if selection is None:
+         return dict( ( encoded.values[ code ], len( rows ) )
+               for code, rows in enumerate( encoded.rows() ) if rows )
+      bitmaps = encoded.bitmaps( self._size )
+      if bitmaps is not None:
+         counts = ( ( code, Selection( self, bitmap & selection.bitmap ) )
+               for code, bitmap in enumerate( bitmaps ) )
+         return dict( ( encoded.values[ code ], len( rows ) )
+               for code, rows in counts if rows )
+      counts = collections.defaultdict( int )
+      for row in selection:
+         for code in encoded.rowCodes( row ):
+            counts[ code ] += 1
+      return dict( ( encoded.values[ code ], count )
+            for code, count in counts.iteritems() )
+
+   def join( self, column, entities, selection=None, attribute='name' ):
+      '''Joins the selected rows with entities, such as the configlets or
+      image bundles of a snapshot, on column equal to the attribute of the
+      entity. Entities are matched once per distinct value.
+
+      Arguments:
+         column -- name of the column ( type : String )
+         entities -- ( type : Iterable of Configlet, ImageBundle ... )
+         selection -- rows to be joined, every row by default
+                      ( type : Selection ( class ) )
+         attribute -- attribute of the entities matched ( type : String )
+
+      Returns:
+         pairs -- ( ipAddress, entity ) tuples, rows without a matching
+                  entity left out ( type : List of Tuple )
+      '''
+      encoded = self._column( column )
+      byValue = dict( ( getattr( entity, attribute ), entity )
+            for entity in entities )
+      entityByCode = [ byValue.get( value ) for value in encoded.values ]
+      ipAddress = self.columns[ 'ipAddress' ]
+      pairs = []
+      for row in ( self.all() if selection is None else selection ):
+         for code in encoded.rowCodes( row ):
+            entity = entityByCode[ code ]
+            if entity is not None:
+               pairs.append( ( ipAddress.value( row ), entity ) )
+      return pairs
@@ -29,10 +29,13 @@ DEVICE_ALREADY_EXISTS = 4001
 DEVICE_LOGIN_UNAUTHORISED = 4002
 DEVICE_INVALID_LOGIN_CREDENTIALS = 4003
 DEVICE_CONNECTION_ATTEMPT_FAILURE = 4005
+INVALID_DEVICE_IP_ADDRESS = 4006
 INVALID_IMAGE_NAME = 5001
+IMAGE_CHECKSUM_MISMATCH = 5002
 INVALID_TASK_ID = 6001
 ENTITY_ALREADY_EXISTS = 7001
 JSON_STRING_AS_BEAN_CLASS = 7002
+RESTORE_STAGE_INCOMPLETE = 8001
 
 ERROR_MAPPING = { NO_ERROR_CODE : "No error code provided",
       UNKNOWN_ERROR_CODE: "Unknown error code",
@@ -61,10 +64,14 @@ ERROR_MAPPING = { NO_ERROR_CODE : "No error code provided",
       DEVICE_LOGIN_UNAUTHORISED: "User unauthorised to login into the device",
       DEVICE_INVALID_LOGIN_CREDENTIALS: "Incorrect device login credentials",
       DEVICE_CONNECTION_ATTEMPT_FAILURE : "Failure to setup connection with device",
+      INVALID_DEVICE_IP_ADDRESS : "Invalid device ip address",
 
       INVALID_IMAGE_NAME : "Invalid Image Name",
+      IMAGE_CHECKSUM_MISMATCH : "Downloaded image does not match its md5",
       INVALID_TASK_ID : " Invalid Task Id",
       ENTITY_ALREADY_EXISTS : "Entity already exists in the inventory",
-      JSON_STRING_AS_BEAN_CLASS : "Invalid data structure of input" }
+      JSON_STRING_AS_BEAN_CLASS : "Invalid data structure of input",
+      RESTORE_STAGE_INCOMPLETE : "Restore stage left failures, run the restore"
+      " again to retry them" }
 
 
@@ -0,0 +1,229 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+ImageCache.py keeps downloaded images in a local content addressed store so
+that an image pulled once is never downloaded again on the same host. Images
+are stored under their md5, or their Cvp imageId when Cvp reports no md5,
+and materialized into the requested directory by hard link, by reflink
+( copy on write clone ) when the store is on another device, and by copy as
+a last resort. The store is capped in size and evicts the least recently
+used images first.
+
+Warning -- a hard linked image shares its content with the store, it must
+not be modified in place.
+
+It contains 1 class
+   ImageCache -- Content addressed store of images
+'''
+import collections
+import errno
+import os
+import shutil
+import threading
+
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024 * 1024
+# ioctl cloning a file on copy on write file systems ( btrfs, xfs )
+FICLONE = 0x40049409
+
+def _reflink( source, destination ):
+   '''Clones source into destination sharing its blocks, raises IOError or
+   OSError when the file system does not support it'''
+   import fcntl
+   with open( source, 'rb' ) as sourceFile:
+      with open( destination, 'wb' ) as destinationFile:
+         try:
+            fcntl.ioctl( destinationFile.fileno(), FICLONE, sourceFile.fileno() )
+         except ( IOError, OSError ):
+            destinationFile.close()
+            os.remove( destination )
+            raise
+
+class ImageCache( object ):
+   '''ImageCache class stores images by content key in cacheDir.
+
+   Public methods:
+      imageKey( image )
+      fetch( key, destination, download )
+      materialize( key, destination )
+      stats()
+
+   Instance variables:
+      cacheDir -- directory of the store
+      maxBytes -- size of the store above which images are evicted
+      hits -- number of fetches served from the store
+      misses -- number of fetches which had to download the image
+      evictions -- number of images evicted
+   '''
+   def __init__( self, cacheDir, maxBytes=DEFAULT_MAX_BYTES ):
+      '''Constructer for the ImageCache class, images already in cacheDir are
+      picked up, least recently used first
+
+      Arguments:
+         cacheDir -- directory of the store, created if needed ( type : String )
+         maxBytes -- size cap of the store in bytes ( type : int )
+      '''
+      self.cacheDir = cacheDir
+      self.maxBytes = maxBytes
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+      self._lock = threading.Lock()
+      self._keyLocks = {}
+      # keys being linked out of the store, which must not be evicted
+      self._inUse = collections.Counter()
+      self._entries = collections.OrderedDict()
+      self._size = 0
+      if not os.path.isdir( cacheDir ):
+         os.makedirs( cacheDir )
+      found = []
+      for key in os.listdir( cacheDir ):
+         path = os.path.join( cacheDir, key )
+         if key.endswith( '.part' ) or not os.path.isfile( path ):
+            continue
+         stat = os.stat( path )
+         found.append( ( stat.st_mtime, key, stat.st_size ) )
+      for _, key, size in sorted( found ):
+         self._entries[ key ] = size
+         self._size += size
+
+   @staticmethod
+   def imageKey( image ):
+      '''Returns the content key of an image as returned by getImagesInfo
+
+      Arguments:
+         image -- image information ( type : Dict )
+
+      Returns:
+         key -- md5 of the image, or its imageId ( type : String )
+      '''
+      if image.get( 'md5' ):
+         return image[ 'md5' ]
+      return 'id-%s' % image[ 'imageId' ]
+
+   def _path( self, key ):
+      '''Returns the path of the image stored under key'''
+      return os.path.join( self.cacheDir, key )
+
+   def _keyLock( self, key ):
+      '''Returns the lock serializing the fetches of key'''
+      with self._lock:
+         return self._keyLocks.setdefault( key, threading.Lock() )
+
+   def fetch( self, key, destination, download ):
+      '''Materializes the image stored under key at destination, first
+      downloading it into the store if it is not there
+
+      Arguments:
+         key -- content key of the image ( type : String )
+         destination -- path of the file to be created ( type : String )
+         download -- called with the store directory ( ending with a
+                     separator ) and key, must write the image there
+                     ( type : callable )
+
+      Returns:
+         hit -- True if the image was already in the store ( type : boolean )
+      '''
+      with self._keyLock( key ):
+         hit = self.materialize( key, destination )
+         if not hit:
+            download( os.path.join( self.cacheDir, '' ), key )
+            size = os.path.getsize( self._path( key ) )
+            with self._lock:
+               self.misses += 1
+               self._entries[ key ] = size
+               self._size += size
+               self._evict( key )
+               self._inUse[ key ] += 1
+            try:
+               self._link( self._path( key ), destination )
+            finally:
+               self._release( key )
+         return hit
+
+   def materialize( self, key, destination ):
+      '''Creates destination from the image stored under key, if any
+
+      Returns:
+         hit -- False if key is not in the store, or its file disappeared
+                ( type : boolean )
+      '''
+      with self._lock:
+         if key not in self._entries:
+            return False
+         # move the entry to the most recently used end
+         self._entries[ key ] = self._entries.pop( key )
+         self._inUse[ key ] += 1
+      path = self._path( key )
+      try:
+         os.utime( path, None )
+         self._link( path, destination )
+      except ( IOError, OSError ) as e:
+         if e.errno != errno.ENOENT or os.path.exists( path ):
+            raise
+         # removed behind the back of the store, report a miss
+         with self._lock:
+            size = self._entries.pop( key, None )
+            if size is not None:
+               self._size -= size
+         return False
+      finally:
+         self._release( key )
+      with self._lock:
+         self.hits += 1
+      return True
+
+   def _release( self, key ):
+      '''Marks one use of key as over'''
+      with self._lock:
+         self._inUse[ key ] -= 1
+         if self._inUse[ key ] <= 0:
+            del self._inUse[ key ]
+
+   def _evict( self, keep ):
+      '''Removes least recently used images, other than keep and the images
+      being linked, until the store fits in maxBytes. Called with the lock
+      held.'''
+      for key in list( self._entries ):
+         if self._size <= self.maxBytes:
+            break
+         if key == keep or key in self._inUse:
+            continue
+         size = self._entries.pop( key )
+         self._size -= size
+         self.evictions += 1
+         try:
+            os.remove( self._path( key ) )
+         except OSError as e:
+            if e.errno != errno.ENOENT:
+               raise
+
+   @staticmethod
+   def _link( source, destination ):
+      '''Creates destination from source by hard link, else by reflink, else
+      by copy'''
+      if os.path.exists( destination ):
+         if os.path.samefile( source, destination ):
+            return
+         os.remove( destination )
+      try:
+         os.link( source, destination )
+         return
+      except OSError:
+         pass
+      try:
+         _reflink( source, destination )
+         return
+      except ( IOError, OSError, ImportError ):
+         pass
+      shutil.copyfile( source, destination )
+
+   def stats( self ):
+      '''Returns the hit, miss and eviction counters along with the number
+      of images and bytes in the store ( type : Dict )'''
+      with self._lock:
+         return { 'hits' : self.hits, 'misses' : self.misses,
+               'evictions' : self.evictions, 'entries' : len( self._entries ),
+               'bytes' : self._size }
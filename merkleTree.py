@@ -0,0 +1,273 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+MerkleTree.py fingerprints the container hierarchy of a CvpSnapshot. Every
+container gets a hash covering its own configlets and image bundle, the
+devices directly under it and the hashes of its child containers, so that
+the hash of a container changes if and only if something in its subtree
+changed. Configlets are hashed by key and content, and image bundles by key
+and images, hence editing a configlet or an image bundle changes the hash
+of every container and device it is applied to. Devices whose container is
+not in the hierarchy are hashed under an extra root named after it.
+
+Comparing two trees starts from the roots and only descends into the
+subtrees whose hashes differ; unchanged subtrees cost a single comparison
+whatever their size.
+
+It contains 2 classes
+   MerkleTree -- Hashes of the container hierarchy of a snapshot
+   TreeDiff -- Entities added, removed or changed between two trees
+'''
+import hashlib
+import cvp
+import cvpServices
+import errorCodes
+
+ENTITY_TYPES = ( 'containers', 'devices', 'configlets', 'imageBundles' )
+
+def _digest( *parts ):
+   '''Returns the md5 digest of parts, each of them a string or a list of
+   strings ( type : String )'''
+   md5 = hashlib.md5()
+   for part in parts:
+      if isinstance( part, ( list, tuple ) ):
+         part = '\1'.join( part )
+      if isinstance( part, unicode ):
+         part = part.encode( 'utf-8' )
+      md5.update( ( part or '' ) + '\0' )
+   return md5.hexdigest()
+
+class TreeDiff( object ):
+   '''TreeDiff class lists the entities which differ between two trees
+
+   state variables:
+      added -- names of the entities only in the new tree, by entity type
+               ( type : Dict of Lists )
+      removed -- names of the entities only in the old tree, by entity type
+                 ( type : Dict of Lists )
+      changed -- names of the entities in both trees with different content,
+                 or moved to another container, by entity type
+                 ( type : Dict of Lists )
+      visited -- number of containers compared
+   '''
+   def __init__( self ):
+      self.added = dict( ( entityType, [] ) for entityType in ENTITY_TYPES )
+      self.removed = dict( ( entityType, [] ) for entityType in ENTITY_TYPES )
+      self.changed = dict( ( entityType, [] ) for entityType in ENTITY_TYPES )
+      self.visited = 0
+
+   def __nonzero__( self ):
+      return any( self.added[ entityType ] or self.removed[ entityType ] or
+            self.changed[ entityType ] for entityType in ENTITY_TYPES )
+
+   def _finish( self ):
+      '''Reports as changed the entities both removed and added, i.e. moved
+      from one subtree to another, and sorts the lists'''
+      for entityType in ENTITY_TYPES:
+         moved = set( self.added[ entityType ] ) & set(
+               self.removed[ entityType ] )
+         self.changed[ entityType ] = sorted( set(
+               self.changed[ entityType ] ) | moved )
+         self.added[ entityType ] = sorted( set( self.added[ entityType ] ) -
+               moved )
+         self.removed[ entityType ] = sorted( set(
+               self.removed[ entityType ] ) - moved )
+
+   def jsonable( self ):
+      ''' Returns dictionary object which describes the diff'''
+      return { 'added' : self.added, 'removed' : self.removed,
+            'changed' : self.changed, 'visited' : self.visited }
+
+class MerkleTree( object ):
+   '''MerkleTree class computes the hashes of the container hierarchy of a
+   snapshot, bottom up, in a single pass.
+
+   Public methods:
+      hash( containerName )
+      diff( other )
+
+   state variables:
+      rootHash -- hash of the whole hierarchy, along with the configlets and
+                  the image bundles
+      rootNames -- names of the top level containers, the root container, the
+                   containers outside the hierarchy such as Undefined and the
+                   unknown container names devices refer to
+      containerHashes -- hash of the subtree of each container by name
+      nodeHashes -- hash of the own fields of each container by name
+      deviceHashes -- hash of each device by ip address
+      configletHashes -- hash of the key and content of each configlet by name
+      imageBundleHashes -- hash of the key and images of each image bundle by
+                           name
+      unknownNames -- container names devices refer to which are not in the
+                      container index ( type : Set of String )
+      children -- names of the child containers by container name
+      devices -- ip addresses of the devices directly under each container
+   '''
+   def __init__( self, snapshot ):
+      '''Constructer for the MerkleTree class
+
+      Arguments:
+         snapshot -- ( type : CvpSnapshot ( class ) )
+      '''
+      containerIndex = snapshot.containerIndex
+      self.configletHashes = dict( ( configlet.name, _digest( configlet.name,
+            configlet.key, cvp.configletHash( configlet.config ) ) )
+            for configlet in snapshot.configlets )
+      self.imageBundleHashes = dict( ( bundle.name, _digest( bundle.name,
+            bundle.key, str( bundle.certified ), bundle.imageKeys or [] ) )
+            for bundle in snapshot.imageBundles )
+      self.deviceHashes = {}
+      self.devices = {}
+      for device in snapshot.devices:
+         self.deviceHashes[ device.ipAddress ] = _digest( device.ipAddress,
+               device.fqdn, device.key, self._imageBundle( device.imageBundle ),
+               self._configletList( device.configlets ) )
+         self.devices.setdefault( device.containerName, [] ).append(
+               device.ipAddress )
+      for ipAddressList in self.devices.itervalues():
+         ipAddressList.sort()
+
+      reachable = set()
+      stack = [ containerIndex.rootName ]
+      while stack:
+         name = stack.pop()
+         reachable.add( name )
+         stack.extend( containerIndex.children( name ) )
+      self.unknownNames = set( self.devices ) - set( containerIndex.nameToKey )
+      self.rootNames = [ containerIndex.rootName ] + sorted( ( set(
+            containerIndex.nameToKey ) - reachable ) | self.unknownNames )
+      self.children = dict( ( name, sorted( containerIndex.children( name ) ) )
+            for name in containerIndex.nameToKey )
+      self.children.update( ( name, [] ) for name in self.unknownNames )
+
+      self.nodeHashes = {}
+      self.containerHashes = {}
+      for rootName in self.rootNames:
+         # post order: a container is hashed after all of its children
+         stack = [ ( rootName, False ) ]
+         while stack:
+            name, childrenDone = stack.pop()
+            if not childrenDone:
+               stack.append( ( name, True ) )
+               stack.extend( ( child, False )
+                     for child in self.children[ name ] )
+               continue
+            self.nodeHashes[ name ] = self._nodeHash( snapshot, name )
+            self.containerHashes[ name ] = _digest( name,
+                  self.nodeHashes[ name ],
+                  [ self.deviceHashes[ ipAddress ]
+                     for ipAddress in self.devices.get( name, [] ) ],
+                  [ self.containerHashes[ child ]
+                     for child in self.children[ name ] ] )
+      self.rootHash = _digest( [ self.containerHashes[ name ]
+            for name in self.rootNames ], [ '%s=%s' % item
+            for item in sorted( self.configletHashes.iteritems() ) ],
+            [ '%s=%s' % item
+            for item in sorted( self.imageBundleHashes.iteritems() ) ] )
+
+   def _configletList( self, configletNames ):
+      '''Returns the hashes of the configlets named, in order'''
+      return [ self.configletHashes.get( name, name )
+            for name in configletNames or [] ]
+
+   def _imageBundle( self, imageBundleName ):
+      '''Returns the hash of the image bundle named, its name if unknown'''
+      return self.imageBundleHashes.get( imageBundleName, imageBundleName )
+
+   def _nodeHash( self, snapshot, containerName ):
+      '''Returns the hash of the own fields of a container'''
+      if containerName in self.unknownNames:
+         return _digest( containerName )
+      try:
+         container = snapshot.container( containerName )
+      except cvpServices.CvpError:
+         # containers only known to the index, such as Undefined
+         return _digest( containerName,
+               snapshot.containerIndex.nameToKey[ containerName ] )
+      return _digest( container.name, container.key,
+            self._imageBundle( container.imageBundle ),
+            self._configletList( container.configlets ) )
+
+   def hash( self, containerName ):
+      '''Returns the hash of the subtree of the container
+
+      Raises:
+         CvpError -- If container name is invalid
+      '''
+      if containerName not in self.containerHashes:
+         raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
+      return self.containerHashes[ containerName ]
+
+   def diff( self, other ):
+      '''Compares this tree, the old one, with other, the new one, descending
+      only into the subtrees whose hashes differ
+
+      Arguments:
+         other -- ( type : MerkleTree ( class ) )
+
+      Returns:
+         treeDiff -- ( type : TreeDiff ( class ) )
+      '''
+      treeDiff = TreeDiff()
+      if self.rootHash == other.rootHash:
+         treeDiff.visited = 1
+         return treeDiff
+      self._diffNames( treeDiff, 'configlets', self.configletHashes,
+            other.configletHashes )
+      self._diffNames( treeDiff, 'imageBundles', self.imageBundleHashes,
+            other.imageBundleHashes )
+      stack = list( self._pairs( self.rootNames, other.rootNames ) )
+      while stack:
+         name, inSelf, inOther = stack.pop()
+         treeDiff.visited += 1
+         if not inOther:
+            self._subtree( treeDiff.removed, name )
+         elif not inSelf:
+            other._subtree( treeDiff.added, name )
+         elif self.containerHashes[ name ] != other.containerHashes[ name ]:
+            if ( self.nodeHashes[ name ] != other.nodeHashes[ name ] and
+                  name not in self.unknownNames ):
+               treeDiff.changed[ 'containers' ].append( name )
+            self._diffNames( treeDiff, 'devices',
+                  self._deviceHashes( name ), other._deviceHashes( name ) )
+            stack.extend( self._pairs( self.children[ name ],
+               other.children[ name ] ) )
+      treeDiff._finish()
+      return treeDiff
+
+   @staticmethod
+   def _pairs( names, otherNames ):
+      '''Returns ( name, in names, in otherNames ) for the union of names'''
+      names = set( names )
+      otherNames = set( otherNames )
+      return [ ( name, name in names, name in otherNames )
+            for name in sorted( names | otherNames ) ]
+
+   def _deviceHashes( self, containerName ):
+      '''Returns the hashes of the devices directly under a container'''
+      return dict( ( ipAddress, self.deviceHashes[ ipAddress ] )
+            for ipAddress in self.devices.get( containerName, [] ) )
+
+   @staticmethod
+   def _diffNames( treeDiff, entityType, hashes, otherHashes ):
+      '''Records the names added, removed or changed between two hash maps'''
+      for name, value in hashes.iteritems():
+         if name not in otherHashes:
+            treeDiff.removed[ entityType ].append( name )
+         elif otherHashes[ name ] != value:
+            treeDiff.changed[ entityType ].append( name )
+      treeDiff.added[ entityType ].extend( name for name in otherHashes
+            if name not in hashes )
+
+   def _subtree( self, entities, containerName ):
+      '''Adds the containers and devices of a subtree to entities'''
+      stack = [ containerName ]
+      while stack:
+         name = stack.pop()
+         if name not in self.unknownNames:
+            entities[ 'containers' ].append( name )
+         entities[ 'devices' ].extend( self.devices.get( name, [] ) )
+         stack.extend( self.children[ name ] )
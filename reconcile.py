@@ -0,0 +1,388 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+Reconcile.py brings a Cvp instance to a desired state described
+declaratively, either as a dictionary or as a YAML file:
+
+   configlets:
+      - name: base
+        config: "hostname leaf1"
+   containers:
+      - name: Leaf
+        parentName: Tenant
+        configlets: [ base ]
+        imageBundle: eos-4.15
+   devices:
+      - ipAddress: 10.0.0.1
+        configlets: [ leaf1 ]
+        imageBundle: eos-4.15
+
+The live state is fetched once, as a CvpSnapshot, and diffed against the
+desired state. Only the operations needed to close the gap are planned:
+unchanged configlets, existing containers and mappings already in place cost
+neither a request nor a task.
+
+It contains 3 classes
+   Operation -- One step of a reconcile plan
+   ReconcilePlan -- Ordered operations bringing Cvp to the desired state
+   Reconciler -- Plans and applies the desired state
+'''
+import collections
+import cvp
+import cvpServices
+import errorCodes
+
+# requests issued by each Cvp method when called on its own, outside a change
+# set: the lookups of the keys and the saveInventory included
+REQUEST_COSTS = { 'addConfiglet' : 1, 'updateConfiglet' : 1,
+      'addContainer' : 2, 'mapConfigToContainer' : 2,
+      'removeConfigFromContainer' : 2, 'mapConfigToDevice' : 3,
+      'mapImageBundleToContainer' : 2, 'mapImageBundleToDevice' : 2 }
+
+def loadDesiredState( filePath ):
+   '''Reads a desired state from a YAML file
+
+   Arguments:
+      filePath -- path of the YAML file ( type : String )
+
+   Returns:
+      desiredState -- desired state ( type : Dict )
+   '''
+   import yaml
+   with open( filePath ) as stateFile:
+      return yaml.safe_load( stateFile ) or {}
+
+class Operation( object ):
+   '''Operation class stores one step of a reconcile plan, a call of a Cvp
+   method
+
+   state variables:
+      action -- name of the Cvp method to be called
+      target -- name or ip address of the object changed by the operation
+      args -- arguments of the Cvp method
+      detail -- what the operation changes, for reports
+   '''
+   def __init__( self, action, target, args, detail='' ):
+      self.action = action
+      self.target = target
+      self.args = args
+      self.detail = detail
+
+   def __eq__( self, that ):
+      return ( self.action == that.action and
+            self.target == that.target and
+            self.detail == that.detail )
+
+   def __repr__( self ):
+      return 'Operation( %s, %s%s )' % ( self.action, self.target,
+            ', %s' % self.detail if self.detail else '' )
+
+   def run( self, cvpInstance ):
+      '''Calls the Cvp method of the operation'''
+      return getattr( cvpInstance, self.action )( *self.args )
+
+   def jsonable( self ):
+      ''' Returns dictionary object which describes the operation'''
+      return { 'action' : self.action, 'target' : self.target,
+            'detail' : self.detail }
+
+class ReconcilePlan( object ):
+   '''ReconcilePlan class stores the operations bringing a Cvp instance to
+   the desired state, in the order they have to be applied: configlets, then
+   containers parents first, then the mappings.
+
+   state variables:
+      operations -- operations to be applied ( type : List of Operation )
+      naiveActions -- number of operations, by action, applying the desired
+                      state blindly would have taken ( type : Dict )
+      naiveCalls -- total number of those operations
+      snapshot -- live state the plan was computed from
+      requests -- number of requests Reconciler.apply issued for the plan,
+                  None until the plan is applied ( type : int )
+   '''
+   def __init__( self, operations, naiveActions, snapshot ):
+      self.operations = operations
+      self.naiveActions = dict( naiveActions )
+      self.naiveCalls = sum( self.naiveActions.values() )
+      self.snapshot = snapshot
+      self.requests = None
+
+   def __iter__( self ):
+      return iter( self.operations )
+
+   def __len__( self ):
+      return len( self.operations )
+
+   @property
+   def naiveRequests( self ):
+      '''Number of requests applying the desired state blindly, one call at a
+      time, would have taken'''
+      return sum( REQUEST_COSTS[ action ] * count
+            for action, count in self.naiveActions.iteritems() )
+
+   @property
+   def saved( self ):
+      '''Number of requests avoided by the diff and the batching, None until
+      the plan is applied'''
+      if self.requests is None:
+         return None
+      return self.naiveRequests - self.requests
+
+   def actions( self ):
+      '''Returns the number of planned operations per action ( type : Dict )'''
+      return dict( collections.Counter( operation.action
+            for operation in self.operations ) )
+
+   def report( self ):
+      '''Returns the number of planned operations per action, the number of
+      requests they took and the number of requests saved, the latter two
+      None until the plan is applied ( type : Dict )'''
+      return { 'planned' : len( self.operations ), 'naive' : self.naiveCalls,
+            'requests' : self.requests,
+            'naiveRequests' : self.naiveRequests, 'saved' : self.saved,
+            'actions' : self.actions() }
+
+   def jsonable( self ):
+      ''' Returns dictionary object which describes the plan'''
+      return { 'operations' : [ operation.jsonable()
+            for operation in self.operations ], 'report' : self.report() }
+
+class Reconciler( object ):
+   '''Reconciler class diffs a desired state against the live state of a Cvp
+   instance and applies the difference.
+
+   Public methods:
+      plan( desiredState, snapshot )
+      apply( plan, chunkSize )
+      reconcile( desiredState, dryRun )
+
+   Instance variables:
+      cvp -- Cvp instance to be reconciled ( type : Cvp ( class ) )
+      prune -- also remove the container configlets missing from the desired
+               state ( type : boolean )
+   '''
+   def __init__( self, cvpInstance, prune=False ):
+      self.cvp = cvpInstance
+      self.prune = prune
+
+   def plan( self, desiredState, snapshot=None ):
+      '''Computes the operations bringing the Cvp instance to desiredState
+
+      Arguments:
+         desiredState -- desired state, as a dictionary or the path of a YAML
+                         file ( type : Dict or String )
+         snapshot -- live state, fetched once when not provided
+            ( optional ) ( type : CvpSnapshot ( class ) )
+
+      Raises:
+         CvpError -- If a desired container has an unknown parent
+         CvpError -- If a desired device is not in the inventory
+         CvpError -- If a mapping names an unknown configlet or image bundle
+
+      Returns:
+         plan -- ( type : ReconcilePlan ( class ) )
+      '''
+      if isinstance( desiredState, basestring ):
+         desiredState = loadDesiredState( desiredState )
+      if snapshot is None:
+         snapshot = self.cvp.snapshot()
+      operations = []
+      mappings = []
+      naiveActions = collections.Counter()
+
+      configletNames = set( configlet.name for configlet in snapshot.configlets )
+      for configInfo in self._configletInfoList( desiredState ):
+         configlet = cvp.Configlet( configInfo[ 'name' ], configInfo[ 'config' ],
+               '', [], [] )
+         naiveActions[ 'updateConfiglet' if configlet.name in configletNames
+               else 'addConfiglet' ] += 1
+         if configlet.name not in configletNames:
+            operations.append( Operation( 'addConfiglet', configlet.name,
+               ( configlet, ) ) )
+            configletNames.add( configlet.name )
+         elif snapshot.configlet( configlet.name ).config != configlet.config:
+            operations.append( Operation( 'updateConfiglet', configlet.name,
+               ( configlet, ) ) )
+      imageBundleNames = set( imageBundle.name
+            for imageBundle in snapshot.imageBundles )
+
+      containerInfoList = self._sortContainers(
+            desiredState.get( 'containers' ) or [], snapshot )
+      for containerInfo in containerInfoList:
+         name = containerInfo[ 'name' ]
+         parentName = containerInfo.get( 'parentName' ) or \
+               snapshot.containerIndex.rootName
+         naiveActions[ 'addContainer' ] += 1
+         if name in snapshot.containerIndex:
+            current = snapshot.container( name )
+         else:
+            current = cvp.Container( name, '', '', [], '', parentName )
+            operations.append( Operation( 'addContainer', name, ( current, ),
+               'under %s' % parentName ) )
+         mappings.extend( self._configletOperations( 'Container', current,
+            current.configlets, containerInfo, configletNames ) )
+         naiveActions[ 'mapConfigToContainer' ] += 1 if containerInfo.get(
+               'configlets' ) else 0
+         mappings.extend( self._imageBundleOperations( 'Container', current,
+            current.imageBundle, containerInfo, imageBundleNames ) )
+         naiveActions[ 'mapImageBundleToContainer' ] += 1 if containerInfo.get(
+               'imageBundle' ) else 0
+
+      for deviceInfo in desiredState.get( 'devices' ) or []:
+         current = snapshot.deviceByIp( deviceInfo[ 'ipAddress' ] )
+         mappings.extend( self._configletOperations( 'Device', current,
+            current.configlets, deviceInfo, configletNames ) )
+         naiveActions[ 'mapConfigToDevice' ] += 1 if deviceInfo.get(
+               'configlets' ) else 0
+         mappings.extend( self._imageBundleOperations( 'Device', current,
+            current.imageBundle, deviceInfo, imageBundleNames ) )
+         naiveActions[ 'mapImageBundleToDevice' ] += 1 if deviceInfo.get(
+               'imageBundle' ) else 0
+      return ReconcilePlan( operations + mappings, naiveActions, snapshot )
+
+   @staticmethod
+   def _configletInfoList( desiredState ):
+      '''Returns the desired configlets as a list of dictionaries, accepting
+      both a list and a dictionary mapping names to configurations'''
+      configlets = desiredState.get( 'configlets' ) or []
+      if isinstance( configlets, dict ):
+         return [ { 'name' : name, 'config' : config }
+               for name, config in sorted( configlets.items() ) ]
+      return configlets
+
+   @staticmethod
+   def _sortContainers( containerInfoList, snapshot ):
+      '''Orders the desired containers so that every container comes after
+      its parent
+
+      Raises:
+         CvpError -- If a parent is neither live nor desired
+      '''
+      pending = list( containerInfoList )
+      known = set( snapshot.containerIndex.nameToKey )
+      ordered = []
+      while pending:
+         remaining = [ containerInfo for containerInfo in pending
+               if containerInfo.get( 'parentName' ) and
+               containerInfo[ 'parentName' ] not in known ]
+         ready = [ containerInfo for containerInfo in pending
+               if containerInfo not in remaining ]
+         if not ready:
+            raise cvpServices.CvpError( errorCodes.INVALID_CONTAINER_NAME )
+         ordered.extend( ready )
+         known.update( containerInfo[ 'name' ] for containerInfo in ready )
+         pending = remaining
+      return ordered
+
+   def _configletOperations( self, kind, current, currentNames, desiredInfo,
+         configletNames ):
+      '''Returns the operation mapping the missing configlets to a device or
+      container, with prune leaving out the extra container configlets, or
+      with prune and nothing missing the operation removing the extra ones'''
+      desiredNames = desiredInfo.get( 'configlets' )
+      if desiredNames is None:
+         return []
+      for configName in desiredNames:
+         if configName not in configletNames:
+            raise cvpServices.CvpError( errorCodes.INVALID_CONFIGLET_NAME )
+      currentNames = currentNames or []
+      target = desiredInfo.get( 'name' ) or desiredInfo.get( 'ipAddress' )
+      prune = self.prune and kind == 'Container'
+      missing = [ name for name in desiredNames if name not in currentNames ]
+      extra = [ name for name in currentNames if name not in desiredNames ]
+      if missing:
+         # the associate action replaces the mapped list: keep the current
+         # ones, but the extra ones when pruning, which a removal in the same
+         # change set would contradict
+         kept = [ name for name in currentNames
+               if not prune or name in desiredNames ]
+         return [ Operation( 'mapConfigTo%s' % kind, target,
+            ( current, kept + missing ), ', '.join( missing ) ) ]
+      if prune and extra:
+         return [ Operation( 'removeConfigFromContainer', target,
+            ( current, extra ), ', '.join( extra ) ) ]
+      return []
+
+   @staticmethod
+   def _imageBundleOperations( kind, current, currentName, desiredInfo,
+         imageBundleNames ):
+      '''Returns the operation mapping the desired image bundle to a device
+      or container, if it is not mapped yet'''
+      imageBundleName = desiredInfo.get( 'imageBundle' )
+      if not imageBundleName or imageBundleName == currentName:
+         return []
+      if imageBundleName not in imageBundleNames:
+         raise cvpServices.CvpError( errorCodes.INVALID_IMAGE_BUNDLE_NAME )
+      target = desiredInfo.get( 'name' ) or desiredInfo.get( 'ipAddress' )
+      return [ Operation( 'mapImageBundleTo%s' % kind, target,
+         ( current, imageBundleName ), imageBundleName ) ]
+
+   def apply( self, plan, chunkSize=cvpServices.DEFAULT_CHANGE_SET_CHUNK_SIZE ):
+      '''Applies the operations of plan in order. Configlets and containers
+      are created first, since the mappings need their keys, the containers
+      one depth level at a time; the mappings are then saved together in a
+      change set.
+
+      Arguments:
+         plan -- ( type : ReconcilePlan ( class ) )
+         chunkSize -- maximum number of mapping actions saved by one request
+                      ( type : int )
+
+      Raises:
+         CvpError -- If a configlet or container cannot be created
+
+      Returns:
+         failures -- mapping chunks which could not be saved, as ( chunk
+                     number, actions, CvpError ) tuples ( type : List of Tuple )
+
+      The requests issued are counted into plan.requests, from the request
+      count of the connection pool, hence they include the requests other
+      threads sharing the Cvp instance issue meanwhile.
+      '''
+      startCount = self.cvp.cvpService.connectionStats()[ 'requests' ]
+      try:
+         return self._apply( plan, chunkSize )
+      finally:
+         plan.requests = ( self.cvp.cvpService.connectionStats()[ 'requests' ]
+               - startCount )
+
+   def _apply( self, plan, chunkSize ):
+      '''Applies the operations of plan, see apply'''
+      containers = []
+      mappings = []
+      for operation in plan:
+         if operation.action in ( 'addConfiglet', 'updateConfiglet' ):
+            operation.run( self.cvp )
+         elif operation.action == 'addContainer':
+            containers.extend( operation.args )
+         else:
+            mappings.append( operation )
+      if containers:
+         self.cvp.addContainers( containers )
+      if not mappings:
+         return []
+      with self.cvp.changeSet( chunkSize, raiseOnFailure=False ) as changes:
+         for operation in mappings:
+            operation.run( self.cvp )
+      return changes.failures
+
+   def reconcile( self, desiredState, dryRun=False ):
+      '''Plans the desired state against the live state and, unless dryRun,
+      applies the plan
+
+      Arguments:
+         desiredState -- desired state, as a dictionary or the path of a YAML
+                         file ( type : Dict or String )
+         dryRun -- only compute the plan ( type : boolean )
+
+      Returns:
+         plan -- ( type : ReconcilePlan ( class ) )
+         failures -- mapping chunks which could not be saved
+                     ( type : List of Tuple )
+      '''
+      plan = self.plan( desiredState )
+      failures = [] if dryRun else self.apply( plan )
+      return plan, failures
@@ -0,0 +1,406 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+SnapshotFile.py stores a CvpSnapshot in a compact binary file which is
+read through mmap, so that opening a snapshot costs nothing and looking up
+one device or one configlet only touches the pages holding it.
+
+The file starts with a header and a table of sections:
+
+   strings -- every distinct string once, as an offset array and a blob
+   lists -- arrays of string ids ( configlet names, ip addresses ... )
+   bodies -- configlet configurations, out of line
+   devices, containers, configlets, imageBundles -- fixed size records
+                                                   made of string ids
+   *Index -- record numbers sorted by ip address or name, searched by
+             bisection
+
+All integers are little endian. Strings are utf-8 and interned: each is
+stored once and records refer to it by id. A list field holding no list,
+None or an empty string, has the offset NONE_ID and the id of its value as
+length; a configlet without body has the length NONE_ID. Hence every model
+reads back equal to the one written.
+
+It contains 1 class
+   SnapshotFile -- Read only, memory mapped snapshot
+'''
+import json
+import mmap
+import struct
+import cvp
+import cvpServices
+import errorCodes
+
+MAGIC = 'CVPS'
+FORMAT_VERSION = 2
+# versions SnapshotFile can read, version 1 did not keep None and '' lists
+READ_VERSIONS = ( 1, 2 )
+# string id standing for None, list offset and body length of no value
+NONE_ID = 0xffffffff
+SECTIONS = ( 'strings', 'lists', 'bodies', 'devices', 'containers',
+      'configlets', 'imageBundles', 'deviceIndex', 'containerIndex',
+      'configletIndex', 'imageBundleIndex' )
+HEADER = struct.Struct( '<4sHHd' )
+SECTION = struct.Struct( '<QQ' )
+UINT = struct.Struct( '<I' )
+# ipAddress fqdn key containerName containerId imageBundle, configlets list
+DEVICE = struct.Struct( '<6I2I' )
+# name key parentId parentName imageBundle, configlets list
+CONTAINER = struct.Struct( '<5I2I' )
+# name key, body offset and length, containers list, devices list
+CONFIGLET = struct.Struct( '<2IQI4I' )
+# name key certified, imageKeys list, containers list, devices list
+IMAGE_BUNDLE = struct.Struct( '<3I6I' )
+
+class _Writer( object ):
+   '''Accumulates the sections of a snapshot file'''
+   def __init__( self ):
+      self.stringIds = {}
+      self.strings = []
+      self.lists = []
+      self.bodies = []
+      self.bodySize = 0
+
+   def string( self, value ):
+      '''Returns the id of value, interning it'''
+      if value is None:
+         return NONE_ID
+      if isinstance( value, str ):
+         value = value.decode( 'utf-8' )
+      elif not isinstance( value, unicode ):
+         value = unicode( value )
+      stringId = self.stringIds.get( value )
+      if stringId is None:
+         stringId = self.stringIds[ value ] = len( self.strings )
+         self.strings.append( value.encode( 'utf-8' ) )
+      return stringId
+
+   def stringList( self, values ):
+      '''Stores a list of strings, returns its offset and length, or NONE_ID
+      and the id of values if values is not a list'''
+      if not isinstance( values, ( list, tuple ) ):
+         return NONE_ID, self.string( values )
+      offset = len( self.lists )
+      self.lists.extend( self.string( value ) for value in values )
+      return offset, len( self.lists ) - offset
+
+   def body( self, config ):
+      '''Stores a configlet body, returns its offset and length, NONE_ID as
+      length if config is None'''
+      if config is None:
+         return 0, NONE_ID
+      if isinstance( config, unicode ):
+         config = config.encode( 'utf-8' )
+      offset = self.bodySize
+      self.bodies.append( config )
+      self.bodySize += len( config )
+      return offset, len( config )
+
+   def stringSection( self ):
+      '''Returns the strings section'''
+      offsets = [ 0 ]
+      for value in self.strings:
+         offsets.append( offsets[ -1 ] + len( value ) )
+      return ( UINT.pack( len( self.strings ) ) +
+            struct.pack( '<%dI' % len( offsets ), *offsets ) +
+            ''.join( self.strings ) )
+
+def writeSnapshot( snapshot, filePath ):
+   '''Writes snapshot to filePath
+
+   Arguments:
+      snapshot -- ( type : CvpSnapshot ( class ) )
+      filePath -- path of the snapshot file ( type : String )
+   '''
+   writer = _Writer()
+   devices = ''.join( DEVICE.pack( writer.string( device.ipAddress ),
+         writer.string( device.fqdn ), writer.string( device.key ),
+         writer.string( device.containerName ),
+         writer.string( device.containerId ),
+         writer.string( device.imageBundle ),
+         *writer.stringList( device.configlets ) )
+         for device in snapshot.devices )
+   containers = ''.join( CONTAINER.pack( writer.string( container.name ),
+         writer.string( container.key ), writer.string( container.parentId ),
+         writer.string( container.parentName ),
+         writer.string( container.imageBundle ),
+         *writer.stringList( container.configlets ) )
+         for container in snapshot.containers )
+   configlets = ''.join( CONFIGLET.pack( writer.string( configlet.name ),
+         writer.string( configlet.key ),
+         *( writer.body( configlet.config ) +
+            writer.stringList( configlet.containerList ) +
+            writer.stringList( configlet.deviceList ) ) )
+         for configlet in snapshot.configlets )
+   imageBundles = ''.join( IMAGE_BUNDLE.pack( writer.string( bundle.name ),
+         writer.string( bundle.key ),
+         writer.string( json.dumps( bundle.certified ) ),
+         *( writer.stringList( bundle.imageKeys ) +
+            writer.stringList( bundle.containerList ) +
+            writer.stringList( bundle.deviceList ) ) )
+         for bundle in snapshot.imageBundles )
+
+   def sortKey( value ):
+      stringId = writer.string( value )
+      return '' if stringId == NONE_ID else writer.strings[ stringId ]
+
+   def index( entityList, attribute ):
+      order = sorted( range( len( entityList ) ), key=lambda number:
+            sortKey( getattr( entityList[ number ], attribute ) ) )
+      return struct.pack( '<%dI' % len( order ), *order )
+
+   sections = { 'devices' : devices, 'containers' : containers,
+         'configlets' : configlets, 'imageBundles' : imageBundles,
+         'deviceIndex' : index( snapshot.devices, 'ipAddress' ),
+         'containerIndex' : index( snapshot.containers, 'name' ),
+         'configletIndex' : index( snapshot.configlets, 'name' ),
+         'imageBundleIndex' : index( snapshot.imageBundles, 'name' ) }
+   sections[ 'strings' ] = writer.stringSection()
+   sections[ 'lists' ] = struct.pack( '<%dI' % len( writer.lists ),
+         *writer.lists )
+   sections[ 'bodies' ] = ''.join( writer.bodies )
+
+   offset = HEADER.size + SECTION.size * len( SECTIONS )
+   table = []
+   for name in SECTIONS:
+      table.append( SECTION.pack( offset, len( sections[ name ] ) ) )
+      offset += len( sections[ name ] )
+   with open( filePath, 'wb' ) as snapshotFile:
+      snapshotFile.write( HEADER.pack( MAGIC, FORMAT_VERSION, 0,
+         snapshot.timestamp ) )
+      snapshotFile.write( ''.join( table ) )
+      for name in SECTIONS:
+         snapshotFile.write( sections[ name ] )
+
+class SnapshotFile( object ):
+   '''SnapshotFile class reads a snapshot file through mmap. Records are
+   decoded on demand and strings are decoded once.
+
+   Public methods:
+      deviceByIp( ipAddress )
+      container( containerName )
+      configlet( configletName )
+      imageBundle( imageBundleName )
+      devices()
+      containers()
+      configlets()
+      imageBundles()
+      load()
+      close()
+
+   Instance variables:
+      timestamp -- time at which the snapshot was taken
+      deviceCount, containerCount, configletCount, imageBundleCount --
+         number of records of each kind
+   '''
+   def __init__( self, filePath ):
+      '''Constructer for the SnapshotFile class, maps filePath
+
+      Raises:
+         ValueError -- If filePath is not a snapshot file
+      '''
+      with open( filePath, 'rb' ) as snapshotFile:
+         self._map = mmap.mmap( snapshotFile.fileno(), 0,
+               access=mmap.ACCESS_READ )
+      magic, version, _, self.timestamp = HEADER.unpack_from( self._map, 0 )
+      if magic != MAGIC or version not in READ_VERSIONS:
+         self._map.close()
+         raise ValueError( '%s is not a snapshot file' % filePath )
+      self._sections = {}
+      for number, name in enumerate( SECTIONS ):
+         self._sections[ name ] = SECTION.unpack_from( self._map,
+               HEADER.size + SECTION.size * number )
+      self._stringBase = self._sections[ 'strings' ][ 0 ]
+      self._stringCount = UINT.unpack_from( self._map, self._stringBase )[ 0 ]
+      self._stringCache = {}
+      self.deviceCount = self._count( 'devices', DEVICE )
+      self.containerCount = self._count( 'containers', CONTAINER )
+      self.configletCount = self._count( 'configlets', CONFIGLET )
+      self.imageBundleCount = self._count( 'imageBundles', IMAGE_BUNDLE )
+
+   def close( self ):
+      '''Unmaps the file'''
+      self._map.close()
+
+   def __enter__( self ):
+      return self
+
+   def __exit__( self, excType, excValue, traceback ):
+      self.close()
+      return False
+
+   def _count( self, section, record ):
+      '''Returns the number of records of a section'''
+      return self._sections[ section ][ 1 ] // record.size
+
+   def _string( self, stringId ):
+      '''Returns the string having id stringId'''
+      if stringId == NONE_ID:
+         return None
+      value = self._stringCache.get( stringId )
+      if value is None:
+         position = self._stringBase + UINT.size * ( stringId + 1 )
+         start, end = struct.unpack_from( '<2I', self._map, position )
+         blob = self._stringBase + UINT.size * ( self._stringCount + 2 )
+         value = self._map[ blob + start : blob + end ].decode( 'utf-8' )
+         self._stringCache[ stringId ] = value
+      return value
+
+   def _stringList( self, offset, length ):
+      '''Returns a list of strings stored in the lists section, or the value
+      stored in place of a list'''
+      if offset == NONE_ID:
+         return self._string( length )
+      base = self._sections[ 'lists' ][ 0 ] + UINT.size * offset
+      return [ self._string( stringId ) for stringId in
+            struct.unpack_from( '<%dI' % length, self._map, base ) ]
+
+   def _record( self, section, record, number ):
+      '''Returns the fields of record number of a section'''
+      return record.unpack_from( self._map,
+            self._sections[ section ][ 0 ] + record.size * number )
+
+   def _find( self, section, record, indexSection, name ):
+      '''Returns the number of the record whose first field is name, by
+      bisection of the index, or None'''
+      indexBase = self._sections[ indexSection ][ 0 ]
+      low, high = 0, self._count( section, record )
+      if isinstance( name, str ):
+         name = name.decode( 'utf-8' )
+      # the index sorts None as an empty string
+      nameKey = ( name or u'' ).encode( 'utf-8' )
+      while low < high:
+         middle = ( low + high ) // 2
+         number = UINT.unpack_from( self._map, indexBase +
+               UINT.size * middle )[ 0 ]
+         current = self._string( self._record( section, record, number )[ 0 ] )
+         if ( current or u'' ).encode( 'utf-8' ) < nameKey:
+            low = middle + 1
+         elif current == name:
+            return number
+         else:
+            high = middle
+      return None
+
+   def _device( self, number ):
+      '''Decodes device record number'''
+      fields = self._record( 'devices', DEVICE, number )
+      strings = [ self._string( stringId ) for stringId in fields[ : 6 ] ]
+      return cvp.Device( *( strings + [ self._stringList( *fields[ 6 : ] ) ] ) )
+
+   def _container( self, number ):
+      '''Decodes container record number'''
+      fields = self._record( 'containers', CONTAINER, number )
+      name, key, parentId, parentName, imageBundle = [ self._string( stringId )
+            for stringId in fields[ : 5 ] ]
+      return cvp.Container( name, key, parentId,
+            self._stringList( *fields[ 5 : ] ), imageBundle, parentName )
+
+   def _configlet( self, number ):
+      '''Decodes configlet record number, reading its body'''
+      fields = self._record( 'configlets', CONFIGLET, number )
+      config = None
+      if fields[ 3 ] != NONE_ID:
+         base = self._sections[ 'bodies' ][ 0 ] + fields[ 2 ]
+         config = self._map[ base : base + fields[ 3 ] ].decode( 'utf-8' )
+      return cvp.Configlet( self._string( fields[ 0 ] ), config,
+            self._string( fields[ 1 ] ), self._stringList( *fields[ 4 : 6 ] ),
+            self._stringList( *fields[ 6 : 8 ] ) )
+
+   def _imageBundle( self, number ):
+      '''Decodes image bundle record number'''
+      fields = self._record( 'imageBundles', IMAGE_BUNDLE, number )
+      return cvp.ImageBundle( self._string( fields[ 0 ] ),
+            self._string( fields[ 1 ] ), self._stringList( *fields[ 3 : 5 ] ),
+            json.loads( self._string( fields[ 2 ] ) ),
+            self._stringList( *fields[ 5 : 7 ] ),
+            self._stringList( *fields[ 7 : 9 ] ) )
+
+   def _lookup( self, section, record, decode, name, errorCode ):
+      '''Returns the decoded record named name or raises CvpError'''
+      number = self._find( section, record, section[ : -1 ] + 'Index', name )
+      if number is None:
+         raise cvpServices.CvpError( errorCode )
+      return decode( number )
+
+   def deviceByIp( self, ipAddress ):
+      '''Returns the device having ip address ipAddress
+
+      Raises:
+         CvpError -- If there is no device with that ip address
+      '''
+      return self._lookup( 'devices', DEVICE, self._device, ipAddress,
+            errorCodes.INVALID_DEVICE_IP_ADDRESS )
+
+   def container( self, containerName ):
+      '''Returns the container named containerName
+
+      Raises:
+         CvpError -- If container name is invalid
+      '''
+      return self._lookup( 'containers', CONTAINER, self._container,
+            containerName, errorCodes.INVALID_CONTAINER_NAME )
+
+   def configlet( self, configletName ):
+      '''Returns the configlet named configletName
+
+      Raises:
+         CvpError -- If configlet name is invalid
+      '''
+      return self._lookup( 'configlets', CONFIGLET, self._configlet,
+            configletName, errorCodes.INVALID_CONFIGLET_NAME )
+
+   def imageBundle( self, imageBundleName ):
+      '''Returns the image bundle named imageBundleName
+
+      Raises:
+         CvpError -- If image bundle name is invalid
+      '''
+      return self._lookup( 'imageBundles', IMAGE_BUNDLE, self._imageBundle,
+            imageBundleName, errorCodes.INVALID_IMAGE_BUNDLE_NAME )
+
+   def devices( self ):
+      '''Returns a generator of all the devices'''
+      return ( self._device( number ) for number in xrange( self.deviceCount ) )
+
+   def containers( self ):
+      '''Returns a generator of all the containers'''
+      return ( self._container( number )
+            for number in xrange( self.containerCount ) )
+
+   def configlets( self ):
+      '''Returns a generator of all the configlets'''
+      return ( self._configlet( number )
+            for number in xrange( self.configletCount ) )
+
+   def imageBundles( self ):
+      '''Returns a generator of all the image bundles'''
+      return ( self._imageBundle( number )
+            for number in xrange( self.imageBundleCount ) )
+
+   def load( self ):
+      '''Decodes the whole file into a CvpSnapshot
+
+      Returns:
+         snapshot -- ( type : CvpSnapshot ( class ) )
+      '''
+      containerList = list( self.containers() )
+      nodes = dict( ( container.key, { 'name' : container.name,
+            'key' : container.key, 'parentContainerId' : container.parentId,
+            'childContainerList' : [] } ) for container in containerList )
+      rootContainer = None
+      for container in containerList:
+         node = nodes[ container.key ]
+         if container.parentId in nodes:
+            nodes[ container.parentId ][ 'childContainerList' ].append( node )
+         elif rootContainer is None:
+            rootContainer = node
+      # a snapshot without containers has no container index
+      containerIndex = None
+      if rootContainer is not None:
+         containerIndex = cvp.ContainerIndex( rootContainer )
+      return cvp.CvpSnapshot( self.timestamp, self.devices(), containerList,
+            self.configlets(), self.imageBundles(), containerIndex )
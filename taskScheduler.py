@@ -0,0 +1,134 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+TaskScheduler is used for executing many Cvp tasks concurrently. At most
+maxInFlight executions are in progress at once. Tasks can be grouped, for
+instance by container or by device: groups are served in round robin and at
+most maxPerGroup executions of the same group are in progress at once, so
+that a single pod is never flooded.
+
+It contains 1 class
+   TaskScheduler -- Executes tasks within a bounded concurrency window
+'''
+import collections
+import threading
+import time
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+class TaskScheduler( object ):
+   '''TaskScheduler class executes tasks from a bounded pool of worker
+   threads.
+
+   Public methods:
+      run( taskList )
+      stats()
+
+   Instance variables:
+      executeTask -- function executing one task given its details
+      maxInFlight -- maximum number of executions in progress
+      groupKey -- function returning the group of a task, None when tasks
+                  are not grouped
+      maxPerGroup -- maximum number of executions of the same group in
+                     progress, None for no limit
+   '''
+   def __init__( self, executeTask, maxInFlight=DEFAULT_MAX_IN_FLIGHT,
+         groupKey=None, maxPerGroup=None ):
+      '''Constructer for the TaskScheduler class
+
+      Arguments:
+         executeTask -- called with the details of each task ( type : callable )
+         maxInFlight -- maximum number of executions in progress ( type : int )
+         groupKey -- called with the details of each task, returns its group
+                     ( optional ) ( type : callable )
+         maxPerGroup -- maximum number of executions of the same group in
+                        progress ( optional ) ( type : int )
+
+      Raises:
+         ValueError -- If maxPerGroup is less than 1, no task could ever run
+      '''
+      if maxPerGroup is not None and maxPerGroup < 1:
+         raise ValueError( 'maxPerGroup must be at least 1, got %r' %
+               maxPerGroup )
+      self.executeTask = executeTask
+      self.maxInFlight = max( 1, maxInFlight )
+      self.groupKey = groupKey
+      self.maxPerGroup = maxPerGroup
+      self._condition = threading.Condition()
+      self._queues = collections.OrderedDict()
+      self._inFlight = collections.defaultdict( int )
+      self._failures = collections.OrderedDict()
+      self._executed = 0
+      self._elapsed = 0.0
+
+   def _nextTask( self ):
+      '''Waits for a task which can be started without exceeding maxPerGroup
+      and returns it with its group, or None once every task was started'''
+      with self._condition:
+         while self._queues:
+            for group, queue in self._queues.items():
+               if ( self.maxPerGroup is None or
+                     self._inFlight[ group ] < self.maxPerGroup ):
+                  task = queue.popleft()
+                  # serve the other groups before this one again
+                  del self._queues[ group ]
+                  if queue:
+                     self._queues[ group ] = queue
+                  self._inFlight[ group ] += 1
+                  return group, task
+            self._condition.wait()
+         return None
+
+   def _worker( self ):
+      '''Executes tasks until there is none left to start'''
+      while True:
+         nextTask = self._nextTask()
+         if nextTask is None:
+            return
+         group, task = nextTask
+         error = None
+         try:
+            self.executeTask( task )
+         except Exception as e:
+            error = e
+         with self._condition:
+            self._inFlight[ group ] -= 1
+            self._executed += 1
+            if error is not None:
+               self._failures[ task[ 'workOrderId' ] ] = error
+            self._condition.notify_all()
+
+   def run( self, taskList ):
+      '''Executes every task of taskList and waits for all of them
+
+      Arguments:
+         taskList -- details of the tasks, as returned by getTasks
+                     ( type : List of Dict )
+
+      Returns:
+         failures -- exception raised for each task which could not be
+                     executed, keyed by work order Id ( type : Dict )
+      '''
+      startTime = time.time()
+      with self._condition:
+         for task in taskList:
+            group = self.groupKey( task ) if self.groupKey else None
+            self._queues.setdefault( group, collections.deque() ).append( task )
+      workers = [ threading.Thread( target=self._worker )
+            for _ in range( min( self.maxInFlight, len( taskList ) ) ) ]
+      for worker in workers:
+         worker.daemon = True
+         worker.start()
+      for worker in workers:
+         worker.join()
+      self._elapsed += time.time() - startTime
+      return dict( self._failures )
+
+   def stats( self ):
+      '''Returns the number of executed and failed tasks and the time spent
+      in run ( type : Dict )'''
+      return { 'executed' : self._executed, 'failed' : len( self._failures ),
+            'elapsed' : self._elapsed }
@@ -0,0 +1,157 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+Tests of deviceTable: filters, selections and aggregates over a small
+fleet, and over one with more distinct values than MAX_BITMAP_VALUES.
+
+Usage:
+   python -m unittest discover -s tests -p 'test*.py'
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+   os.path.abspath( __file__ ) ) ) )
+import cvp
+import deviceTable
+
+def makeDevices( count ):
+   '''Returns count devices spread over leaf1, leaf2 and spine, every third
+   one without configlets'''
+   containers = [ 'leaf1', 'leaf2', 'spine' ]
+   configlets = [ [], [ 'base' ], [ 'base', 'ntp' ] ]
+   return [ cvp.Device( '10.%d.%d.%d' % ( number >> 16, number >> 8 & 255,
+      number & 255 ), 'sw%d' % number, 'm%d' % number,
+      containers[ number % 3 ], 'c%d' % ( number % 3 ),
+      'eos-%d' % ( number % 2 ), configlets[ number % 3 ] )
+      for number in xrange( count ) ]
+
+class DeviceTableTest( unittest.TestCase ):
+   '''Queries a table of six devices'''
+   def setUp( self ):
+      self.devices = makeDevices( 6 )
+      self.table = deviceTable.DeviceTable( self.devices )
+
+   def ipAddresses( self, selection ):
+      '''Returns the ip addresses of the selected rows'''
+      return self.table.values( 'ipAddress', selection )
+
+   def testWhere( self ):
+      table = self.table
+      self.assertEqual( [ '10.0.0.0', '10.0.0.3' ],
+            self.ipAddresses( table.where( 'containerName', 'leaf1' ) ) )
+      self.assertEqual( [ '10.0.0.0', '10.0.0.2', '10.0.0.3', '10.0.0.5' ],
+            self.ipAddresses( table.where( 'containerName',
+               [ 'leaf1', 'spine', 'unknown' ] ) ) )
+      self.assertEqual( [ '10.0.0.0', '10.0.0.1', '10.0.0.3', '10.0.0.4' ],
+            self.ipAddresses( table.where( 'containerName',
+               lambda name: name.startswith( 'leaf' ) ) ) )
+      self.assertFalse( table.where( 'containerName', 'unknown' ) )
+
+   def testWhereConfiglets( self ):
+      table = self.table
+      self.assertEqual( [ '10.0.0.1', '10.0.0.2', '10.0.0.4', '10.0.0.5' ],
+            self.ipAddresses( table.where( 'configlets', 'base' ) ) )
+      self.assertEqual( [ '10.0.0.2', '10.0.0.5' ],
+            self.ipAddresses( table.where( 'configlets', 'ntp' ) ) )
+      self.assertEqual( [ [], [ 'base' ], [ 'base', 'ntp' ] ] * 2,
+            table.values( 'configlets' ) )
+
+   def testSelections( self ):
+      table = self.table
+      leaf1 = table.where( 'containerName', 'leaf1' )
+      even = table.where( 'imageBundle', 'eos-0' )
+      self.assertEqual( [ 0 ], list( leaf1 & even ) )
+      self.assertEqual( [ 0, 2, 3, 4 ], list( leaf1 | even ) )
+      self.assertEqual( [ 3 ], list( leaf1 - even ) )
+      self.assertEqual( [ 1, 2, 4, 5 ], list( ~leaf1 ) )
+      self.assertEqual( 2, len( leaf1 ) )
+      self.assertEqual( 6, len( table.all() ) )
+      self.assertEqual( 0, len( table.none() ) )
+      self.assertEqual( 6, len( ~table.none() ) )
+      other = deviceTable.DeviceTable( self.devices )
+      self.assertRaises( ValueError, lambda: leaf1 & other.all() )
+
+   def testGroupCount( self ):
+      table = self.table
+      self.assertEqual( { 'leaf1' : 2, 'leaf2' : 2, 'spine' : 2 },
+            table.groupCount( 'containerName' ) )
+      self.assertEqual( { 'base' : 4, 'ntp' : 2 },
+            table.groupCount( 'configlets' ) )
+      leaves = table.where( 'containerName', [ 'leaf1', 'leaf2' ] )
+      self.assertEqual( { 'eos-0' : 2, 'eos-1' : 2 },
+            table.groupCount( 'imageBundle', leaves ) )
+      self.assertEqual( { 'base' : 2 }, table.groupCount( 'configlets',
+         leaves ) )
+      self.assertEqual( {}, table.groupCount( 'imageBundle', table.none() ) )
+
+   def testDevices( self ):
+      table = self.table
+      self.assertEqual( [ device.jsonable() for device in self.devices ],
+            [ device.jsonable() for device in table.devices() ] )
+      self.assertEqual( self.devices[ 4 ].jsonable(),
+            table.device( 4 ).jsonable() )
+      spine = table.devices( table.where( 'containerName', 'spine' ) )
+      self.assertEqual( [ 'sw2', 'sw5' ], [ device.fqdn for device in spine ] )
+
+   def testJoin( self ):
+      table = self.table
+      configlets = [ cvp.Configlet( 'base', 'ntp server 1.1.1.1\n', 'k0', [],
+         [] ), cvp.Configlet( 'unused', '', 'k1', [], [] ) ]
+      pairs = table.join( 'configlets', configlets,
+            table.where( 'containerName', 'spine' ) )
+      self.assertEqual( [ ( '10.0.0.2', 'base' ), ( '10.0.0.5', 'base' ) ],
+            [ ( ipAddress, configlet.name )
+               for ipAddress, configlet in pairs ] )
+      bundles = [ cvp.ImageBundle( 'eos-1', 'b1', [], True, [], [] ) ]
+      self.assertEqual( [ '10.0.0.1', '10.0.0.3', '10.0.0.5' ],
+            [ ipAddress for ipAddress, _ in table.join( 'imageBundle',
+               bundles ) ] )
+
+   def testUnknownColumn( self ):
+      table = self.table
+      self.assertRaises( KeyError, table.where, 'model', 'x' )
+      self.assertRaises( KeyError, table.values, 'model' )
+      self.assertRaises( KeyError, table.groupCount, 'model' )
+
+   def testEmptyTable( self ):
+      table = deviceTable.DeviceTable()
+      self.assertEqual( 0, len( table ) )
+      self.assertFalse( table.all() )
+      self.assertFalse( ~table.all() )
+      self.assertFalse( table.where( 'containerName', 'leaf1' ) )
+      self.assertEqual( {}, table.groupCount( 'configlets' ) )
+      self.assertEqual( [], table.devices() )
+
+class LargeDeviceTableTest( unittest.TestCase ):
+   '''Queries columns with more distinct values than MAX_BITMAP_VALUES'''
+   def setUp( self ):
+      self.count = deviceTable.MAX_BITMAP_VALUES * 2
+      self.table = deviceTable.DeviceTable( makeDevices( self.count ) )
+
+   def testWhere( self ):
+      table = self.table
+      selection = table.where( 'ipAddress', [ '10.0.0.7', '10.0.1.2' ] )
+      self.assertEqual( [ 7, 258 ], list( selection ) )
+      selection = table.where( 'fqdn', lambda fqdn: fqdn.endswith( '00' ) )
+      self.assertEqual( [ 100, 200, 300, 400, 500 ], list( selection ) )
+      spine = table.where( 'containerName', 'spine' )
+      self.assertEqual( [ 200, 500 ], list( selection & spine ) )
+
+   def testGroupCount( self ):
+      table = self.table
+      counts = table.groupCount( 'ipAddress' )
+      self.assertEqual( self.count, len( counts ) )
+      self.assertEqual( set( [ 1 ] ), set( counts.values() ) )
+      spine = table.where( 'containerName', 'spine' )
+      counts = table.groupCount( 'ipAddress', spine )
+      self.assertEqual( len( spine ), len( counts ) )
+      self.assertEqual( 1, counts[ '10.0.0.2' ] )
+      self.assertNotIn( '10.0.0.1', counts )
+
+if __name__ == '__main__':
+   unittest.main()
@@ -0,0 +1,136 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+Tests of merkleTree: the hashes change with the subtree they cover and the
+diff of two trees reports the entities changed.
+
+Usage:
+   python -m unittest discover -s tests -p 'test*.py'
+'''
+import os
+import sys
+import unittest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+   os.path.abspath( __file__ ) ) ) )
+import cvp
+import cvpServices
+import merkleTree
+
+def makeSnapshot( extraContainer=False ):
+   '''Returns a snapshot of Tenant holding dc1 and dc2, dc1 holding rack1 and
+   rack2, with two devices per rack, and with extraContainer a rack3 under
+   dc2 holding one device'''
+   def node( name, key, parentKey, children=() ):
+      return { 'name' : name, 'key' : key, 'parentContainerId' : parentKey,
+            'childContainerList' : list( children ) }
+   dc2Children = [ node( 'rack3', 'c5', 'c2' ) ] if extraContainer else []
+   rootContainer = node( 'Tenant', 'root', None, [
+         node( 'dc1', 'c1', 'root', [ node( 'rack1', 'c3', 'c1' ),
+            node( 'rack2', 'c4', 'c1' ) ] ),
+         node( 'dc2', 'c2', 'root', dc2Children ) ] )
+   containers = [ cvp.Container( 'Tenant', 'root', None, [], '', None ),
+         cvp.Container( 'dc1', 'c1', 'root', [ 'base' ], 'eos-1', 'Tenant' ),
+         cvp.Container( 'dc2', 'c2', 'root', [ 'base' ], 'eos-2', 'Tenant' ),
+         cvp.Container( 'rack1', 'c3', 'c1', [], '', 'dc1' ),
+         cvp.Container( 'rack2', 'c4', 'c1', [], '', 'dc1' ) ]
+   devices = [ cvp.Device( '10.0.%d.%d' % ( rack, number ), 'sw%d%d' % ( rack,
+         number ), 'm%d%d' % ( rack, number ), 'rack%d' % rack,
+         'c%d' % ( rack + 2 ), 'eos-1', [ 'leaf' ] )
+         for rack in ( 1, 2 ) for number in ( 1, 2 ) ]
+   if extraContainer:
+      containers.append( cvp.Container( 'rack3', 'c5', 'c2', [], '', 'dc2' ) )
+      devices.append( cvp.Device( '10.0.3.1', 'sw31', 'm31', 'rack3', 'c5',
+            'eos-2', [] ) )
+   configlets = [ cvp.Configlet( 'base', 'ntp server 1.1.1.1\n', 'k0',
+         [ 'dc1', 'dc2' ], [] ), cvp.Configlet( 'leaf', 'spanning-tree\n', 'k1',
+         [], [ device.ipAddress for device in devices[ : 4 ] ] ) ]
+   imageBundles = [ cvp.ImageBundle( 'eos-1', 'b1', [ 'i1' ], True, [ 'dc1' ],
+         [] ), cvp.ImageBundle( 'eos-2', 'b2', [ 'i2' ], True, [ 'dc2' ], [] ) ]
+   return cvp.CvpSnapshot( 0.0, devices, containers, configlets, imageBundles,
+         cvp.ContainerIndex( rootContainer ) )
+
+class MerkleTreeTest( unittest.TestCase ):
+   '''Compares the trees of a snapshot before and after a change'''
+   def diff( self, change=None, **kwargs ):
+      '''Returns the trees of a snapshot before and after change, called with
+      the second snapshot, and their diff'''
+      before = merkleTree.MerkleTree( makeSnapshot() )
+      snapshot = makeSnapshot( **kwargs )
+      if change:
+         change( snapshot )
+      after = merkleTree.MerkleTree( snapshot )
+      return before, after, before.diff( after )
+
+   def assertOnly( self, treeDiff, kind, entityType, names ):
+      '''Checks that the diff only reports names of entityType as kind'''
+      for reportKind in ( 'added', 'removed', 'changed' ):
+         for reportType in merkleTree.ENTITY_TYPES:
+            expected = names if ( reportKind, reportType ) == ( kind,
+                  entityType ) else []
+            self.assertEqual( expected, getattr( treeDiff, reportKind )[
+               reportType ], '%s %s' % ( reportKind, reportType ) )
+
+   def testUnchanged( self ):
+      before, after, treeDiff = self.diff()
+      self.assertEqual( before.rootHash, after.rootHash )
+      self.assertFalse( treeDiff )
+      self.assertEqual( 1, treeDiff.visited )
+
+   def testConfigletEdit( self ):
+      def change( snapshot ):
+         snapshot.configlet( 'leaf' ).config = 'spanning-tree mode mstp\n'
+      before, after, treeDiff = self.diff( change )
+      self.assertEqual( [ 'leaf' ], treeDiff.changed[ 'configlets' ] )
+      self.assertEqual( [ '10.0.1.1', '10.0.1.2', '10.0.2.1', '10.0.2.2' ],
+            treeDiff.changed[ 'devices' ] )
+      self.assertEqual( [], treeDiff.changed[ 'containers' ] )
+      self.assertEqual( before.hash( 'dc2' ), after.hash( 'dc2' ) )
+      self.assertNotEqual( before.hash( 'rack1' ), after.hash( 'rack1' ) )
+
+   def testImageBundleEdit( self ):
+      def change( snapshot ):
+         snapshot.imageBundle( 'eos-2' ).imageKeys = [ 'i2', 'i3' ]
+      before, after, treeDiff = self.diff( change )
+      self.assertEqual( [ 'eos-2' ], treeDiff.changed[ 'imageBundles' ] )
+      self.assertEqual( [ 'dc2' ], treeDiff.changed[ 'containers' ] )
+      self.assertEqual( [], treeDiff.changed[ 'devices' ] )
+      self.assertEqual( before.hash( 'dc1' ), after.hash( 'dc1' ) )
+
+   def testDeviceMoved( self ):
+      def change( snapshot ):
+         snapshot.deviceByIp( '10.0.1.1' ).containerName = 'rack2'
+      _, _, treeDiff = self.diff( change )
+      self.assertOnly( treeDiff, 'changed', 'devices', [ '10.0.1.1' ] )
+
+   def testContainerAdded( self ):
+      _, _, treeDiff = self.diff( extraContainer=True )
+      self.assertEqual( [ 'rack3' ], treeDiff.added[ 'containers' ] )
+      self.assertEqual( [ '10.0.3.1' ], treeDiff.added[ 'devices' ] )
+      self.assertEqual( [], treeDiff.removed[ 'containers' ] )
+
+   def testUnknownContainer( self ):
+      def change( snapshot ):
+         snapshot.deviceByIp( '10.0.2.2' ).containerName = 'ghost'
+      before, after, treeDiff = self.diff( change )
+      self.assertIn( 'ghost', after.rootNames )
+      self.assertEqual( set( [ 'ghost' ] ), after.unknownNames )
+      self.assertOnly( treeDiff, 'changed', 'devices', [ '10.0.2.2' ] )
+
+      def fqdnChange( snapshot ):
+         change( snapshot )
+         snapshot.deviceByIp( '10.0.2.2' ).fqdn = 'renamed'
+      snapshot = makeSnapshot()
+      fqdnChange( snapshot )
+      treeDiff = after.diff( merkleTree.MerkleTree( snapshot ) )
+      self.assertOnly( treeDiff, 'changed', 'devices', [ '10.0.2.2' ] )
+
+   def testHashUnknownName( self ):
+      tree = merkleTree.MerkleTree( makeSnapshot() )
+      self.assertRaises( cvpServices.CvpError, tree.hash, 'nope' )
+
+if __name__ == '__main__':
+   unittest.main()
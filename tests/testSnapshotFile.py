@@ -0,0 +1,165 @@
+# Copyright (c) 2015 Arista Networks, Inc.  All rights reserved.
+# Arista Networks, Inc. Confidential and Proprietary.
+'''
+@Copyright: 2015 Arista Networks, Inc.
+Arista Networks, Inc. Confidential and Proprietary.
+
+Round trip tests of snapshotFile: a snapshot written to a file reads back
+equal, record by record, by lookup and through load().
+
+Usage:
+   python -m unittest discover -s tests -p 'test*.py'
+'''
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname(
+   os.path.abspath( __file__ ) ) ) )
+import cvp
+import cvpServices
+import snapshotFile
+
+def makeSnapshot( devices=None, configlets=None ):
+   '''Returns a snapshot of a small hierarchy: Tenant holding dc1, which
+   holds rack1'''
+   rootContainer = { 'name' : 'Tenant', 'key' : 'root',
+         'parentContainerId' : None, 'childContainerList' : [
+            { 'name' : 'dc1', 'key' : 'c1', 'parentContainerId' : 'root',
+              'childContainerList' : [
+                 { 'name' : 'rack1', 'key' : 'c2', 'parentContainerId' : 'c1',
+                   'childContainerList' : [] } ] } ] }
+   containers = [ cvp.Container( 'Tenant', 'root', None, [], '', None ),
+         cvp.Container( 'dc1', 'c1', 'root', [ 'base' ], 'eos-1', 'Tenant' ),
+         cvp.Container( u'rack1', 'c2', 'c1', '', None, 'dc1' ) ]
+   if devices is None:
+      devices = [ cvp.Device( '10.0.0.%d' % number, 'sw%d' % number,
+            '00:1c:73:00:00:%02x' % number, 'rack1', 'c2', 'eos-1',
+            [ 'base', 'sw%d' % number ] ) for number in range( 1, 6 ) ]
+   if configlets is None:
+      configlets = [ cvp.Configlet( 'base', 'ntp server 1.1.1.1\n', 'k0',
+            [ 'dc1' ], [] ) ] + [ cvp.Configlet( 'sw%d' % number,
+            u'hostname sw%d \xe9\n' % number, 'k%d' % number, [],
+            [ '10.0.0.%d' % number ] ) for number in range( 1, 6 ) ]
+   imageBundles = [ cvp.ImageBundle( 'eos-1', 'b1', [ 'i1', 'i2' ], True,
+         [ 'dc1' ], [] ) ]
+   return cvp.CvpSnapshot( 1234.5, devices, containers, configlets,
+         imageBundles, cvp.ContainerIndex( rootContainer ) )
+
+class SnapshotFileTest( unittest.TestCase ):
+   '''Writes snapshots to a temporary directory and reads them back'''
+   def setUp( self ):
+      self.directory = tempfile.mkdtemp()
+      self.filePath = os.path.join( self.directory, 'snapshot.bin' )
+
+   def tearDown( self ):
+      shutil.rmtree( self.directory )
+
+   def roundTrip( self, snapshot ):
+      '''Writes snapshot and returns the opened file'''
+      snapshotFile.writeSnapshot( snapshot, self.filePath )
+      snapshotRead = snapshotFile.SnapshotFile( self.filePath )
+      self.addCleanup( snapshotRead.close )
+      return snapshotRead
+
+   def assertSnapshotEqual( self, snapshot, snapshotRead ):
+      '''Checks every record of snapshotRead against snapshot'''
+      self.assertEqual( list( snapshot.devices ),
+            list( snapshotRead.devices() ) )
+      self.assertEqual( list( snapshot.containers ),
+            list( snapshotRead.containers() ) )
+      self.assertEqual( list( snapshot.configlets ),
+            list( snapshotRead.configlets() ) )
+      self.assertEqual( list( snapshot.imageBundles ),
+            list( snapshotRead.imageBundles() ) )
+
+   def testRoundTrip( self ):
+      snapshot = makeSnapshot()
+      snapshotRead = self.roundTrip( snapshot )
+      self.assertEqual( snapshotRead.timestamp, snapshot.timestamp )
+      self.assertEqual( ( 5, 3, 6, 1 ), ( snapshotRead.deviceCount,
+            snapshotRead.containerCount, snapshotRead.configletCount,
+            snapshotRead.imageBundleCount ) )
+      self.assertSnapshotEqual( snapshot, snapshotRead )
+      for device in snapshot.devices:
+         self.assertEqual( device, snapshotRead.deviceByIp( device.ipAddress ) )
+      for container in snapshot.containers:
+         self.assertEqual( container, snapshotRead.container( container.name ) )
+      for configlet in snapshot.configlets:
+         self.assertEqual( configlet, snapshotRead.configlet( configlet.name ) )
+      self.assertEqual( snapshot.imageBundles[ 0 ],
+            snapshotRead.imageBundle( 'eos-1' ) )
+      self.assertEqual( True, snapshotRead.imageBundle( 'eos-1' ).certified )
+
+   def testAbsentValues( self ):
+      devices = [ cvp.Device( '10.0.0.1', None, 'm1', 'rack1', 'c2', None, '' ),
+            cvp.Device( '10.0.0.2', 'sw2', 'm2', 'rack1', 'c2', '', None ),
+            cvp.Device( None, 'sw3', 'm3', 'rack1', 'c2', '', [] ) ]
+      configlets = [ cvp.Configlet( 'none', None, 'k1', None, [] ),
+            cvp.Configlet( 'empty', '', 'k2', '', [] ),
+            cvp.Configlet( None, 'x', 'k3', [], [] ) ]
+      snapshot = makeSnapshot( devices, configlets )
+      snapshotRead = self.roundTrip( snapshot )
+      self.assertSnapshotEqual( snapshot, snapshotRead )
+      self.assertEqual( '', snapshotRead.deviceByIp( '10.0.0.1' ).configlets )
+      self.assertIsNone( snapshotRead.deviceByIp( '10.0.0.2' ).configlets )
+      self.assertEqual( [], snapshotRead.deviceByIp( None ).configlets )
+      self.assertIsNone( snapshotRead.configlet( 'none' ).config )
+      self.assertIsNone( snapshotRead.configlet( 'none' ).containerList )
+      self.assertEqual( '', snapshotRead.configlet( 'empty' ).config )
+      self.assertEqual( 'k3', snapshotRead.configlet( None ).key )
+
+   def testMissingKey( self ):
+      snapshotRead = self.roundTrip( makeSnapshot() )
+      # names sorting before, between and after the stored ones
+      for lookup, name in ( ( snapshotRead.deviceByIp, '10.0.0.0' ),
+            ( snapshotRead.deviceByIp, '10.0.0.35' ),
+            ( snapshotRead.deviceByIp, '10.9.9.9' ),
+            ( snapshotRead.container, 'nope' ),
+            ( snapshotRead.configlet, 'a' ),
+            ( snapshotRead.configlet, 'zz' ),
+            ( snapshotRead.imageBundle, 'eos-2' ) ):
+         self.assertRaises( cvpServices.CvpError, lookup, name )
+
+   def testLoad( self ):
+      snapshot = makeSnapshot()
+      loaded = self.roundTrip( snapshot ).load()
+      self.assertEqual( list( snapshot.devices ), list( loaded.devices ) )
+      self.assertEqual( list( snapshot.configlets ), list( loaded.configlets ) )
+      self.assertEqual( 'Tenant', loaded.containerIndex.rootName )
+      self.assertEqual( snapshot.containerIndex.nameToKey,
+            loaded.containerIndex.nameToKey )
+      self.assertEqual( [ 'rack1' ], loaded.containerIndex.children( 'dc1' ) )
+
+   def testEmptySnapshot( self ):
+      snapshot = cvp.CvpSnapshot( 0.0, [], [], [], [], None )
+      snapshotRead = self.roundTrip( snapshot )
+      self.assertEqual( ( 0, 0, 0, 0 ), ( snapshotRead.deviceCount,
+            snapshotRead.containerCount, snapshotRead.configletCount,
+            snapshotRead.imageBundleCount ) )
+      self.assertRaises( cvpServices.CvpError, snapshotRead.deviceByIp,
+            '10.0.0.1' )
+      loaded = snapshotRead.load()
+      self.assertEqual( (), loaded.devices )
+      self.assertIsNone( loaded.containerIndex )
+
+   def testVersion1( self ):
+      # version 1 stored lists and bodies the same way when they were present
+      snapshot = makeSnapshot()
+      snapshotFile.writeSnapshot( snapshot, self.filePath )
+      with open( self.filePath, 'r+b' ) as fileObject:
+         fileObject.seek( 4 )
+         fileObject.write( struct.pack( '<H', 1 ) )
+      with snapshotFile.SnapshotFile( self.filePath ) as snapshotRead:
+         self.assertSnapshotEqual( snapshot, snapshotRead )
+
+   def testNotASnapshot( self ):
+      with open( self.filePath, 'wb' ) as fileObject:
+         fileObject.write( 'x' * 64 )
+      self.assertRaises( ValueError, snapshotFile.SnapshotFile, self.filePath )
+
+if __name__ == '__main__':
+   unittest.main()